@@ -0,0 +1,347 @@
+"""
+检测结果的增量分析：虚拟线越线计数、区域停留时间、按类别的时间窗口计数
+
+每帧只处理当前帧的检测和活跃轨迹，不回扫历史帧
+"""
+import json
+import math
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+
+def _entries(raw: Dict[str, Any], key: str, label: str) -> List[Dict[str, Any]]:
+    """lines / zones 必须是对象数组"""
+    entries = raw.get(key) or []
+    if not isinstance(entries, list):
+        raise ValueError(f"{key} 必须是数组")
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"第 {i + 1} 个{label}必须是对象")
+    return entries
+
+
+def _points(value, message: str, min_count: int, max_count: Optional[int] = None) -> List[List[float]]:
+    """[[x, y], ...] 形式的坐标列表，数量或格式不对时抛出 ValueError(message)"""
+    if not isinstance(value, list) or len(value) < min_count or (max_count and len(value) > max_count):
+        raise ValueError(message)
+    points = []
+    for point in value:
+        if (not isinstance(point, (list, tuple)) or len(point) != 2
+                or not all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v)
+                           for v in point)):
+            raise ValueError(message)
+        points.append([float(point[0]), float(point[1])])
+    return points
+
+
+def _classes(value, label: str) -> List[str]:
+    classes = value or []
+    if not isinstance(classes, list) or not all(isinstance(c, str) for c in classes):
+        raise ValueError(f"{label}的 classes 必须是字符串数组")
+    return list(classes)
+
+
+def _positive(raw: Dict[str, Any], key: str, default: float) -> float:
+    value = raw.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value <= 0:
+        raise ValueError(f"{key} 必须是大于 0 的数字")
+    return float(value)
+
+
+def parse_analytics_config(raw) -> Optional[Dict[str, Any]]:
+    """
+    解析并校验分析配置，raw 可以是 JSON 字符串或 dict，非法时（包括字段类型不对）抛出 ValueError
+
+    {
+        "lines": [{"name": "gate", "points": [[x1, y1], [x2, y2]], "classes": ["vehicle"]}],
+        "zones": [{"name": "area", "polygon": [[x, y], ...], "classes": []}],
+        "window_seconds": 60,
+        "track_timeout": 2.0,
+        "anchor": "bottom"
+    }
+    """
+    if raw is None or raw == "":
+        return None
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"分析配置不是合法的 JSON: {e}")
+    if not isinstance(raw, dict):
+        raise ValueError("分析配置必须是对象")
+
+    lines = []
+    for i, line in enumerate(_entries(raw, "lines", "虚拟线")):
+        label = f"第 {i + 1} 条虚拟线"
+        lines.append({
+            "name": str(line.get("name") or f"line_{i + 1}"),
+            "points": _points(line.get("points"), f"{label}需要两个端点 [[x, y], [x, y]]", 2, 2),
+            "classes": _classes(line.get("classes"), label)
+        })
+
+    zones = []
+    for i, zone in enumerate(_entries(raw, "zones", "区域")):
+        label = f"第 {i + 1} 个区域"
+        zones.append({
+            "name": str(zone.get("name") or f"zone_{i + 1}"),
+            "polygon": _points(zone.get("polygon"), f"{label}至少需要三个顶点 [[x, y], ...]", 3),
+            "classes": _classes(zone.get("classes"), label)
+        })
+
+    window_seconds = _positive(raw, "window_seconds", 60)
+    track_timeout = _positive(raw, "track_timeout", 2.0)
+
+    anchor = raw.get("anchor", "bottom")
+    if anchor not in ("bottom", "center"):
+        raise ValueError("anchor 只能是 bottom 或 center")
+
+    return {
+        "lines": lines,
+        "zones": zones,
+        "window_seconds": window_seconds,
+        "track_timeout": track_timeout,
+        "anchor": anchor
+    }
+
+
+# ================== 几何工具 ==================
+
+def _side(a, b, p) -> float:
+    """点 p 在有向线段 a->b 的哪一侧（叉积符号）"""
+    return (b[0] - a[0]) * (p[1] - a[1]) - (b[1] - a[1]) * (p[0] - a[0])
+
+
+def _segments_intersect(p0, p1, a, b) -> bool:
+    d1 = _side(a, b, p0)
+    d2 = _side(a, b, p1)
+    d3 = _side(p0, p1, a)
+    d4 = _side(p0, p1, b)
+    return d1 * d2 < 0 and d3 * d4 <= 0
+
+
+def _point_in_polygon(point, polygon) -> bool:
+    """射线法判断点是否在多边形内"""
+    x, y = point
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i]
+        xj, yj = polygon[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _anchor_point(bbox, anchor: str):
+    x1, y1, x2, y2 = bbox
+    if anchor == "center":
+        return ((x1 + x2) / 2, (y1 + y2) / 2)
+    return ((x1 + x2) / 2, y2)
+
+
+# ================== 分析引擎 ==================
+
+class AnalyticsEngine:
+    """
+    按帧增量更新的分析引擎
+    update() 的代价只与当前帧检测数和活跃轨迹数有关；
+    累计状态只有计数，目标 id 只保存在活跃轨迹和当前时间窗口里，
+    max_events / max_windows 限制保留的事件和已结束窗口数，实时流长期运行时内存不随时长增长
+    """
+
+    def __init__(self, config: Dict[str, Any], max_events: Optional[int] = None,
+                 max_windows: Optional[int] = None):
+        self.config = config
+        self.lines = config["lines"]
+        self.zones = config["zones"]
+        self.window_seconds = config["window_seconds"]
+        self.track_timeout = config["track_timeout"]
+        self.anchor = config["anchor"]
+
+        # 活跃轨迹: id -> {class, classes, last_seen, zones: {zone_idx: enter_time}, line_sides: {line_idx: (side, point)}}
+        # classes 为该轨迹已计入 class_totals 的类别
+        self.tracks: Dict[int, Dict[str, Any]] = {}
+
+        self.events = deque(maxlen=max_events)
+        self.line_counts = [
+            {"name": line["name"], "in": 0, "out": 0, "by_class": {}} for line in self.lines
+        ]
+        self.zone_stats = [
+            {"name": zone["name"], "visits": 0, "occupancy": 0, "total_dwell": 0.0,
+             "avg_dwell": 0.0, "max_dwell": 0.0, "by_class": {}}
+            for zone in self.zones
+        ]
+
+        # 各类别出现过的目标数：轨迹第一次以该类别出现时加一
+        self.class_totals: Dict[str, int] = {}
+        self.windows = deque(maxlen=max_windows)
+        self._window_index: Optional[int] = None
+        self._window_ids: Dict[str, set] = {}
+        self.last_timestamp = 0.0
+
+    # ---------- 对外接口 ----------
+
+    def update(self, timestamp: float, detections: List[Dict[str, Any]]):
+        """处理一帧检测结果，detections 需要包含 id / class / bbox"""
+        self.last_timestamp = timestamp
+        self._roll_window(timestamp)
+
+        for det in detections:
+            track_id = det.get("id")
+            if track_id is None:
+                continue
+            class_name = det["class"]
+            point = _anchor_point(det["bbox"], self.anchor)
+
+            self._window_ids.setdefault(class_name, set()).add(track_id)
+
+            track = self.tracks.get(track_id)
+            if track is None:
+                track = {"class": class_name, "classes": set(), "last_seen": timestamp, "zones": {},
+                         "line_sides": {}}
+                self.tracks[track_id] = track
+            track["last_seen"] = timestamp
+            if class_name not in track["classes"]:
+                track["classes"].add(class_name)
+                self.class_totals[class_name] = self.class_totals.get(class_name, 0) + 1
+
+            self._check_lines(track_id, track, point, timestamp)
+            self._check_zones(track_id, track, point, timestamp)
+
+        self._expire_tracks(timestamp)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前统计结果（不结束未完成的停留和时间窗口）"""
+        current_window = None
+        if self._window_index is not None:
+            current_window = {
+                "start": self._window_index * self.window_seconds,
+                "end": (self._window_index + 1) * self.window_seconds,
+                "counts": {cls: len(ids) for cls, ids in self._window_ids.items()}
+            }
+        return {
+            "config": self.config,
+            "lines": self.line_counts,
+            "zones": self.zone_stats,
+            "class_totals": dict(self.class_totals),
+            "windows": list(self.windows),
+            "current_window": current_window,
+            "active_tracks": len(self.tracks),
+            "events": list(self.events)
+        }
+
+    def finalize(self, timestamp: Optional[float] = None) -> Dict[str, Any]:
+        """结束所有未完成的停留和时间窗口，返回最终结果"""
+        if timestamp is None:
+            timestamp = self.last_timestamp
+        for track_id, track in list(self.tracks.items()):
+            self._leave_all_zones(track_id, track, timestamp)
+        self.tracks.clear()
+        self._close_window()
+        summary = self.snapshot()
+        summary["current_window"] = None
+        return summary
+
+    # ---------- 内部实现 ----------
+
+    def _applies(self, rule, class_name: str) -> bool:
+        return not rule["classes"] or class_name in rule["classes"]
+
+    def _check_lines(self, track_id, track, point, timestamp):
+        # 记录每条线上最后一个不在线上的位置，压线的帧不会导致漏计或重复计数
+        for idx, line in enumerate(self.lines):
+            if not self._applies(line, track["class"]):
+                continue
+            a, b = line["points"]
+            side = _side(a, b, point)
+            if side == 0:
+                continue
+            prev = track["line_sides"].get(idx)
+            track["line_sides"][idx] = (side, point)
+            if prev is None or (prev[0] > 0) == (side > 0):
+                continue
+            if not _segments_intersect(prev[1], point, a, b):
+                continue
+            direction = "in" if side > 0 else "out"
+            counts = self.line_counts[idx]
+            counts[direction] += 1
+            per_class = counts["by_class"].setdefault(track["class"], {"in": 0, "out": 0})
+            per_class[direction] += 1
+            self.events.append({
+                "type": "line_cross",
+                "line": line["name"],
+                "direction": direction,
+                "id": track_id,
+                "class": track["class"],
+                "timestamp": round(timestamp, 3)
+            })
+
+    def _check_zones(self, track_id, track, point, timestamp):
+        for idx, zone in enumerate(self.zones):
+            if not self._applies(zone, track["class"]):
+                continue
+            inside = _point_in_polygon(point, zone["polygon"])
+            was_inside = idx in track["zones"]
+            if inside and not was_inside:
+                track["zones"][idx] = timestamp
+                stats = self.zone_stats[idx]
+                stats["visits"] += 1
+                stats["occupancy"] += 1
+                stats["by_class"][track["class"]] = stats["by_class"].get(track["class"], 0) + 1
+                self.events.append({
+                    "type": "zone_enter",
+                    "zone": zone["name"],
+                    "id": track_id,
+                    "class": track["class"],
+                    "timestamp": round(timestamp, 3)
+                })
+            elif not inside and was_inside:
+                self._leave_zone(track_id, track, idx, timestamp)
+
+    def _leave_zone(self, track_id, track, idx, timestamp):
+        enter_time = track["zones"].pop(idx)
+        dwell = max(0.0, timestamp - enter_time)
+        stats = self.zone_stats[idx]
+        stats["occupancy"] -= 1
+        stats["total_dwell"] += dwell
+        stats["max_dwell"] = max(stats["max_dwell"], dwell)
+        stats["avg_dwell"] = stats["total_dwell"] / stats["visits"] if stats["visits"] else 0.0
+        self.events.append({
+            "type": "zone_exit",
+            "zone": self.zones[idx]["name"],
+            "id": track_id,
+            "class": track["class"],
+            "timestamp": round(timestamp, 3),
+            "dwell": round(dwell, 3)
+        })
+
+    def _leave_all_zones(self, track_id, track, timestamp):
+        for idx in list(track["zones"].keys()):
+            self._leave_zone(track_id, track, idx, timestamp)
+
+    def _expire_tracks(self, timestamp):
+        # 只遍历活跃轨迹；超时视为离开，停留时间截止到最后一次出现
+        for track_id, track in list(self.tracks.items()):
+            if timestamp - track["last_seen"] > self.track_timeout:
+                self._leave_all_zones(track_id, track, track["last_seen"])
+                del self.tracks[track_id]
+
+    def _roll_window(self, timestamp):
+        index = int(timestamp // self.window_seconds)
+        if self._window_index is None:
+            self._window_index = index
+        elif index != self._window_index:
+            self._close_window()
+            self._window_index = index
+
+    def _close_window(self):
+        if self._window_index is None:
+            return
+        self.windows.append({
+            "start": self._window_index * self.window_seconds,
+            "end": (self._window_index + 1) * self.window_seconds,
+            "counts": {cls: len(ids) for cls, ids in self._window_ids.items()}
+        })
+        self._window_ids = {}
+        self._window_index = None
@@ -0,0 +1,12 @@
+"""
+热点路径的可复现基准测试
+
+    cd back
+    python -m bench --output bench.json                      # 完整运行
+    python -m bench --quick --baseline bench.json            # 与基线比较，退步超过 15% 时退出码为 1
+
+不需要 best.pt 和 GPU：用 detector.TinyDetector 代替模型，输入由 synthetic 按固定种子生成，
+上传/结果目录和数据库放在临时目录（见 workspace）。测的是模型之外的开销：上传写盘、解码、后处理、
+绘制、编码、写帧/转码、实时推流编码、多路摄像头合批推理、记录列表查询、服务冷启动（python -m bench.startup 可单独查看导入耗时），
+以及上传数 GB 文件时的内存峰值（见 uploads）。
+"""
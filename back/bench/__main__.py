@@ -0,0 +1,127 @@
+"""
+python -m bench [--quick] [--only detect_image,video] [--output bench.json] [--baseline old.json --threshold 0.15]
+
+在 back 目录下运行。结果写成 JSON；给了 --baseline 时逐项比较，任一指标退步超过阈值则以状态码 1 退出
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+
+import cv2
+import numpy as np
+
+from bench import cases, compare, workspace
+
+CASES = ("detect_image", "postprocess", "draw", "video", "mjpeg", "cameras", "list_records", "startup",
+         "upload_memory")
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="检测服务热点路径的基准测试")
+    parser.add_argument("--quick", action="store_true", help="更少的分辨率、帧数和记录数，用于快速检查")
+    parser.add_argument("--only", default="", help=f"只运行这些用例（逗号分隔）：{','.join(CASES)}")
+    parser.add_argument("--repeat", type=int, help="每个指标的采样次数")
+    parser.add_argument("--records", type=int, help="list_records 用例的记录数")
+    parser.add_argument("--upload-mb", type=int, help="upload_memory 用例上传的文件大小（MB）")
+    parser.add_argument("--no-transcode", action="store_true", help="视频用例不调用 ffmpeg")
+    parser.add_argument("--output", default="bench_results.json", help="结果文件")
+    parser.add_argument("--baseline", help="基线结果文件，给出时与之比较")
+    parser.add_argument("--threshold", type=float, default=0.15, help="允许的退步比例，默认 0.15（15%%）")
+    parser.add_argument("--workdir", help="工作目录（默认临时目录，结束后删除）")
+    return parser.parse_args(argv)
+
+
+def _options(args) -> cases.Options:
+    opts = cases.QUICK if args.quick else cases.Options()
+    if args.repeat:
+        opts = opts._replace(repeat=args.repeat)
+    if args.records:
+        opts = opts._replace(records=args.records)
+    if args.upload_mb:
+        opts = opts._replace(upload_mb=args.upload_mb)
+    if args.no_transcode or shutil.which("ffmpeg") is None:
+        opts = opts._replace(transcode=False)
+    return opts
+
+
+def _environment(opts: cases.Options, quick: bool):
+    return {
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "transcode": opts.transcode,
+        "quick": quick,
+        "calibration_ms": cases.calibrate()
+    }
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    selected = [name.strip() for name in args.only.split(",") if name.strip()] or list(CASES)
+    unknown = set(selected) - set(CASES)
+    if unknown:
+        print(f"未知用例: {', '.join(sorted(unknown))}，可选: {', '.join(CASES)}", file=sys.stderr)
+        return 2
+    opts = _options(args)
+
+    root = workspace.prepare(args.workdir)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": _environment(opts, args.quick),
+        "options": opts._asdict(),
+        "results": {}
+    }
+    runners = {
+        "detect_image": lambda: cases.bench_detect_image(opts),
+        "postprocess": lambda: cases.bench_postprocess(opts),
+        "draw": lambda: cases.bench_draw(opts),
+        "video": lambda: cases.bench_video(opts, root),
+        "mjpeg": lambda: cases.bench_mjpeg(opts),
+        "cameras": lambda: cases.bench_cameras(opts, root),
+        "list_records": lambda: cases.bench_list_records(opts),
+        "startup": lambda: cases.bench_startup(opts),
+        "upload_memory": lambda: cases.bench_upload_memory(opts),
+    }
+    try:
+        for name in CASES:
+            if name not in selected:
+                continue
+            start = time.perf_counter()
+            results = runners[name]()
+            report["results"].update(results)
+            print(f"⏱️ {name}: {time.perf_counter() - start:.1f}s")
+            for metric, value in results.items():
+                print(f"   {metric:<48} {value['value']:>12.4g} {value['unit']:<3} (median {value['median']:.4g})")
+    finally:
+        if not args.workdir:
+            workspace.cleanup(root)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 结果已写入 {args.output}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    for line in compare.environment_differences(baseline, report):
+        print(f"⚠️ 运行环境与基线不同，结果仅供参考 - {line}")
+    rows, regressions = compare.compare(baseline, report, args.threshold)
+    if rows:
+        print(compare.format_table(rows))
+    if regressions:
+        print(f"❌ {len(regressions)} 项指标退步超过 {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"✅ 没有超过 {args.threshold:.0%} 的退步")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,421 @@
+"""
+各热点路径的基准用例
+
+每个用例返回 {指标名: 指标}，指标见 _metric()；计时取多次运行的中位数，第一次（冷启动、建目录等）不计。
+用例直接调用路由函数和处理函数（不经过 HTTP），只在 workspace.prepare() 之后导入应用模块。
+"""
+import io
+import os
+import time
+import random
+import asyncio
+import statistics
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, NamedTuple
+import cv2
+import numpy as np
+from bench import synthetic
+from bench.detector import Boxes, Result, TinyDetector
+
+
+class Options(NamedTuple):
+    repeat: int = 7  # 每个指标的采样次数
+    resolutions: tuple = ((640, 480), (1280, 720), (1920, 1080), (3840, 2160))
+    video_resolutions: tuple = ((640, 360), (1280, 720))
+    video_frames: int = 150
+    boxes: int = 50  # 后处理/绘制用例的框数
+    mjpeg_seconds: float = 2.0
+    camera_counts: tuple = (1, 4, 16)  # 多路摄像头用例的摄像头数
+    camera_seconds: float = 5.0  # 每种摄像头数的测量时长
+    records: int = 100000  # list_records 用例预先写入的记录数
+    transcode: bool = True  # 视频用例是否调用 ffmpeg（没有 ffmpeg 时自动跳过）
+    upload_mb: int = 2048  # 大文件上传用例的文件大小
+
+
+WARMUP_SECONDS = 0.3
+
+QUICK = Options(repeat=5, resolutions=((640, 480), (1920, 1080)), video_resolutions=((640, 360),),
+                video_frames=50, mjpeg_seconds=1.0, camera_seconds=2.0, records=20000, upload_mb=256)
+
+
+def _metric(samples: List[float], unit: str, better: str = "lower", tolerance: float = 0.0) -> Dict[str, Any]:
+    """
+    better 为 lower（耗时）或 higher（吞吐），比较基线时据此判断是否退步
+    value 取最好的一次：干扰（其它进程、调度、GC）只会让结果变差，最好值在多次运行之间最稳定；
+    median / worst 用来观察波动
+    tolerance 为比较时忽略的绝对变化量，用于本身很小、按比例比较会误报的指标（如几 MB 的内存增长）
+    """
+    ordered = sorted(samples, reverse=better == "higher")
+    metric = {
+        "value": round(ordered[0], 4),
+        "median": round(statistics.median(ordered), 4),
+        "worst": round(ordered[-1], 4),
+        "unit": unit,
+        "better": better,
+        "samples": len(ordered)
+    }
+    if tolerance:
+        metric["tolerance"] = tolerance
+    return metric
+
+
+def _timed(fn: Callable[[], Any], repeat: int, warmup: float = WARMUP_SECONDS) -> List[float]:
+    """先空跑至少 warmup 秒（CPU 升频、缓存、惰性初始化），再采样 repeat 次"""
+    deadline = time.perf_counter() + warmup
+    fn()
+    while time.perf_counter() < deadline:
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _label(size) -> str:
+    return f"{size[0]}x{size[1]}"
+
+
+def _boxes(count: int, width: int = 1920, height: int = 1080, seed: int = 0) -> Boxes:
+    rng = np.random.default_rng(seed)
+    x1 = rng.uniform(0, width * 0.9, count)
+    y1 = rng.uniform(40, height * 0.9, count)
+    w = rng.uniform(30, width * 0.1, count)
+    h = rng.uniform(30, height * 0.1, count)
+    return Boxes(np.stack([x1, y1, x1 + w, y1 + h], axis=1), rng.uniform(0.3, 0.95, count),
+                 rng.integers(0, len(TinyDetector.names), count))
+
+
+def calibrate(repeat: int = 5) -> float:
+    """
+    固定工作量（缩放 + JPEG 编码 + 纯 Python 循环）的耗时（毫秒），与被测代码无关；
+    与基线的这一项差得多时说明机器本身快慢不同（其它负载、降频、虚拟机争抢），结果不可直接比较
+    """
+    img = synthetic.make_image(1920, 1080)
+
+    def work():
+        small = cv2.resize(img, (960, 540), interpolation=cv2.INTER_AREA)
+        cv2.imencode(".jpg", small)
+        sum(i * i for i in range(100000))
+
+    return round(min(_timed(work, repeat)) * 1000, 3)
+
+
+# ================== 图片检测 ==================
+
+def bench_detect_image(opts: Options) -> Dict[str, Dict[str, Any]]:
+    """
+    detect_image 端到端（上传写盘、解码、推理、后处理、绘制、编码、缩略图、等待入库）：
+    每次用不同的图片，避免命中结果复用；另测同一张图再次上传（复用结果）的耗时
+    """
+    from starlette.datastructures import UploadFile
+    from routers import detect
+
+    async def post(data: bytes, name: str):
+        await detect.detect_image(UploadFile(io.BytesIO(data), filename=name), conf=0.25, timings=False)
+
+    results = {}
+    loop = asyncio.new_event_loop()
+    try:
+        for size in opts.resolutions:
+            label = _label(size)
+            images = [synthetic.encode_image(synthetic.make_image(*size, seed=seed))
+                      for seed in range(opts.repeat + 1)]
+            samples = []
+            for i, data in enumerate(images):
+                start = time.perf_counter()
+                loop.run_until_complete(post(data, f"bench_{label}_{i}.jpg"))
+                if i:
+                    samples.append(time.perf_counter() - start)
+            results[f"detect_image.{label}.ms"] = _metric([s * 1000 for s in samples], "ms")
+
+            reused = _timed(lambda: loop.run_until_complete(post(images[0], f"bench_{label}_again.jpg")), opts.repeat)
+            results[f"detect_image.{label}.reused_ms"] = _metric([s * 1000 for s in reused], "ms")
+    finally:
+        loop.close()
+    return results
+
+
+def bench_postprocess(opts: Options) -> Dict[str, Dict[str, Any]]:
+    """模型输出转检测结果列表，按框数折算"""
+    from routers import detect
+
+    result = Result(None, _boxes(opts.boxes))
+    rounds = 200
+    samples = _timed(lambda: [detect.collect_detections(result) for _ in range(rounds)], opts.repeat)
+    return {"postprocess.us_per_box": _metric([s / rounds / opts.boxes * 1e6 for s in samples], "us")}
+
+
+def bench_draw(opts: Options) -> Dict[str, Dict[str, Any]]:
+    """图片和视频的 draw_detection_box，1920x1080 上按框数折算"""
+    from routers import detect, video
+
+    detections = detect.collect_detections(Result(None, _boxes(opts.boxes)))
+    # 反复画在同一张图上：每次采样不再复制整帧，框叠在已有的框上耗时不变
+    img = synthetic.make_image(1920, 1080)
+    rounds = 20
+    results = {}
+    for name, draw in (("image", detect.draw_detection_box), ("video", video.draw_detection_box)):
+        def run():
+            for _ in range(rounds):
+                for detection in detections:
+                    draw(img, detection)
+        samples = _timed(run, opts.repeat)
+        results[f"draw_detection_box.{name}.us_per_box"] = _metric(
+            [s / rounds / len(detections) * 1e6 for s in samples], "us")
+    return results
+
+
+# ================== 视频 ==================
+
+def _skip_transcode(input_path: str, output_path: str, pipeline: str = "video"):
+    """没有 ffmpeg（或 --no-transcode）时替代转码：直接改名"""
+    os.replace(input_path, output_path)
+
+
+def bench_video(opts: Options, workdir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    process_video_with_controls（跟踪、后处理、绘制、写帧、转码、截图和缩略图）和
+    regenerate_video_with_controls 的帧率；另给出处理时各阶段的每帧耗时
+    """
+    import tracing
+    import blob_store
+    from config import RESULT_DIR
+    from routers import video
+
+    if not opts.transcode:
+        video.convert_to_h264_compatible = _skip_transcode
+
+    results = {}
+    for size in opts.video_resolutions:
+        label = _label(size)
+        source = synthetic.make_video(os.path.join(workdir, f"bench_{label}.mp4"), *size, opts.video_frames)
+        fps_samples, regen_samples = [], []
+        stage_samples: Dict[str, List[float]] = {}
+        for i in range(opts.repeat + 1):
+            video_id = f"bench_{label}_{i}"
+            output = os.path.join(RESULT_DIR, f"{video_id}.mp4")
+            with tracing.background_trace() as trace:
+                start = time.perf_counter()
+                info = video.process_video_with_controls(video_id, source, output, conf=0.25)
+                elapsed = time.perf_counter() - start
+            blob_store.release(info.get("thumbnail_path"))
+            start = time.perf_counter()
+            video.regenerate_video_with_controls(video_id, [1], source, os.path.join(RESULT_DIR, f"{video_id}_regen.mp4"))
+            regen_elapsed = time.perf_counter() - start
+            video.video_detection_data.pop(video_id, None)
+            if not i:
+                continue
+            fps_samples.append(opts.video_frames / elapsed)
+            regen_samples.append(opts.video_frames / regen_elapsed)
+            for stage, seconds in trace.spans.items():
+                stage_samples.setdefault(stage, []).append(seconds / opts.video_frames * 1000)
+        results[f"process_video.{label}.fps"] = _metric(fps_samples, "fps", better="higher")
+        results[f"regenerate_video.{label}.fps"] = _metric(regen_samples, "fps", better="higher")
+        for stage, samples in stage_samples.items():
+            results[f"process_video.{label}.{stage}_ms_per_frame"] = _metric(samples, "ms")
+    return results
+
+
+# ================== 实时画面 ==================
+
+class _LoopCamera:
+    """FrameBroadcaster 用到的摄像头接口：总有新帧（同一帧反复发布），检测结果固定"""
+
+    def __init__(self, frame, detections):
+        self.cam_id = "bench"
+        self.frames = self
+        self.snapshot = SimpleNamespace(detections=detections)
+        self._frame = frame
+        self._seq = 0
+
+    def wait_newer(self, last_seq: int, timeout: float = None):
+        self._seq += 1
+        return self._frame, self._seq, time.time()
+
+
+def bench_mjpeg(opts: Options) -> Dict[str, Dict[str, Any]]:
+    """MJPEG 推流的渲染线程（绘制检测框 + JPEG 编码）每秒能产出的帧数，有一个观看者时"""
+    from live_stream import FrameBroadcaster
+
+    async def consume(broadcaster, seconds: float) -> float:
+        stream = broadcaster.stream()
+        first = None
+        try:
+            async for _ in stream:
+                now = time.perf_counter()
+                if first is None:
+                    first = (now, broadcaster.frames_encoded)
+                elif now - first[0] >= seconds:
+                    return (broadcaster.frames_encoded - first[1]) / (now - first[0])
+        finally:
+            await stream.aclose()
+
+    results = {}
+    for size in opts.video_resolutions:
+        frame = synthetic.make_image(*size)
+        xyxy, scores, classes = TinyDetector()._detect(frame, 0.25)
+        detections = [{"bbox": list(map(int, box)), "class": TinyDetector.names[c], "conf": s}
+                      for box, s, c in zip(xyxy, scores, classes)]
+        samples = []
+        for _ in range(opts.repeat):
+            broadcaster = FrameBroadcaster(_LoopCamera(frame, detections))
+            try:
+                samples.append(asyncio.run(consume(broadcaster, opts.mjpeg_seconds / opts.repeat)))
+            finally:
+                broadcaster.stop()
+        results[f"mjpeg.{_label(size)}.fps"] = _metric(samples, "fps", better="higher")
+    return results
+
+
+# ================== 多路摄像头 ==================
+
+def bench_cameras(opts: Options, workdir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    CameraManager 同时接入 1/4/16 路循环播放的本地视频（25fps）时，共享推理线程每秒推理的帧数、
+    平均批大小和每路的检测频率；按秒取样
+    自适应控制器固定为步长 1、默认输入尺寸：测的是合批推理跟上所有到达帧的能力，而不是控制器选的档位
+    """
+    from camera_manager import CameraManager
+    from config import LIVE_IMGSZ
+
+    source = synthetic.make_video(os.path.join(workdir, "bench_camera.mp4"), 640, 360, 250)
+    results = {}
+    for count in opts.camera_counts:
+        manager = CameraManager(TinyDetector(), idle_timeout=60)
+        manager.controller.configure(enabled=False, imgsz=LIVE_IMGSZ, stride=1)
+        try:
+            for i in range(count):
+                manager.register(f"bench{i}", source, kind="file")
+                manager.acquire(f"bench{i}", "manual")
+            # 等各路读取线程和控制器进入稳定状态
+            time.sleep(WARMUP_SECONDS + 1.0)
+            fps_samples, batch_samples, per_camera = [], [], []
+            for _ in range(max(1, round(opts.camera_seconds))):
+                frames, batches = manager.frames_inferred, manager.batches
+                start = time.perf_counter()
+                time.sleep(1.0)
+                elapsed = time.perf_counter() - start
+                frames, batches = manager.frames_inferred - frames, manager.batches - batches
+                fps_samples.append(frames / elapsed)
+                batch_samples.append(frames / batches if batches else 0.0)
+                per_camera.append(frames / elapsed / count)
+        finally:
+            manager.shutdown()
+        results[f"cameras.{count}.inferred_fps"] = _metric(fps_samples, "fps", better="higher")
+        results[f"cameras.{count}.per_camera_hz"] = _metric(per_camera, "Hz", better="higher")
+        results[f"cameras.{count}.mean_batch"] = _metric(batch_samples, "frames", better="higher")
+    return results
+
+
+# ================== 冷启动 ==================
+
+def bench_startup(opts: Options) -> Dict[str, Dict[str, Any]]:
+    """新进程导入 main 的耗时、经过启动阶段发出第一个响应的耗时，以及导入的模块数（见 bench.startup）"""
+    from bench import startup
+
+    runs = [startup.measure()[0] for _ in range(opts.repeat)]
+    heavy = sorted({name for run in runs for name in run["heavy_modules"]})
+    if heavy:
+        print(f"⚠️ 导入 main 时加载了 {', '.join(heavy)}，推理框架应在第一次使用模型时才导入")
+    return {
+        "startup.import_main_ms": _metric([run["import_main_s"] * 1000 for run in runs], "ms"),
+        "startup.first_response_ms": _metric([run["first_response_s"] * 1000 for run in runs], "ms"),
+        "startup.modules": _metric([run["modules"] for run in runs], "modules")
+    }
+
+
+# ================== 记录列表 ==================
+
+def _seed_records(count: int, batch: int = 5000):
+    """写入 count 条记录，检测时间分布在最近 90 天内；已有足够记录时跳过"""
+    from sqlalchemy import insert, select, func
+    from db import engine
+    from models import DetectRecord
+
+    with engine.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(DetectRecord)).scalar()
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    types = ("image", "image", "camera", "video")
+    objects = [{"id": i + 1, "class": TinyDetector.names[i], "confidence": 0.8, "bbox": [10, 10, 60, 90]}
+               for i in range(3)]
+    for offset in range(existing, count, batch):
+        rows = []
+        for i in range(offset, min(count, offset + batch)):
+            rows.append({
+                "type": types[i % len(types)],
+                "filename": f"bench_{i}.jpg",
+                "source_path": f"/bench/uploads/{i}.jpg",
+                "result_path": f"/bench/results/{i}.jpg",
+                "result_url": f"/files/result/{i}.jpg",
+                "objects": objects,
+                "detect_time": now - timedelta(seconds=rng.uniform(0, 90 * 86400)),
+                "detection_count": len(objects),
+                "class_counts": {o["class"]: 1 for o in objects},
+                "result_available": True,
+                "file_size": 200000,
+                "thumbnail_path": ""
+            })
+        with engine.begin() as conn:
+            conn.execute(insert(DetectRecord), rows)
+
+
+def bench_list_records(opts: Options) -> Dict[str, Dict[str, Any]]:
+    """list_records 在 opts.records 条记录下的耗时：首页、深分页（偏移/游标）、按类型和时间筛选、未缓存的总数"""
+    from routers import records
+    from db_writer import record_writer
+
+    _seed_records(opts.records)
+
+    def page(**params):
+        defaults = {"page": 1, "limit": 20, "type": None, "start": None, "end": None, "cursor": None}
+        return lambda: records.list_records(**{**defaults, **params})
+
+    deep_page = max(1, opts.records // 20 // 2)
+    cursor = records.list_records(page=deep_page, limit=20, type=None, start=None, end=None, cursor=None)["next_cursor"]
+    week_ago = datetime.utcnow() - timedelta(days=7)
+
+    def uncached():
+        record_writer.mark_changed()
+        page()()
+
+    cases = {
+        "first_page": page(),
+        "deep_offset": page(page=deep_page),
+        "deep_cursor": page(cursor=cursor),
+        "type_last_7d": page(type="camera", start=week_ago),
+        "count_uncached": uncached
+    }
+    return {f"list_records.{name}.ms": _metric([s * 1000 for s in _timed(fn, opts.repeat)], "ms")
+            for name, fn in cases.items()}
+
+
+# ================== 大文件上传 ==================
+
+# 上传时的内存增长只有几 MB，与基线比较时小于这个值的变化不算退步；整个文件读进内存会多出 upload_mb
+RSS_TOLERANCE_MB = 32
+
+def bench_upload_memory(opts: Options) -> Dict[str, Dict[str, Any]]:
+    """
+    /detect/video 和分块续传各上传一个 opts.upload_mb MB 的文件：进程 RSS 峰值的增长和吞吐（见 bench.uploads）
+    文件很大，每种方式只跑一次；RSS 增长应与文件大小无关
+    """
+    from bench import uploads
+
+    if uploads.current_rss() is None:
+        print("⚠️ 没有 /proc，跳过大文件上传用例")
+        return {}
+    size = opts.upload_mb * uploads.MB
+    results = {}
+    for flow in uploads.FLOWS:
+        run = uploads.measure(flow, size)
+        if run["stored_size"] != size:
+            raise RuntimeError(f"{flow} 落盘大小 {run['stored_size']} 与上传大小 {size} 不一致")
+        results[f"upload_memory.{flow}.peak_rss_growth_mb"] = _metric([run["peak_rss_growth"] / uploads.MB], "MB",
+                                                                      tolerance=RSS_TOLERANCE_MB)
+        results[f"upload_memory.{flow}.throughput_mb_s"] = _metric([opts.upload_mb / run["seconds"]], "MB/s",
+                                                                  better="higher")
+    return results
@@ -0,0 +1,54 @@
+"""
+与基线结果比较：指标按 better 方向计算变化，退步超过阈值的记为回归
+"""
+from typing import Any, Dict, List, Tuple
+
+CALIBRATION_TOLERANCE = 0.1
+
+
+def change(baseline: float, current: float, better: str) -> float:
+    """相对变化，正数表示变差"""
+    if not baseline:
+        return 0.0
+    delta = (current - baseline) / baseline
+    return delta if better == "lower" else -delta
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """返回 (逐项比较结果, 回归的指标名)；只比较两边都有的指标"""
+    rows, regressions = [], []
+    base_results = baseline.get("results", {})
+    for name, metric in current.get("results", {}).items():
+        base = base_results.get(name)
+        if base is None:
+            continue
+        worse = change(base["value"], metric["value"], metric.get("better", "lower"))
+        regressed = worse > threshold and abs(metric["value"] - base["value"]) > metric.get("tolerance", 0)
+        rows.append({"name": name, "baseline": base["value"], "current": metric["value"],
+                     "unit": metric["unit"], "change": worse, "regressed": regressed})
+        if regressed:
+            regressions.append(name)
+    return rows, regressions
+
+
+def environment_differences(baseline: Dict[str, Any], current: Dict[str, Any],
+                            calibration_tolerance: float = CALIBRATION_TOLERANCE) -> List[str]:
+    """运行环境不一致时的提示：不同机器、不同 OpenCV、是否转码或机器本身快慢不同，结果不可直接比较"""
+    base_env, env = baseline.get("environment", {}), current.get("environment", {})
+    lines = [f"{key}: {base_env.get(key)} -> {env.get(key)}"
+             for key in ("machine", "cpu_count", "python", "opencv", "numpy", "transcode", "quick")
+             if base_env.get(key) != env.get(key)]
+    base_ms, ms = base_env.get("calibration_ms"), env.get("calibration_ms")
+    if base_ms and ms and abs(ms - base_ms) / base_ms > calibration_tolerance:
+        lines.append(f"calibration_ms: {base_ms} -> {ms}（机器本身快慢相差 {(ms - base_ms) / base_ms:+.0%}）")
+    return lines
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    width = max([len(row["name"]) for row in rows] + [6])
+    lines = [f"{'metric':<{width}}  {'baseline':>12}  {'current':>12}  {'worse by':>9}"]
+    for row in rows:
+        flag = "  ❌" if row["regressed"] else ""
+        lines.append(f"{row['name']:<{width}}  {row['baseline']:>12.4g}  {row['current']:>12.4g}  "
+                     f"{row['change'] * 100:>8.1f}%{flag}")
+    return "\n".join(lines)
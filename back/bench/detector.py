@@ -0,0 +1,139 @@
+"""
+不依赖 best.pt 的替身检测器，只在 CPU 上运行
+
+接口与 routers 用到的 ultralytics.YOLO 部分一致：names、predict() 返回带 boxes 的结果、
+track(stream=True) 逐帧产出带 orig_img 和跟踪编号的结果。检测方法是把画面缩到 WORK_SIDE 后
+按饱和度找连通区域，耗时随分辨率变化但远小于真实模型，测出来的是推理之外的开销；
+对 synthetic 生成的画面结果是确定的。
+"""
+import sys
+import types
+import cv2
+import numpy as np
+
+WORK_SIDE = 320
+MIN_AREA = 12  # 缩小后的最小面积（像素）
+
+
+class _Array:
+    """torch.Tensor 中用到的部分：.cpu().numpy()、.tolist()、len()"""
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        self._data = data
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._data
+
+    def tolist(self):
+        return self._data.tolist()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class Boxes:
+    def __init__(self, xyxy, conf, cls, ids=None):
+        self.xyxy = _Array(np.asarray(xyxy, dtype=np.float32).reshape(-1, 4))
+        self.conf = _Array(np.asarray(conf, dtype=np.float32))
+        self.cls = _Array(np.asarray(cls, dtype=np.float32))
+        self.id = _Array(np.asarray(ids, dtype=np.float32)) if ids is not None else None
+
+    def __len__(self):
+        return len(self.xyxy)
+
+
+class Result:
+    def __init__(self, orig_img, boxes: Boxes):
+        self.orig_img = orig_img
+        self.boxes = boxes
+
+
+class TinyDetector:
+    names = {0: "pedestrian", 1: "bicycle", 2: "vehicle", 3: "bus", 4: "truck", 5: "tricycle"}
+
+    def __init__(self, *args, **kwargs):
+        # 与 YOLO(model_path) 的调用方式兼容，参数忽略
+        pass
+
+    def _detect(self, img: np.ndarray, conf: float):
+        """返回 (xyxy, conf, cls)，按从上到下、从左到右排序"""
+        h, w = img.shape[:2]
+        scale = WORK_SIDE / max(h, w)
+        small = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, (0, 150, 60), (179, 255, 255))
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        found = []
+        frame_area = small.shape[0] * small.shape[1]
+        for contour in contours:
+            x, y, bw, bh = cv2.boundingRect(contour)
+            if bw * bh < MIN_AREA:
+                continue
+            hue = int(hsv[y + bh // 2, x + bw // 2, 0])
+            score = min(0.95, 0.55 + 4 * bw * bh / frame_area)
+            if score < conf:
+                continue
+            found.append(((x / scale, y / scale, (x + bw) / scale, (y + bh) / scale), score,
+                          hue * len(self.names) // 180))
+        found.sort(key=lambda item: (item[0][1], item[0][0]))
+        return [f[0] for f in found], [f[1] for f in found], [f[2] for f in found]
+
+    def predict(self, source=None, conf: float = 0.25, **kwargs):
+        """source 可以是一张图、图片路径或多张图的列表（实时画面按批推理），每张图返回一个结果"""
+        sources = source if isinstance(source, list) else [source]
+        results = []
+        for img in sources:
+            if isinstance(img, str):
+                img = cv2.imread(img)
+            xyxy, scores, classes = self._detect(img, conf)
+            results.append(Result(img, Boxes(xyxy, scores, classes)))
+        return results
+
+    __call__ = predict
+
+    def track(self, source=None, conf: float = 0.25, stream: bool = False, **kwargs):
+        """逐帧检测，按与上一帧中心点的距离贪心匹配跟踪编号"""
+        results = self._track(source, conf)
+        return results if stream else list(results)
+
+    def _track(self, source: str, conf: float):
+        cap = cv2.VideoCapture(source)
+        previous = {}  # 跟踪编号 -> 中心点
+        next_id = 1
+        try:
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                xyxy, scores, classes = self._detect(frame, conf)
+                current, ids = {}, []
+                for x1, y1, x2, y2 in xyxy:
+                    center = np.array(((x1 + x2) / 2, (y1 + y2) / 2))
+                    limit = max(x2 - x1, y2 - y1)
+                    best, best_distance = None, limit
+                    for track_id, last in previous.items():
+                        distance = float(np.hypot(*(center - last)))
+                        if track_id not in current and distance < best_distance:
+                            best, best_distance = track_id, distance
+                    if best is None:
+                        best, next_id = next_id, next_id + 1
+                    current[best] = center
+                    ids.append(best)
+                previous = current
+                yield Result(frame, Boxes(xyxy, scores, classes, ids))
+        finally:
+            cap.release()
+
+
+def install():
+    """
+    让 from ultralytics import YOLO 得到 TinyDetector；必须在导入 routers 之前调用
+    还没导入 ultralytics 时注册一个只有 YOLO 的占位模块，基准、压测和测试不需要装 ultralytics / torch
+    """
+    ultralytics = sys.modules.setdefault("ultralytics", types.ModuleType("ultralytics"))
+    ultralytics.YOLO = TinyDetector
@@ -0,0 +1,96 @@
+"""
+冷启动测量：在全新的解释器中导入 main，再经过启动阶段（建表、后台线程）发出第一个请求
+
+    cd back
+    python -m bench.startup        # 打印各阶段耗时和导入最慢的模块
+
+每次测量都在子进程中运行本模块（--json），结果不受当前进程已导入模块的影响；基准用例 startup 也用它。
+模型不预加载（MODEL_PRELOAD=0），测的是服务能响应之前的时间；重量级依赖是否在导入阶段被拉进来见 heavy_modules。
+"""
+import time
+
+_START = time.perf_counter()
+
+import os  # noqa: E402
+import sys  # noqa: E402
+import json  # noqa: E402
+import shutil  # noqa: E402
+import tempfile  # noqa: E402
+import subprocess  # noqa: E402
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 导入 main 时不应该出现的模块（推理框架只在第一次使用模型时导入）
+HEAVY_MODULES = ("ultralytics", "torch", "torchvision")
+
+
+def probe(root: str) -> dict:
+    os.environ["MODEL_PRELOAD"] = "0"
+    from bench import workspace
+    workspace.redirect(root)
+
+    import main
+    imported = time.perf_counter() - _START
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    modules = len(sys.modules)
+
+    from fastapi.testclient import TestClient
+    import metrics
+    with TestClient(main.app) as client:
+        client.get("/health/live").raise_for_status()
+        first_response = time.perf_counter() - _START
+    return {
+        "import_main_s": imported,
+        "first_response_s": first_response,
+        # 含解释器自身启动，与 /metrics 中 app_startup_seconds 的口径一致
+        "process_first_response_s": metrics.startup_timings().get("first_response"),
+        "modules": modules,
+        "heavy_modules": heavy
+    }
+
+
+def slowest_imports(stderr: str, top: int = 10):
+    """解析 -X importtime 的输出，按顶层包汇总各模块自身的导入耗时，返回最慢的 [(包, 毫秒)]"""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():
+            continue  # 表头
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(own) / 1000
+    return sorted(totals.items(), key=lambda item: -item[1])[:top]
+
+
+def measure(importtime: bool = False):
+    """在子进程中测一次，返回 (结果, 最慢的导入)；importtime 为 False 时后者为空"""
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-m", "bench.startup", "--json"]
+    done = subprocess.run(cmd, cwd=BACK_DIR, capture_output=True, text=True, timeout=300)
+    if done.returncode != 0:
+        raise RuntimeError(f"启动测量失败: {done.stderr[-2000:]}")
+    result = json.loads(done.stdout.strip().splitlines()[-1])
+    return result, slowest_imports(done.stderr) if importtime else []
+
+
+def main():
+    if "--json" in sys.argv:
+        import logging
+        logging.disable(logging.INFO)
+        root = tempfile.mkdtemp(prefix="detect-startup-")
+        try:
+            print(json.dumps(probe(root)))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+        return
+    result, slowest = measure(importtime=True)
+    print(f"⏱️ 导入 main: {result['import_main_s'] * 1000:.0f}ms，第一个响应: {result['first_response_s'] * 1000:.0f}ms"
+          f"（含解释器启动 {result['process_first_response_s']}s），已导入模块 {result['modules']} 个")
+    if result["heavy_modules"]:
+        print(f"⚠️ 导入阶段已加载: {', '.join(result['heavy_modules'])}")
+    print("导入最慢的包（各模块自身耗时之和，含 -X importtime 自身的开销）:")
+    for name, ms in slowest:
+        print(f"   {name:<32} {ms:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
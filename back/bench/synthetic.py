@@ -0,0 +1,76 @@
+"""
+基准测试用的合成图片和视频：固定随机种子，同样的参数每次生成完全相同的内容
+
+背景是低饱和度的渐变加灰度噪声，目标是高饱和度的实心矩形，TinyDetector 靠饱和度就能把它们找出来；
+视频中目标匀速移动、碰到边缘反弹，跟踪编号在整段视频中保持稳定
+"""
+import cv2
+import numpy as np
+
+# 高饱和度的 BGR 颜色，色相分散，TinyDetector 按色相区分类别
+PALETTE = [
+    (0, 0, 255), (0, 160, 255), (0, 255, 255), (0, 255, 0),
+    (255, 255, 0), (255, 0, 0), (255, 0, 160), (160, 0, 255)
+]
+
+
+def _background(width: int, height: int, rng: np.random.Generator) -> np.ndarray:
+    gradient = np.linspace(40, 200, width, dtype=np.float32)[None, :] + np.linspace(0, 40, height, dtype=np.float32)[:, None]
+    noise = rng.integers(0, 24, (height, width), dtype=np.uint8)
+    gray = cv2.add(gradient.astype(np.uint8), noise)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def _layout(width: int, height: int, objects: int, rng: np.random.Generator):
+    """目标的初始位置、大小、速度和颜色"""
+    items = []
+    for i in range(objects):
+        w = int(rng.uniform(0.05, 0.12) * width)
+        h = int(rng.uniform(0.08, 0.2) * height)
+        x = int(rng.uniform(0, width - w))
+        y = int(rng.uniform(0, height - h))
+        speed = rng.uniform(0.002, 0.01, 2) * (width, height) * rng.choice((-1, 1), 2)
+        items.append([float(x), float(y), w, h, float(speed[0]), float(speed[1]), PALETTE[i % len(PALETTE)]])
+    return items
+
+
+def _draw(img: np.ndarray, items):
+    for x, y, w, h, _, _, color in items:
+        cv2.rectangle(img, (int(x), int(y)), (int(x) + w, int(y) + h), color, -1)
+    return img
+
+
+def make_image(width: int, height: int, objects: int = 8, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return _draw(_background(width, height, rng), _layout(width, height, objects, rng))
+
+
+def encode_image(img: np.ndarray, ext: str = ".jpg", quality: int = 92) -> bytes:
+    ok, buffer = cv2.imencode(ext, img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("合成图片编码失败")
+    return buffer.tobytes()
+
+
+def make_video(path: str, width: int, height: int, frames: int, fps: float = 25,
+               objects: int = 6, seed: int = 0) -> str:
+    """写入 mp4v 编码的合成视频，返回 path"""
+    rng = np.random.default_rng(seed)
+    background = _background(width, height, rng)
+    items = _layout(width, height, objects, rng)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not out.isOpened():
+        raise RuntimeError(f"无法写入合成视频: {path}")
+    try:
+        for _ in range(frames):
+            out.write(_draw(background.copy(), items))
+            for item in items:
+                x, y, w, h, vx, vy, _ = item
+                if not 0 <= x + vx <= width - w:
+                    item[4] = vx = -vx
+                if not 0 <= y + vy <= height - h:
+                    item[5] = vy = -vy
+                item[0], item[1] = x + vx, y + vy
+    finally:
+        out.release()
+    return path
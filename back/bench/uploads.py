@@ -0,0 +1,200 @@
+"""
+大文件上传的内存占用：/detect/video（multipart）和分块续传 /upload/*
+
+TestClient 会先把整个请求体读进内存，这里直接按 ASGI 协议把请求体一块一块送进应用，
+同时在后台线程里采样进程 RSS 的峰值。上传内容边发边生成，不预先放在内存或磁盘上。
+检测任务换成只解除 pin 的空任务：测的是上传本身，不是对一段无效视频做检测。
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlencode
+
+PIECE = 1024 * 1024  # 每次送入应用的请求体字节数
+MB = 1024 * 1024
+
+
+def current_rss() -> Optional[int]:
+    """当前进程的 RSS（字节）；没有 /proc 时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class PeakRss:
+    """with PeakRss() as peak: ...，peak.growth 为期间 RSS 峰值比开始时多出的字节数"""
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.start = self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def growth(self) -> int:
+        return max(0, self.peak - self.start)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss() or 0)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start = self.peak = current_rss() or 0
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss() or 0)
+        return False
+
+
+def synthetic_pieces(size: int, digest=None) -> Iterator[bytes]:
+    """size 字节的伪随机内容，按 PIECE 分块产出；每块开头写入块号，内容不会重复。digest 给出时边产出边计算摘要"""
+    block = os.urandom(PIECE)
+    for index, start in enumerate(range(0, size, PIECE)):
+        piece = (index.to_bytes(8, "little") + block[8:])[:min(PIECE, size - start)]
+        if digest is not None:
+            digest.update(piece)
+        yield piece
+
+
+def _multipart(field: str, filename: str, content: Iterable[bytes], boundary: str) -> Iterator[bytes]:
+    yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+           f"Content-Type: application/octet-stream\r\n\r\n").encode()
+    yield from content
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+async def _request(app, method: str, path: str, query: Dict[str, Any] = None, headers: Dict[str, str] = None,
+                   body: Iterable[bytes] = ()) -> Tuple[int, bytes]:
+    """按 ASGI 协议调用应用：请求体逐块送入，返回 (状态码, 响应体)"""
+    pieces = iter(body)
+    done = False
+    status = 500
+    response = []
+
+    async def receive():
+        nonlocal done
+        if done:
+            return {"type": "http.disconnect"}
+        piece = next(pieces, None)
+        if piece is None:
+            done = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": piece, "more_body": True}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            response.append(message.get("body", b""))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": urlencode(query or {}).encode(),
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    return status, b"".join(response)
+
+
+def _check(status: int, body: bytes) -> Dict[str, Any]:
+    if status != 200:
+        raise RuntimeError(f"上传失败 ({status}): {body[:200]!r}")
+    return json.loads(body)
+
+
+@contextmanager
+def _without_video_job():
+    """上传完成后不启动检测任务，只解除 pin 并返回落盘的路径"""
+    import blob_store
+    from routers import upload, video
+    original = video.start_video_job
+
+    def skip(save_path, save_name, out_name, video_id, *args, **kwargs):
+        blob_store.release(save_path)
+        return {"video_id": video_id, "status": "skipped", "save_path": save_path}
+
+    video.start_video_job = upload.start_video_job = skip
+    try:
+        yield
+    finally:
+        video.start_video_job = upload.start_video_job = original
+
+
+def app():
+    """只挂载上传相关路由的应用，不触发 main 的启动流程"""
+    from fastapi import FastAPI
+    from routers import upload, video
+    application = FastAPI()
+    application.include_router(video.router, prefix="/api")
+    application.include_router(upload.router, prefix="/api")
+    return application
+
+
+async def _detect_video(application, size: int) -> Dict[str, Any]:
+    boundary = uuid.uuid4().hex
+    status, body = await _request(
+        application, "POST", "/api/detect/video", {"conf": "0.5"},
+        {"content-type": f"multipart/form-data; boundary={boundary}"},
+        _multipart("file", "large.mp4", synthetic_pieces(size), boundary)
+    )
+    return _check(status, body)
+
+
+async def _resumable(application, size: int) -> Dict[str, Any]:
+    from config import RESUMABLE_CHUNK_SIZE
+    assert RESUMABLE_CHUNK_SIZE % PIECE == 0
+    init = _check(*await _request(application, "POST", "/api/upload/init",
+                                  {"filename": "large.mp4", "total_size": size}))
+    upload_id = init["upload_id"]
+    digest = hashlib.sha256()
+    pieces = synthetic_pieces(size, digest)
+    for offset in range(0, size, RESUMABLE_CHUNK_SIZE):
+        _check(*await _request(application, "PUT", f"/api/upload/{upload_id}/chunk", {"offset": offset},
+                               {"content-type": "application/octet-stream"},
+                               islice(pieces, RESUMABLE_CHUNK_SIZE // PIECE)))
+    return _check(*await _request(application, "POST", f"/api/upload/{upload_id}/finalize",
+                                  {"sha256": digest.hexdigest()}))
+
+
+FLOWS = {"detect_video": _detect_video, "resumable": _resumable}
+
+
+def measure(flow: str, size: int, application=None) -> Dict[str, Any]:
+    """
+    上传 size 字节，返回 {"seconds", "peak_rss_growth", "stored_size"}
+    上传的文件用完即删，磁盘上不会留下 size 大小的文件
+    """
+    application = application or app()
+    with _without_video_job(), PeakRss() as peak:
+        start = time.perf_counter()
+        result = asyncio.run(FLOWS[flow](application, size))
+        seconds = time.perf_counter() - start
+    save_path = result["save_path"]
+    stored_size = os.path.getsize(save_path)
+    os.remove(save_path)
+    return {"seconds": seconds, "peak_rss_growth": peak.growth, "stored_size": stored_size}
@@ -0,0 +1,71 @@
+"""
+基准测试的隔离环境：上传/结果/缩略图目录和 SQLite 数据库都放到临时目录，不碰 back/static 和 back/db
+
+各模块在导入时 from config import 目录，所以 prepare() 必须在导入 db、routers 等模块之前调用
+"""
+import gc
+import os
+import sys
+import shutil
+import logging
+import tempfile
+from bench import detector
+
+# config 中需要重定向的目录 -> 临时目录下的子路径
+_DIRS = {
+    "UPLOAD_DIR": "static/uploads",
+    "RESULT_DIR": "static/results",
+    "CAMERA_DIR": "static/camera_records",
+    "TRANSCODED_DIR": "static/transcoded",
+    "PARTIAL_UPLOAD_DIR": "static/partial_uploads",
+    "GALLERY_DIR": "static/gallery",
+    "THUMB_DIR": "static/thumbnails",
+    "LOG_DIR": "logs",
+    "DB_DIR": "db",
+}
+# 导入后就已经读取了 config 的模块
+_APP_MODULES = ("db", "blob_store", "thumbnails", "routers.detect", "routers.video", "routers.records")
+
+
+def redirect(root: str):
+    """把 config 中的目录和数据库指向 root（压测服务 loadtest.serve 也用它）"""
+    loaded = [name for name in _APP_MODULES if name in sys.modules]
+    if loaded:
+        raise RuntimeError(f"必须在导入应用模块之前重定向目录，已导入: {loaded}")
+    import config
+    for name, relative in _DIRS.items():
+        path = os.path.join(root, *relative.split("/"))
+        os.makedirs(path, exist_ok=True)
+        setattr(config, name, path)
+    config.DATABASE_URL = f"sqlite:///{os.path.join(config.DB_DIR, 'bench.db')}"
+    config.SLOW_REQUEST_LOG = os.path.join(config.LOG_DIR, "slow_requests.log")
+    config.THUMB_BACKFILL_ENABLED = False
+    config.STORAGE_LIFECYCLE_ENABLED = False
+
+
+def prepare(root: str = None) -> str:
+    """重定向目录、换上替身检测器并建表，返回工作目录"""
+    root = root or tempfile.mkdtemp(prefix="detect-bench-")
+    redirect(root)
+    detector.install()
+    # 各阶段的日志（每帧进度等）会干扰输出和计时
+    logging.disable(logging.INFO)
+
+    from migrations import run_migrations
+    run_migrations()
+
+    # 用例用到的模块先导入，再把已有对象移出 GC 跟踪：
+    # 否则计时中触发的全量回收要遍历 FastAPI / SQLAlchemy 的大量对象，微基准会随机变慢
+    import live_stream
+    from routers import detect, video, records
+    gc.collect()
+    gc.freeze()
+    return root
+
+
+def cleanup(root: str):
+    from db_writer import record_writer
+    from db import engine
+    record_writer.stop()
+    engine.dispose()
+    shutil.rmtree(root, ignore_errors=True)
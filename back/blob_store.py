@@ -0,0 +1,182 @@
+"""
+按内容寻址的文件存储
+
+文件存放在 <根目录>/<摘要前 2 位>/<3-4 位>/<摘要><扩展名>，两级扇出让每个目录里的文件数保持在几百以内；
+内容相同的文件只存一份，多条记录引用同一个路径。
+写入先落到 <根目录>/.incoming 下的临时文件，边写边算摘要，完成后原子 rename 到最终位置，
+读者要么看不到文件，要么看到完整的文件。
+
+  上传文件：按内容的 SHA-256 寻址（put_upload / put_file）
+  检测结果：按 (原文件摘要, 检测参数, 模型) 派生的键寻址（derived_key + put_bytes），
+            同一文件用同样的参数再次检测时直接复用已有结果，不再重新推理和绘制
+
+引用计数就是 detect_record 中 source_path / result_path 指向该路径的记录数（两列都有索引），
+删除记录时只删除计数为 0 的文件，见 storage_lifecycle.delete_records。
+文件写入后到记录落库前被 pin 住，期间并发的删除不会把它删掉；调用方在记录写入后 release。
+删除方先用 deleting() 占住路径（跳过已 pin 的），再在锁外复查引用并删除；占住期间复用返回 False、写入同一路径的等删除结束。
+锁只保护 pin 和占用的登记，文件和数据库操作都在锁外，删除大量文件时不会卡住事件循环上的上传。
+"""
+import os
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+import aiofiles
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from config import UPLOAD_CHUNK_SIZE
+from upload_utils import file_sha256
+
+logger = logging.getLogger(__name__)
+
+INCOMING_DIR = ".incoming"
+
+# 写入/复用与删除之间的互斥：只在登记 pin 和删除占用时短暂持有
+lock = threading.Lock()
+_deleted = threading.Condition(lock)
+_pins: Dict[str, int] = {}
+_deleting: Set[str] = set()
+
+
+class Blob(NamedTuple):
+    path: str
+    digest: str
+    size: int
+    existed: bool  # 内容已存在，本次没有写入新文件
+
+
+def blob_path(root: str, digest: str, ext: str = "") -> str:
+    return os.path.join(root, digest[:2], digest[2:4], f"{digest}{ext.lower()}")
+
+
+def derived_key(*parts) -> str:
+    """由原文件摘要和生成参数派生结果文件的键"""
+    return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def _incoming_path(root: str) -> str:
+    directory = os.path.join(root, INCOMING_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{uuid.uuid4().hex}.part")
+
+
+def _pin(path: str):
+    _pins[path] = _pins.get(path, 0) + 1
+
+
+def release(*paths: Optional[str]):
+    """记录已落库（或放弃写入），解除 pin"""
+    with lock:
+        for path in paths:
+            if path is None or path not in _pins:
+                continue
+            _pins[path] -= 1
+            if _pins[path] <= 0:
+                del _pins[path]
+
+
+def is_pinned(path: str) -> bool:
+    return path in _pins
+
+
+@contextmanager
+def deleting(paths: Iterable[str]) -> Iterator[List[str]]:
+    """
+    删除前占住路径，yield 实际占住的部分（已 pin 或正被别处删除的跳过）
+    调用方在 with 块内复查引用并删除文件；退出时解除占用，唤醒等待写入同一路径的线程
+    """
+    with lock:
+        claimed = [p for p in dict.fromkeys(paths) if p not in _pins and p not in _deleting]
+        _deleting.update(claimed)
+    try:
+        yield claimed
+    finally:
+        with lock:
+            _deleting.difference_update(claimed)
+            _deleted.notify_all()
+
+
+def _commit(tmp_path: str, path: str, size: int) -> bool:
+    """
+    把临时文件放到最终位置并 pin 住，返回内容是否已存在
+    路径已存在时保留已有文件、丢弃临时文件：同一路径被多条记录共用，下载时按不变的 ETag 长期缓存，不能被覆盖
+    """
+    with lock:
+        while path in _deleting:
+            _deleted.wait()
+        _pin(path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            # 硬链接在目标已存在时失败，不会像 rename 那样覆盖并发写入的同一路径
+            os.link(tmp_path, path)
+            existed = False
+        except FileExistsError:
+            existed = True
+            # 刷新修改时间，孤儿巡检的宽限期从这次复用算起
+            os.utime(path)
+            if os.path.getsize(path) != size:
+                logger.warning(f"⚠️ 已存在的文件大小与新内容不一致，保留已有文件: {path}")
+        os.remove(tmp_path)
+    except BaseException:
+        release(path)
+        raise
+    return existed
+
+
+def put_file(root: str, tmp_path: str, ext: str = "", digest: Optional[str] = None) -> Blob:
+    """把已写好的文件（如拼好的分块上传）移入存储；digest 已知时不再重复计算"""
+    digest = (digest or file_sha256(tmp_path)).lower()
+    size = os.path.getsize(tmp_path)
+    path = blob_path(root, digest, ext)
+    return Blob(path, digest, size, _commit(tmp_path, path, size))
+
+
+def put_bytes(root: str, digest: str, data: bytes, ext: str = "") -> Blob:
+    """把内存中的数据（如编码后的结果图）原子写入存储，digest 为内容摘要或 derived_key 派生的键"""
+    tmp_path = _incoming_path(root)
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    path = blob_path(root, digest, ext)
+    return Blob(path, digest, len(data), _commit(tmp_path, path, len(data)))
+
+
+async def put_upload(file: UploadFile, root: str, ext: str = "", chunk_size: int = UPLOAD_CHUNK_SIZE) -> Blob:
+    """分块写入上传文件并同时计算摘要，内存占用与文件大小无关；失败时删除临时文件"""
+    tmp_path = _incoming_path(root)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out_file:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                await out_file.write(chunk)
+                size += len(chunk)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    digest = digest.hexdigest()
+    path = blob_path(root, digest, ext)
+    return Blob(path, digest, size, await run_in_threadpool(_commit, tmp_path, path, size))
+
+
+def reuse(path: str) -> bool:
+    """已有的结果文件还在（且没有正在被删除）则 pin 住并返回 True，调用方可以直接复用"""
+    with lock:
+        if path in _deleting:
+            return False
+        _pin(path)
+    try:
+        if os.path.isfile(path):
+            os.utime(path)
+            return True
+    except OSError:
+        pass
+    release(path)
+    return False
@@ -0,0 +1,630 @@
+"""
+多路实时摄像头管理
+
+每个摄像头源一个读取线程，所有摄像头共享一个推理线程，
+把各路新到的帧合成一个批次做一次前向推理
+"""
+import os
+import time
+import fnmatch
+import logging
+import threading
+import cv2
+from urllib.parse import urlsplit
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from config import (LIVE_IMGSZ, LIVE_CONF, LIVE_MAX_BATCH, CAMERA_IDLE_TIMEOUT, CAMERA_ALLOWED_DEVICES,
+                    CAMERA_ALLOWED_SCHEMES, CAMERA_ALLOWED_HOSTS, CAMERA_FILE_DIR)
+from analytics import AnalyticsEngine
+from event_recorder import EventRecorder
+from live_stream import FrameBroadcaster, AsyncNotifier, RAW_JPEG_QUALITY
+from live_controller import AdaptiveRateController
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 打不开或读取失败后重连的等待时间（秒）：从最小值起每次翻倍，读到一帧后恢复
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+
+
+def detect_source_kind(source: str) -> str:
+    """根据源地址判断类型：device（本地设备号）/ stream（RTSP/HTTP）/ file（本地视频，循环播放）"""
+    if source.isdigit() or source.startswith("/dev/video"):
+        return "device"
+    if "://" in source:
+        return "stream"
+    if os.path.isfile(source):
+        return "file"
+    raise ValueError(f"无法识别的摄像头源: {source}")
+
+
+def check_source_allowed(source: str):
+    """
+    通过接口注册的源必须在白名单内，否则抛出 PermissionError：
+    设备号在 CAMERA_ALLOWED_DEVICES 中；网络流的协议和主机在 CAMERA_ALLOWED_SCHEMES / CAMERA_ALLOWED_HOSTS 中；
+    本地文件解析符号链接后位于 CAMERA_FILE_DIR 下
+    """
+    kind = detect_source_kind(source)
+    if kind == "device":
+        if source.replace("/dev/video", "") not in CAMERA_ALLOWED_DEVICES:
+            raise PermissionError(f"不允许的摄像头设备: {source}")
+    elif kind == "stream":
+        parts = urlsplit(source)
+        host = (parts.hostname or "").lower()
+        if parts.scheme.lower() not in CAMERA_ALLOWED_SCHEMES:
+            raise PermissionError(f"不允许的摄像头协议: {parts.scheme}")
+        if not host or not any(fnmatch.fnmatchcase(host, pattern) for pattern in CAMERA_ALLOWED_HOSTS):
+            raise PermissionError(f"不允许的摄像头地址: {host or source}")
+    else:
+        real = os.path.realpath(source)
+        if not real.startswith(os.path.realpath(CAMERA_FILE_DIR) + os.sep):
+            raise PermissionError("只能使用摄像头源目录下的视频文件")
+
+
+def _iou(a, b) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+class IouTracker:
+    """
+    按 IoU 贪心匹配的轻量跟踪器，为每路摄像头单独分配稳定的目标 id
+    合批推理时无法使用 ultralytics 的逐流跟踪器，这里代价只与活跃目标数相关
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 15):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks: Dict[int, Dict[str, Any]] = {}
+        self.next_id = 1
+
+    def update(self, detections: List[Dict[str, Any]]):
+        pairs = []
+        for track_id, track in self.tracks.items():
+            for idx, det in enumerate(detections):
+                if det["class"] != track["class"]:
+                    continue
+                iou = _iou(track["bbox"], det["bbox"])
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, track_id, idx))
+        pairs.sort(reverse=True)
+
+        matched_tracks, matched_dets = set(), set()
+        for iou, track_id, idx in pairs:
+            if track_id in matched_tracks or idx in matched_dets:
+                continue
+            matched_tracks.add(track_id)
+            matched_dets.add(idx)
+            detections[idx]["id"] = track_id
+            self.tracks[track_id]["bbox"] = detections[idx]["bbox"]
+            self.tracks[track_id]["missed"] = 0
+
+        # 未匹配的旧目标累计丢失次数，超过上限后移除
+        for track_id in list(self.tracks.keys()):
+            if track_id in matched_tracks:
+                continue
+            self.tracks[track_id]["missed"] += 1
+            if self.tracks[track_id]["missed"] > self.max_missed:
+                del self.tracks[track_id]
+
+        for idx, det in enumerate(detections):
+            if idx in matched_dets:
+                continue
+            det["id"] = self.next_id
+            self.tracks[self.next_id] = {"class": det["class"], "bbox": det["bbox"], "missed": 0}
+            self.next_id += 1
+        return detections
+
+
+class FrameSlot:
+    """
+    单槽最新帧缓冲：写入覆盖旧帧并递增序号，读取方按序号等待真正的新帧
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.timestamp = 0.0
+        self._listeners: List[Callable[[], None]] = []
+
+    def add_listener(self, callback: Callable[[], None]):
+        self._listeners.append(callback)
+
+    def put(self, frame):
+        with self._cond:
+            self.frame = frame
+            self.seq += 1
+            self.timestamp = time.time()
+            self._cond.notify_all()
+        for callback in self._listeners:
+            callback()
+
+    def get(self):
+        with self._cond:
+            return self.frame, self.seq, self.timestamp
+
+    def wait_newer(self, seq: int, timeout: Optional[float] = None):
+        """等待序号大于 seq 的帧，超时返回 None"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.seq > seq, timeout=timeout):
+                return None
+            return self.frame, self.seq, self.timestamp
+
+
+class DetectionSnapshot(NamedTuple):
+    """
+    一次推理的不可变结果，整体替换引用实现原子更新
+    detections 是元组，发布后其中的字典不再修改
+    """
+    seq: int
+    frame_time: float
+    infer_time: float
+    detections: Tuple[Dict[str, Any], ...]
+
+
+EMPTY_SNAPSHOT = DetectionSnapshot(0, 0.0, 0.0, ())
+
+
+class CameraSource:
+    """单个摄像头源：读取线程 + 最新帧 + 最新检测结果"""
+
+    def __init__(self, cam_id: str, source: str, kind: Optional[str] = None,
+                 width: int = 640, height: int = 480, fps: int = 30):
+        self.cam_id = cam_id
+        self.source = source
+        self.kind = kind or detect_source_kind(source)
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+        self.frames = FrameSlot()
+        self.snapshot = EMPTY_SNAPSHOT
+        self.inferred_seq = 0
+
+        self.tracker = IouTracker()
+        # 带检测框的 MJPEG 画面和不带框的原始画面（WebSocket）各自只编码一次
+        self.broadcaster = FrameBroadcaster(self)
+        self.raw_broadcaster = FrameBroadcaster(self, annotate=False, quality=RAW_JPEG_QUALITY)
+        self.detection_notifier = AsyncNotifier()
+        self.analytics: Optional[AnalyticsEngine] = None
+        self.analytics_lock = threading.Lock()
+        # 事件触发录像（未配置规则时为 None，不做额外编码）
+        self.recorder: Optional[EventRecorder] = None
+
+        # 订阅计数：按类型（stream / websocket / recorder / manual）计数，全部归零后延时关闭
+        self.lease_lock = threading.Lock()
+        self.leases: Dict[str, int] = {}
+        self.idle_since: Optional[float] = None
+        self._idle_timer: Optional[threading.Timer] = None
+        self._idle_generation = 0
+
+        self.capture_fps = 0.0
+        self.error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._reader, name=f"camera-{self.cam_id}", daemon=True)
+        self._thread.start()
+        if self.recorder is not None:
+            self.recorder.start()
+
+    def stop(self):
+        self._stop.set()
+        self.broadcaster.stop()
+        self.raw_broadcaster.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self._thread = None
+        # 唤醒等待检测结果的 WebSocket，它们看到摄像头已停止后结束
+        self.detection_notifier.notify()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # ---------- 读取线程 ----------
+
+    def _open(self):
+        if self.kind == "device":
+            index = int(self.source.replace("/dev/video", ""))
+            # Windows 下沿用 DirectShow，其他平台走 V4L2
+            backend = cv2.CAP_DSHOW if os.name == "nt" else cv2.CAP_V4L2
+            cap = cv2.VideoCapture(index, backend)
+            cap.set(cv2.CAP_PROP_FPS, self.fps)
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        elif self.kind == "stream":
+            cap = cv2.VideoCapture(self.source, cv2.CAP_FFMPEG)
+            # 只保留最新帧，避免网络流积压
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        else:
+            cap = cv2.VideoCapture(self.source)
+        return cap
+
+    def _reader(self):
+        # 打不开和打开后读不到帧都按指数退避重连，源失效时不会空转占满 CPU、刷屏日志
+        retry_delay = RECONNECT_MIN_DELAY
+        while not self._stop.is_set():
+            cap = self._open()
+            if not cap.isOpened():
+                self.error = "无法打开摄像头源"
+                logger.error(f"❌ 无法打开摄像头 {self.cam_id}: {self.source}，{retry_delay:.0f}s 后重试")
+                cap.release()
+                retry_delay = self._backoff(retry_delay)
+                continue
+
+            # 本地文件按原始帧率播放，模拟实时摄像头
+            file_interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 25) if self.kind == "file" else 0
+            next_time = time.time()
+            fps_count, fps_start = 0, time.time()
+
+            rewound = False
+            while not self._stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    # 本地文件读到结尾后从头循环；刚回绕就失败说明文件不可读
+                    if self.kind == "file" and not rewound:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        rewound = True
+                        continue
+                    self.error = "摄像头读取失败"
+                    logger.warning(f"⚠️ 摄像头 {self.cam_id} 读取失败，{retry_delay:.0f}s 后重连")
+                    break
+                rewound = False
+                self.error = None
+                retry_delay = RECONNECT_MIN_DELAY
+
+                self.frames.put(frame)
+
+                now = time.time()
+                fps_count += 1
+                if now - fps_start >= 1.0:
+                    self.capture_fps = fps_count / (now - fps_start)
+                    fps_count, fps_start = 0, now
+
+                # 设备和网络流的 read() 本身会阻塞到下一帧，无需额外休眠
+                if file_interval:
+                    next_time += file_interval
+                    delay = next_time - time.time()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                    else:
+                        next_time = time.time()
+
+            cap.release()
+            if not self._stop.is_set():
+                retry_delay = self._backoff(retry_delay)
+
+    def _backoff(self, delay: float) -> float:
+        """等待 delay 秒（停止时立即返回），返回下一次重连前的等待时间"""
+        self._stop.wait(delay)
+        return min(delay * 2, RECONNECT_MAX_DELAY)
+
+    # ---------- 读取状态 ----------
+
+    def get_frame(self):
+        frame, seq, _ = self.frames.get()
+        return frame, seq
+
+    def get_detections(self):
+        snapshot = self.snapshot
+        return list(snapshot.detections), snapshot.seq, snapshot.frame_time
+
+    def set_detections(self, detections: List[Dict[str, Any]], frame_seq: int, frame_time: float):
+        # 跟踪器在发布前写入 id，发布后快照不再修改
+        detections = self.tracker.update(detections)
+        self.snapshot = DetectionSnapshot(frame_seq, frame_time, time.time(), tuple(detections))
+        self.detection_notifier.notify()
+
+        engine = self.analytics
+        if engine is not None:
+            with self.analytics_lock:
+                engine.update(frame_time, detections)
+
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.on_detections(frame_time, detections)
+
+    def cancel_idle_timer(self):
+        """调用方持有 lease_lock"""
+        self._idle_generation += 1
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        self.idle_since = None
+
+    def set_recorder(self, recorder: Optional[EventRecorder]):
+        """替换事件录像器，旧录像器的进行中事件按已录制部分收尾"""
+        old, self.recorder = self.recorder, recorder
+        if old is not None:
+            old.stop()
+        if recorder is not None and self.running:
+            recorder.start()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "cam_id": self.cam_id,
+            "source": self.source,
+            "kind": self.kind,
+            "running": self.running,
+            "error": self.error,
+            "capture_fps": round(self.capture_fps, 2),
+            "frame_seq": self.frames.seq,
+            "detections_seq": self.snapshot.seq,
+            # 当前检测结果对应的帧距今多久
+            "staleness_ms": round((time.time() - self.snapshot.frame_time) * 1000, 1)
+            if self.snapshot.seq else None,
+            "analytics": self.analytics is not None,
+            "event_recording": self.recorder is not None,
+            "leases": dict(self.leases),
+            "idle_since": self.idle_since,
+            "stream": self.broadcaster.info(),
+            "raw_stream": self.raw_broadcaster.info(),
+            "detection_subscribers": len(self.detection_notifier)
+        }
+
+
+class CameraManager:
+    """管理多路摄像头，并用一个共享推理线程做跨摄像头合批推理"""
+
+    def __init__(self, model, conf: float = LIVE_CONF, imgsz: int = LIVE_IMGSZ,
+                 max_batch: int = LIVE_MAX_BATCH, idle_timeout: float = CAMERA_IDLE_TIMEOUT):
+        self.model = model
+        self.conf = conf
+        self.max_batch = max_batch
+        self.idle_timeout = idle_timeout
+        # 推理步长和输入尺寸由控制器根据实测延迟动态调整
+        self.controller = AdaptiveRateController(initial_imgsz=imgsz)
+        self.cameras: Dict[str, CameraSource] = {}
+        self.lock = threading.Lock()
+
+        self.batches = 0
+        self.frames_inferred = 0
+        self.last_batch_size = 0
+        self.last_infer_ms = 0.0
+        self._infer_seconds = metrics.STAGE_SECONDS.labels("live", "inference")
+
+        self._stop = threading.Event()
+        # 任意摄像头有新帧时置位，推理线程据此唤醒
+        self._frames_ready = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    # ---------- 摄像头注册 ----------
+
+    def register(self, cam_id: str, source: str, kind: Optional[str] = None) -> CameraSource:
+        with self.lock:
+            if cam_id in self.cameras:
+                raise ValueError(f"摄像头 {cam_id} 已存在")
+            camera = CameraSource(cam_id, source, kind)
+            camera.frames.add_listener(self._frames_ready.set)
+            self.cameras[cam_id] = camera
+        logger.info(f"📷 注册摄像头 {cam_id}: {source} ({camera.kind})")
+        return camera
+
+    def unregister(self, cam_id: str):
+        with self.lock:
+            camera = self.cameras.pop(cam_id, None)
+        if camera is not None:
+            with camera.lease_lock:
+                camera.cancel_idle_timer()
+                camera.leases.clear()
+                camera.stop()
+
+    def get(self, cam_id: str) -> Optional[CameraSource]:
+        return self.cameras.get(cam_id)
+
+    def start(self, cam_id: str) -> CameraSource:
+        camera = self.cameras[cam_id]
+        camera.start()
+        self._ensure_worker()
+        return camera
+
+    # ---------- 订阅计数与空闲关闭 ----------
+
+    def acquire(self, cam_id: str, kind: str) -> CameraSource:
+        """登记一个订阅者，摄像头和推理线程在第一次使用时启动"""
+        camera = self.cameras[cam_id]
+        with camera.lease_lock:
+            camera.leases[kind] = camera.leases.get(kind, 0) + 1
+            camera.cancel_idle_timer()
+            self.start(cam_id)
+        return camera
+
+    def release(self, cam_id: str, kind: str):
+        camera = self.cameras.get(cam_id)
+        if camera is None:
+            return
+        with camera.lease_lock:
+            count = camera.leases.get(kind, 0) - 1
+            if count > 0:
+                camera.leases[kind] = count
+            else:
+                camera.leases.pop(kind, None)
+            if not camera.leases:
+                self._schedule_idle_stop(camera)
+
+    @contextmanager
+    def lease(self, cam_id: str, kind: str):
+        camera = self.acquire(cam_id, kind)
+        try:
+            yield camera
+        finally:
+            self.release(cam_id, kind)
+
+    def touch(self, cam_id: str) -> CameraSource:
+        """轮询类接口（如检测结果查询）：没有长连接订阅者时按最后一次访问计算空闲时间"""
+        camera = self.cameras[cam_id]
+        with camera.lease_lock:
+            self.start(cam_id)
+            if not camera.leases:
+                self._schedule_idle_stop(camera)
+        return camera
+
+    def set_recorder(self, cam_id: str, recorder: Optional[EventRecorder]):
+        """事件录像期间一直占用一个订阅"""
+        camera = self.cameras[cam_id]
+        had_recorder = camera.recorder is not None
+        if recorder is not None and not had_recorder:
+            self.acquire(cam_id, "recorder")
+        camera.set_recorder(recorder)
+        if recorder is None and had_recorder:
+            self.release(cam_id, "recorder")
+
+    def _schedule_idle_stop(self, camera: CameraSource):
+        """调用方持有 camera.lease_lock"""
+        camera.cancel_idle_timer()
+        camera.idle_since = time.time()
+        timer = threading.Timer(self.idle_timeout, self._stop_if_idle,
+                                args=(camera, camera._idle_generation))
+        timer.daemon = True
+        camera._idle_timer = timer
+        timer.start()
+
+    def _stop_if_idle(self, camera: CameraSource, generation: int):
+        with camera.lease_lock:
+            # 期间有新的订阅或重新计时，则本次定时作废
+            if camera.leases or generation != camera._idle_generation:
+                return
+            camera._idle_timer = None
+            if camera.running:
+                logger.info(f"💤 摄像头 {camera.cam_id} 空闲 {self.idle_timeout:.0f}s，已关闭")
+                camera.stop()
+
+    @property
+    def worker_running(self) -> bool:
+        return self._worker is not None and self._worker.is_alive()
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [camera.info() for camera in list(self.cameras.values())]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cameras": len(self.cameras),
+            "batches": self.batches,
+            "frames_inferred": self.frames_inferred,
+            "last_batch_size": self.last_batch_size,
+            "last_infer_ms": round(self.last_infer_ms, 2),
+            "imgsz": self.controller.imgsz,
+            "stride": self.controller.stride,
+            "worker_running": self.worker_running,
+            "idle_timeout": self.idle_timeout
+        }
+
+    def collect_metrics(self):
+        """/metrics 抓取时读取各路摄像头的帧率和检测结果的滞后"""
+        now = time.time()
+        cameras = [camera for camera in list(self.cameras.values()) if camera.running]
+        controller = self.controller.info()
+        yield ("camera_running", "Cameras currently capturing", [({}, len(cameras))])
+        yield ("camera_capture_fps", "Frames per second read from each camera",
+               [({"cam_id": camera.cam_id}, round(camera.capture_fps, 3)) for camera in cameras])
+        yield ("camera_inference_staleness_seconds", "Age of the frame behind each camera's latest detections",
+               [({"cam_id": camera.cam_id}, round(now - camera.snapshot.frame_time, 4))
+                for camera in cameras if camera.snapshot.seq])
+        yield ("live_inference_hz", "Effective live inference rate per camera", [({}, controller["effective_hz"])])
+        yield ("live_inference_staleness_p90_seconds", "90th percentile staleness seen by the rate controller",
+               [({}, controller["staleness_ms"] / 1000)])
+        yield ("live_inference_imgsz", "Current live inference input size", [({}, controller["imgsz"])])
+        yield ("live_inference_stride", "Current live inference frame stride", [({}, controller["stride"])])
+
+    def shutdown(self):
+        self._stop.set()
+        self._frames_ready.set()
+        for camera in list(self.cameras.values()):
+            with camera.lease_lock:
+                camera.cancel_idle_timer()
+                camera.stop()
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout=2)
+
+    # ---------- 共享推理线程 ----------
+
+    def _ensure_worker(self):
+        # 与推理线程的退出判断在同一把锁下，避免刚启动的摄像头没有推理线程
+        with self.lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._inference_loop, name="camera-inference", daemon=True)
+            self._worker.start()
+
+    def _collect_batch(self):
+        """收集有新帧的摄像头，最久未推理的优先，超过批大小的留到下一轮"""
+        pending = []
+        stride = self.controller.stride
+        for camera in list(self.cameras.values()):
+            frame, seq, frame_time = camera.frames.get()
+            # 只对真正的新帧推理，步长大于 1 时跳过中间帧
+            if frame is not None and seq >= camera.inferred_seq + stride:
+                pending.append((camera.snapshot.frame_time, camera, frame, seq, frame_time))
+        pending.sort(key=lambda item: item[0])
+        return pending[:self.max_batch]
+
+    def _inference_loop(self):
+        while not self._stop.is_set():
+            # 先清标志再收集，收集期间到达的新帧会在下一轮被看到
+            self._frames_ready.clear()
+            batch = self._collect_batch()
+            if not batch:
+                # 所有摄像头都已关闭时推理线程退出，空闲时不占用 CPU
+                with self.lock:
+                    if not any(camera.running for camera in self.cameras.values()):
+                        self._worker = None
+                        logger.info("💤 没有运行中的摄像头，推理线程退出")
+                        return
+                self._frames_ready.wait(timeout=1.0)
+                continue
+            try:
+                self.infer_batch(batch)
+            except Exception as e:
+                logger.error(f"❌ 实时推理失败: {e}")
+                time.sleep(0.1)
+
+    def infer_batch(self, batch):
+        frames = [item[2] for item in batch]
+        start = time.time()
+        results = self.model.predict(frames, imgsz=self.controller.imgsz, conf=self.conf,
+                                     save=False, verbose=False)
+        self.last_infer_ms = (time.time() - start) * 1000
+        self._infer_seconds.observe(self.last_infer_ms / 1000)
+        self.batches += 1
+        self.frames_inferred += len(frames)
+        self.last_batch_size = len(frames)
+
+        for (_, camera, _, seq, frame_time), r in zip(batch, results):
+            detections = []
+            if r.boxes is not None and len(r.boxes) > 0:
+                for box, conf_i, cls_i in zip(r.boxes.xyxy.tolist(), r.boxes.conf.tolist(), r.boxes.cls.tolist()):
+                    detections.append({
+                        "class": self.model.names[int(cls_i)],
+                        "conf": float(conf_i),
+                        "bbox": list(map(int, box))
+                    })
+            camera.inferred_seq = seq
+            camera.set_detections(detections, seq, frame_time)
+
+        cameras = [item[1] for item in batch]
+        rates = [camera.capture_fps for camera in cameras if camera.capture_fps > 0]
+        self.controller.observe(
+            [camera.cam_id for camera in cameras],
+            [item[4] for item in batch],
+            self.last_infer_ms,
+            arrival_hz=min(rates) if rates else 0.0
+        )
@@ -1,4 +1,5 @@
 import os
+import json
 from urllib.parse import quote_plus
 
 # -------------------------------
@@ -11,10 +12,68 @@ RESULT_DIR = os.path.join(BASE_DIR, "static", "results")
 CAMERA_DIR = os.path.join(BASE_DIR, "static", "camera_records")
 MODEL_PATH = os.path.join(BASE_DIR, "yolov8", "best.pt")
 TRANSCODED_DIR = os.path.join(BASE_DIR, "static", "transcoded")
+# 分块续传的临时目录（未完成的上传）
+PARTIAL_UPLOAD_DIR = os.path.join(BASE_DIR, "static", "partial_uploads")
+# 视频目标截图和缩略图雪碧图
+GALLERY_DIR = os.path.join(BASE_DIR, "static", "gallery")
+# 记录列表的缩略图 / 视频封面
+THUMB_DIR = os.path.join(BASE_DIR, "static", "thumbnails")
+# 慢请求日志等运行日志
+LOG_DIR = os.path.join(BASE_DIR, "logs")
 # 自动创建目录
-for directory in [UPLOAD_DIR, RESULT_DIR, CAMERA_DIR]:
+for directory in [UPLOAD_DIR, RESULT_DIR, CAMERA_DIR, PARTIAL_UPLOAD_DIR, GALLERY_DIR, THUMB_DIR, LOG_DIR]:
     os.makedirs(directory, exist_ok=True)
 
+# -------------------------------
+# 上传配置
+# -------------------------------
+# 流式写盘的分块大小，内存占用只与该值有关
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 分块续传时单个分块的建议大小
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024
+
+# -------------------------------
+# 视频目标截图 / 缩略图配置
+# -------------------------------
+THUMBNAIL_INTERVAL = 5.0  # 每隔多少秒取一张缩略图
+SPRITE_TILE_WIDTH = 160  # 缩略图宽度（高度按比例）
+SPRITE_COLUMNS = 10  # 雪碧图每行的缩略图数量
+SPRITE_MAX_TILES = 100  # 单张雪碧图最多容纳的缩略图数量，超出后分页
+CROP_MAX_SIDE = 320  # 目标截图的最长边
+
+# -------------------------------
+# 实时摄像头配置
+# -------------------------------
+# 默认摄像头源：设备号 / RTSP 地址 / 本地视频文件（循环播放，便于测试）
+DEFAULT_CAMERA_SOURCE = os.getenv("CAMERA_SOURCE", "0")
+LIVE_IMGSZ = 416  # 实时推理输入尺寸
+LIVE_CONF = 0.25  # 实时推理置信度
+LIVE_MAX_BATCH = 16  # 跨摄像头合批推理的最大批大小
+# 自适应推理控制：目标检测频率、最大滞后，以及可选的输入尺寸档位
+LIVE_TARGET_HZ = 10.0
+LIVE_MAX_STALENESS_MS = 150.0
+LIVE_IMGSZ_LADDER = (320, 416, 512, 640)
+# 最后一个订阅者（画面流 / WebSocket / 事件录像 / 手动启动）离开后，多少秒关闭摄像头和推理
+CAMERA_IDLE_TIMEOUT = float(os.getenv("CAMERA_IDLE_TIMEOUT", "30"))
+# /camera/register 只接受白名单内的源（环境变量中逗号分隔），默认摄像头 CAMERA_SOURCE 不受限制
+# 本地设备号
+CAMERA_ALLOWED_DEVICES = [d.strip() for d in os.getenv("CAMERA_ALLOWED_DEVICES", "0,1,2,3").split(",") if d.strip()]
+# 网络流的协议和主机（主机支持通配符，如 192.168.1.*），默认不允许任何主机
+CAMERA_ALLOWED_SCHEMES = [s.strip().lower() for s in os.getenv("CAMERA_ALLOWED_SCHEMES", "rtsp,rtsps").split(",")
+                          if s.strip()]
+CAMERA_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv("CAMERA_ALLOWED_HOSTS", "").split(",") if h.strip()]
+# 本地视频文件只能来自这个目录
+CAMERA_FILE_DIR = os.getenv("CAMERA_FILE_DIR", os.path.join(BASE_DIR, "static", "camera_sources"))
+
+# -------------------------------
+# 事件触发录像配置
+# -------------------------------
+EVENT_PRE_ROLL = 5.0  # 触发前保留的秒数
+EVENT_POST_ROLL = 5.0  # 最后一次命中后继续录制的秒数
+EVENT_MAX_DURATION = 120.0  # 单个事件的最长时长（秒）
+EVENT_BUFFER_MAX_MB = 32  # 每路摄像头预录环形缓冲区的内存上限
+EVENT_JPEG_QUALITY = 80  # 缓冲区中帧的 JPEG 质量
+
 # -------------------------------
 # 数据库配置
 # -------------------------------
@@ -22,4 +81,66 @@ for directory in [UPLOAD_DIR, RESULT_DIR, CAMERA_DIR]:
 DB_DIR = os.path.join(BASE_DIR, "db")
 os.makedirs(DB_DIR, exist_ok=True)
 
-DATABASE_URL = f"sqlite:///{os.path.join(DB_DIR, 'example.db')}"
\ No newline at end of file
+DATABASE_URL = f"sqlite:///{os.path.join(DB_DIR, 'example.db')}"
+
+# 连接池（MySQL 等服务端数据库使用，SQLite 忽略）
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 20
+DB_POOL_RECYCLE = 3600  # 秒，避免使用被服务端关闭的连接
+# 后台批量写入：单个事务最多合并的写操作数
+DB_WRITE_MAX_BATCH = 200
+# 记录列表总数缓存：写入/删除时立即失效，TTL 兜住其它进程或手工改库造成的偏差
+RECORD_COUNT_CACHE_TTL = float(os.getenv("RECORD_COUNT_CACHE_TTL", "60"))
+# 目标检索单次请求最多扫描的检测行数，筛选条件很稀疏时分多次请求翻完
+DETECTION_SEARCH_SCAN_LIMIT = 200000
+
+# -------------------------------
+# 存储生命周期（保留策略 / 配额 / 孤儿文件清理）
+# -------------------------------
+# 后台的保留策略、配额/低空间淘汰和孤儿清理都会删除记录或文件，默认关闭，需要时设 STORAGE_LIFECYCLE_ENABLED=1；
+# 关闭时手动提交的批量删除任务照常执行
+STORAGE_LIFECYCLE_ENABLED = os.getenv("STORAGE_LIFECYCLE_ENABLED", "0") == "1"
+# 各类型记录的保留天数，0 表示永久保留（默认全部永久保留）；用环境变量开启，如 RETENTION_DAYS='{"camera": 30}'
+RETENTION_DAYS = {
+    "image": 0,
+    "video": 0,
+    "video_clip": 0,
+    "camera": 0,
+    "camera_event": 0,
+    **json.loads(os.getenv("RETENTION_DAYS", "{}"))
+}
+RETENTION_INTERVAL = 600  # 秒，多久执行一次保留策略
+STORAGE_QUOTA_GB = float(os.getenv("STORAGE_QUOTA_GB", "0"))  # 托管目录总占用上限，0 表示不限
+STORAGE_MIN_FREE_GB = float(os.getenv("STORAGE_MIN_FREE_GB", "0"))  # 磁盘剩余空间下限，0 表示不检查
+# 没有记录引用的文件超过该时长才算孤儿，给处理中的上传/视频留出时间
+ORPHAN_GRACE_SECONDS = float(os.getenv("ORPHAN_GRACE_SECONDS", str(12 * 3600)))
+UPLOAD_SESSION_TTL = 24 * 3600  # 秒，未完成的分块上传会话保留时长
+STORAGE_SWEEP_BATCH = 2000  # 巡检每次处理的目录项数
+STORAGE_SWEEP_INTERVAL = 3600  # 秒，一轮巡检结束后隔多久开始下一轮
+STORAGE_TICK = 5.0  # 秒，后台线程的工作周期
+
+# ========== 批量导出 ==========
+EXPORT_BATCH_SIZE = 1000  # 每次从数据库读取的记录数，读完即释放连接
+EXPORT_FLUSH_BYTES = 256 * 1024  # 输出缓冲攒到这么大再发送
+
+# ========== 记录缩略图 ==========
+THUMB_MAX_SIDE = 320  # 缩略图最长边
+THUMB_QUALITY = 70  # WebP / JPEG 质量
+THUMB_POSTER_POSITION = 0.1  # 视频封面取自时长的这个位置
+THUMB_BACKFILL_ENABLED = os.getenv("THUMB_BACKFILL_ENABLED", "1") != "0"
+THUMB_BACKFILL_BATCH = 50  # 回填每批处理的记录数
+
+# ========== 请求追踪 / 慢请求 ==========
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))  # 超过该耗时的请求写入慢请求日志，0 表示关闭
+SLOW_REQUEST_LOG = os.path.join(LOG_DIR, "slow_requests.log")
+# 为慢请求附带采样得到的调用栈（有请求在处理时后台线程定时采样所有线程）
+SLOW_REQUEST_PROFILE = os.getenv("SLOW_REQUEST_PROFILE", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))  # 采样间隔
+PROFILE_TOP_STACKS = 20  # 慢请求日志里最多保留的调用栈数
+
+# ========== 模型加载 ==========
+# 启动后在后台线程加载模型；关闭时在第一次推理时才加载（--reload 开发时重启更快）
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1") != "0"
+# 加载后用空白图推理一次（CUDA 初始化、算子选择），第一个请求不再承担这部分耗时
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") != "0"
+MODEL_WARMUP_IMGSZ = 640
\ No newline at end of file
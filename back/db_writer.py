@@ -0,0 +1,287 @@
+"""
+检测记录的后台批量写入（write-behind）
+
+请求线程只把写操作放入队列并拿到一个 Future，后台线程把队列中已积压的操作合并成一个事务提交：
+负载低时每个操作单独提交、没有额外延迟；并发高时自然合批，SQLite 写锁和 fsync 次数随之减少
+"""
+import os
+import json
+import queue
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import Future
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from config import DB_WRITE_MAX_BATCH
+from sqlalchemy import insert, update, select
+from db import engine
+from models import DetectRecord
+from detection_index import index_records, unindex_records
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def summarize_objects(objects) -> Tuple[int, Dict[str, int]]:
+    """
+    从 objects 计算目标数和按类别计数
+    图片/抓拍是检测列表；视频按跟踪目标计；事件录像按目标 id 去重；片段是单个目标
+    """
+    if isinstance(objects, str):
+        try:
+            objects = json.loads(objects)
+        except ValueError:
+            return 0, {}
+    if isinstance(objects, list):
+        items = objects
+    elif isinstance(objects, dict):
+        if "track_ranges" in objects:
+            items = list(objects["track_ranges"].values())
+        elif "detections" in objects:
+            detections = objects["detections"] or []
+            items = list({d.get("id", i): d for i, d in enumerate(detections)}.values())
+        elif "class" in objects:
+            items = [objects]
+        elif "total_tracks" in objects:
+            # 早期的视频记录只有目标总数
+            return int(objects["total_tracks"] or 0), {}
+        else:
+            items = []
+    else:
+        items = []
+
+    class_counts: Dict[str, int] = {}
+    for item in items:
+        if isinstance(item, dict) and item.get("class") is not None:
+            class_counts[item["class"]] = class_counts.get(item["class"], 0) + 1
+    return len(items), class_counts
+
+
+def summarize_file(path: Optional[str]) -> Tuple[bool, Optional[int]]:
+    if not path:
+        return False, None
+    try:
+        return True, os.path.getsize(path)
+    except OSError:
+        return False, None
+
+
+def _with_summary(fields: Dict[str, Any], inserting: bool) -> Dict[str, Any]:
+    """补齐摘要列；调用方显式传入的值优先"""
+    fields = dict(fields)
+    if "objects" in fields and "detection_count" not in fields:
+        fields["detection_count"], fields["class_counts"] = summarize_objects(fields["objects"])
+    if inserting and "result_available" not in fields:
+        fields["result_available"], fields["file_size"] = summarize_file(fields.get("result_path"))
+    return fields
+
+
+def _insert_records(conn, rows: List[Dict[str, Any]]) -> List[Tuple[int, Optional[datetime]]]:
+    """
+    插入一组字段相同的记录，按参数顺序返回 (id, detect_time)
+    支持 INSERT ... RETURNING 的数据库（SQLite、PostgreSQL、MariaDB 10.5+）整组一条语句；
+    MySQL 不支持 RETURNING，逐条插入，用 lastrowid 取回 id
+    """
+    if conn.dialect.insert_executemany_returning_sort_by_parameter_order:
+        return conn.execute(
+            insert(DetectRecord).returning(DetectRecord.id, DetectRecord.detect_time, sort_by_parameter_order=True),
+            rows
+        ).all()
+    returned = []
+    for row in rows:
+        # detect_time 的默认值本来就在 Python 侧生成，这里先填上，插入后不用再查回来
+        row = {"detect_time": datetime.utcnow(), **row}
+        result = conn.execute(insert(DetectRecord).values(**row))
+        returned.append((result.lastrowid, row["detect_time"]))
+    return returned
+
+
+class _WriteOp(NamedTuple):
+    kind: str  # insert / update
+    record_id: Optional[int]
+    fields: Dict[str, Any]
+    future: Future
+
+
+class RecordWriter:
+    """
+    submit_insert / submit_update 返回 concurrent.futures.Future（后台线程中可直接 .result()）
+    insert / update 是对应的协程版本，供异步路由 await
+    """
+
+    def __init__(self, bind=engine, max_batch: int = DB_WRITE_MAX_BATCH):
+        self.engine = bind
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[_WriteOp]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        self.batches = 0
+        self.ops_written = 0
+        self.last_batch_size = 0
+        # 记录条数变化的版本号：每次提交了插入或有记录被删除时加一，列表页的计数缓存据此失效
+        self.generation = 0
+        # 一次事务（一批写操作）从执行到提交的耗时
+        self._commit_seconds = metrics.STAGE_SECONDS.labels("record_writer", "db_commit")
+
+    # ---------- 提交 ----------
+
+    def submit_insert(self, **fields) -> Future:
+        """插入一条 DetectRecord，Future 的结果是记录 id"""
+        return self._submit(_WriteOp("insert", None, fields, Future()))
+
+    def submit_update(self, record_id: int, **fields) -> Future:
+        """更新一条 DetectRecord，记录不存在时 Future 抛出 LookupError"""
+        return self._submit(_WriteOp("update", record_id, fields, Future()))
+
+    async def insert(self, **fields) -> int:
+        return await asyncio.wrap_future(self.submit_insert(**fields))
+
+    async def update(self, record_id: int, **fields):
+        return await asyncio.wrap_future(self.submit_update(record_id, **fields))
+
+    def _submit(self, op: _WriteOp) -> Future:
+        self._ensure_running()
+        self._queue.put(op)
+        return op.future
+
+    # ---------- 生命周期 ----------
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """写完队列中已有的操作后退出"""
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(None)
+        thread.join(timeout=timeout)
+        self._thread = None
+
+    def mark_changed(self):
+        """绕过写线程增删记录后调用（如删除接口），让计数缓存失效"""
+        self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "ops_written": self.ops_written,
+            "last_batch_size": self.last_batch_size,
+            "generation": self.generation
+        }
+
+    # ---------- 后台线程 ----------
+
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            batch = [op]
+            stopping = False
+            # 只合并已经在排队的操作，不为凑批而等待
+            while len(batch) < self.max_batch:
+                try:
+                    op = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is None:
+                    stopping = True
+                    break
+                batch.append(op)
+
+            batch = [op for op in batch if op.future.set_running_or_notify_cancel()]
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch: List[_WriteOp]):
+        try:
+            with self._commit_seconds.time():
+                results = self._apply(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"❌ 数据库写入失败: {e}")
+                batch[0].future.set_exception(e)
+                return
+            # 整批失败时逐条重试，只让出错的那一条失败
+            logger.warning(f"⚠️ 批量写入失败，逐条重试 ({len(batch)} 条): {e}")
+            for op in batch:
+                self._write([op])
+            return
+
+        self.batches += 1
+        self.ops_written += len(batch)
+        self.last_batch_size = len(batch)
+        # 先让计数缓存失效再唤醒调用方，保证调用方随后查到的总数包含自己的插入
+        if any(op.kind == "insert" for op in batch):
+            self.mark_changed()
+        for op, result in zip(batch, results):
+            if isinstance(result, Exception):
+                op.future.set_exception(result)
+            else:
+                op.future.set_result(result)
+
+    def _apply(self, batch: List[_WriteOp]) -> List[Any]:
+        """
+        整批在一个事务里执行：字段相同的插入合并成一条 INSERT ... RETURNING（MySQL 逐条插入，见 _insert_records）
+        后台线程每次调用数据库驱动都会释放并重新争抢 GIL，语句越少，
+        在事件循环繁忙时排队等待的次数越少
+        """
+        results: List[Any] = [None] * len(batch)
+        # 摘要在写线程里计算（解析 JSON、读取文件大小），不占用请求线程
+        fields = [_with_summary(op.fields, op.kind == "insert") for op in batch]
+        inserts: Dict[tuple, List[int]] = {}
+        for i, op in enumerate(batch):
+            if op.kind == "insert":
+                inserts.setdefault(tuple(sorted(fields[i])), []).append(i)
+
+        with self.engine.begin() as conn:
+            indexed = []
+            for indexes in inserts.values():
+                returned = _insert_records(conn, [fields[i] for i in indexes])
+                for i, (record_id, detect_time) in zip(indexes, returned):
+                    results[i] = record_id
+                    indexed.append((record_id, fields[i].get("type"), detect_time, fields[i].get("objects")))
+            # 检测表与记录在同一个事务里写入
+            index_records(conn, indexed)
+
+            reindex = []
+            for i, op in enumerate(batch):
+                if op.kind != "update":
+                    continue
+                count = conn.execute(
+                    update(DetectRecord).where(DetectRecord.id == op.record_id).values(**fields[i])
+                ).rowcount
+                results[i] = count if count else LookupError(f"记录 {op.record_id} 不存在")
+                if count and "objects" in fields[i]:
+                    reindex.append(op.record_id)
+            if reindex:
+                unindex_records(conn, reindex)
+                index_records(conn, conn.execute(
+                    select(DetectRecord.id, DetectRecord.type, DetectRecord.detect_time, DetectRecord.objects)
+                    .where(DetectRecord.id.in_(reindex))
+                ).all())
+        return results
+
+
+record_writer = RecordWriter()
+
+
+def _writer_metrics():
+    stats = record_writer.stats()
+    yield ("record_writer_queue_depth", "Write operations waiting for the background writer",
+           [({}, stats["pending"])])
+    yield ("record_writer_last_batch_size", "Operations merged into the last transaction",
+           [({}, stats["last_batch_size"])])
+
+
+metrics.register_collector(_writer_metrics)
@@ -0,0 +1,192 @@
+"""
+检测表（detection）和按小时/天聚合的计数表（detection_stat）的维护
+
+记录写入、更新 objects、删除时在同一个事务里调用，保证两张表与 detect_record 一致：
+  index_records   把记录的 objects 展开写入 detection，并累加 detection_stat
+  unindex_records 删除记录对应的 detection 行，并从 detection_stat 中扣除
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import insert, update, delete, select, and_
+from sqlalchemy.engine import Connection
+from models import Detection, DetectionStat
+
+CONF_BINS = 10
+UNKNOWN_CONF_BIN = -1
+# SQLite 单条语句的绑定参数数量有限，按 id 批量操作时分段
+ID_CHUNK = 500
+
+_detection_table = Detection.__table__
+_stat_table = DetectionStat.__table__
+_stat_keys = ("period", "bucket", "type", "class_name", "conf_bin")
+
+
+def _load(objects) -> Any:
+    # 旧代码把 json.dumps 的结果再存进 JSON 列，可能需要解两层
+    while isinstance(objects, str):
+        try:
+            objects = json.loads(objects)
+        except ValueError:
+            return None
+    return objects
+
+
+def _bbox(value) -> Tuple[Optional[int], ...]:
+    if isinstance(value, (list, tuple)) and len(value) == 4:
+        try:
+            return tuple(int(v) for v in value)
+        except (TypeError, ValueError):
+            pass
+    return None, None, None, None
+
+
+def _row(class_name, confidence, bbox, track_id=None, frame=None) -> Dict[str, Any]:
+    x1, y1, x2, y2 = _bbox(bbox)
+    area = (x2 - x1) * (y2 - y1) if x1 is not None else None
+    return {
+        "class_name": str(class_name),
+        "confidence": float(confidence) if confidence is not None else None,
+        "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+        "area": area,
+        "track_id": int(track_id) if track_id is not None else None,
+        "frame": int(frame) if frame is not None else None
+    }
+
+
+def extract_detections(objects) -> List[Dict[str, Any]]:
+    """
+    把 objects 展开成 detection 行（不含 record_id/type/detect_time），口径与 summarize_objects 一致：
+    图片/抓拍每个框一行；视频每个跟踪目标一行；事件录像按目标 id 去重取最高置信度；
+    视频片段只是原视频中某个目标的截取，不重复计入
+    """
+    objects = _load(objects)
+    rows = []
+    if isinstance(objects, list):
+        for item in objects:
+            if isinstance(item, dict) and item.get("class") is not None:
+                rows.append(_row(item["class"], item.get("confidence", item.get("conf")),
+                                 item.get("bbox"), item.get("track_id")))
+    elif isinstance(objects, dict) and "track_ranges" in objects:
+        for track_id, track in (objects["track_ranges"] or {}).items():
+            if isinstance(track, dict) and track.get("class") is not None:
+                rows.append(_row(track["class"], track.get("max_conf"), track.get("bbox"),
+                                 track_id, track.get("first_frame")))
+    elif isinstance(objects, dict) and "detections" in objects:
+        best: Dict[Any, Dict[str, Any]] = {}
+        for i, det in enumerate(objects["detections"] or []):
+            if not isinstance(det, dict) or det.get("class") is None:
+                continue
+            key = det.get("id", f"#{i}")
+            if key not in best or (det.get("conf") or 0) > (best[key].get("conf") or 0):
+                best[key] = det
+        for det in best.values():
+            rows.append(_row(det["class"], det.get("conf"), det.get("bbox"), det.get("id")))
+    return rows
+
+
+def conf_bin(confidence: Optional[float]) -> int:
+    if confidence is None:
+        return UNKNOWN_CONF_BIN
+    return min(CONF_BINS - 1, max(0, int(confidence * CONF_BINS)))
+
+
+def hour_bucket(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_deltas(deltas: Dict[tuple, int], record_type, detect_time, detections: Iterable[Tuple[str, Any]], sign: int):
+    """detections 为同一条记录的 (class_name, confidence)，整点/零点只算一次"""
+    if detect_time is None:
+        return
+    hour, day = ("hour", hour_bucket(detect_time)), ("day", day_bucket(detect_time))
+    record_type = record_type or ""
+    for class_name, confidence in detections:
+        rest = (record_type, class_name, conf_bin(confidence))
+        for key in (hour + rest, day + rest):
+            deltas[key] = deltas.get(key, 0) + sign
+
+
+def _apply_stat_deltas(conn: Connection, deltas: Dict[tuple, int]):
+    """把计数增量合并进 detection_stat：SQLite/MySQL 用 upsert，其它数据库先 update 再补 insert"""
+    rows = [dict(zip(_stat_keys, key), count=count) for key, count in deltas.items() if count]
+    if not rows:
+        return
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(_stat_table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(_stat_keys),
+            set_={"count": _stat_table.c.count + stmt.excluded["count"]}
+        )
+        conn.execute(stmt, rows)
+    elif dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert as upsert
+        stmt = upsert(_stat_table)
+        stmt = stmt.on_duplicate_key_update(count=_stat_table.c.count + stmt.inserted["count"])
+        conn.execute(stmt, rows)
+    else:
+        for row in rows:
+            match = and_(*(_stat_table.c[k] == row[k] for k in _stat_keys))
+            updated = conn.execute(
+                update(_stat_table).where(match).values(count=_stat_table.c.count + row["count"])
+            ).rowcount
+            if not updated:
+                conn.execute(insert(_stat_table).values(**row))
+
+    # 扣减后归零的行删掉，只查本次涉及的桶（按主键前缀定位）
+    touched: Dict[str, set] = {}
+    for row in rows:
+        if row["count"] < 0:
+            touched.setdefault(row["period"], set()).add(row["bucket"])
+    for period, buckets in touched.items():
+        conn.execute(delete(_stat_table).where(
+            _stat_table.c.period == period,
+            _stat_table.c.bucket.in_(sorted(buckets)),
+            _stat_table.c.count <= 0
+        ))
+
+
+def index_records(conn: Connection, records: Iterable[Tuple[int, Optional[str], Optional[datetime], Any]]) -> int:
+    """records 为 (record_id, type, detect_time, objects)，返回写入的 detection 行数"""
+    rows = []
+    deltas: Dict[tuple, int] = {}
+    for record_id, record_type, detect_time, objects in records:
+        detections = extract_detections(objects)
+        for row in detections:
+            row.update(record_id=record_id, type=record_type, detect_time=detect_time)
+        rows.extend(detections)
+        _add_deltas(deltas, record_type, detect_time,
+                    ((row["class_name"], row["confidence"]) for row in detections), 1)
+    if rows:
+        conn.execute(insert(_detection_table), rows)
+        _apply_stat_deltas(conn, deltas)
+    return len(rows)
+
+
+def unindex_records(conn: Connection, record_ids: Sequence[int]) -> int:
+    """删除记录对应的 detection 行并扣减聚合计数，返回删除的行数"""
+    removed = 0
+    deltas: Dict[tuple, int] = {}
+    ids = list(record_ids)
+    for start in range(0, len(ids), ID_CHUNK):
+        chunk = ids[start:start + ID_CHUNK]
+        where = _detection_table.c.record_id.in_(chunk)
+        # 同一记录的目标 type、detect_time 相同，按记录聚合后再扣减
+        by_record: Dict[int, list] = {}
+        for record_id, record_type, detect_time, class_name, confidence in conn.execute(select(
+            _detection_table.c.record_id, _detection_table.c.type, _detection_table.c.detect_time,
+            _detection_table.c.class_name, _detection_table.c.confidence
+        ).where(where)):
+            by_record.setdefault(record_id, [record_type, detect_time, []])[2].append((class_name, confidence))
+            removed += 1
+        for record_type, detect_time, detections in by_record.values():
+            _add_deltas(deltas, record_type, detect_time, detections, -1)
+        conn.execute(delete(_detection_table).where(where))
+    _apply_stat_deltas(conn, deltas)
+    return removed
@@ -0,0 +1,339 @@
+"""
+实时摄像头的事件触发录像
+
+每路摄像头在内存中保留最近几秒编码后的 JPEG 帧（环形缓冲区，同时受时长和字节数限制），
+检测结果命中规则时，把预录部分和之后的帧交给后台编码线程写成片段，
+最后一次命中后再录制 post_roll 秒结束
+"""
+import os
+import math
+import json
+import time
+import queue
+import logging
+import threading
+import cv2
+import numpy as np
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from config import (CAMERA_DIR, EVENT_PRE_ROLL, EVENT_POST_ROLL, EVENT_MAX_DURATION,
+                    EVENT_BUFFER_MAX_MB, EVENT_JPEG_QUALITY)
+from analytics import _point_in_polygon, _anchor_point, _entries, _points, _classes
+
+logger = logging.getLogger(__name__)
+
+# 单个事件里保留的检测记录条数上限
+MAX_EVENT_DETECTIONS = 500
+
+
+def _number(raw: Dict[str, Any], key: str, default: float, label: str = "") -> float:
+    value = raw.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{label}{key} 必须是数字")
+    return float(value)
+
+
+def parse_event_config(raw) -> Optional[Dict[str, Any]]:
+    """
+    解析并校验事件录像配置，raw 可以是 JSON 字符串或 dict，非法时（包括字段类型不对）抛出 ValueError
+
+    {
+        "rules": [{"name": "person_in_area", "classes": ["person"], "min_conf": 0.5,
+                   "zone": [[x, y], ...]}],
+        "pre_roll": 5,
+        "post_roll": 5,
+        "max_duration": 120,
+        "buffer_mb": 32
+    }
+    """
+    if raw is None or raw == "":
+        return None
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"事件配置不是合法的 JSON: {e}")
+    if not isinstance(raw, dict):
+        raise ValueError("事件配置必须是对象")
+
+    rules = []
+    for i, rule in enumerate(_entries(raw, "rules", "规则")):
+        label = f"第 {i + 1} 条规则"
+        zone = rule.get("zone")
+        if zone is not None:
+            zone = _points(zone, f"{label}的区域至少需要三个顶点 [[x, y], ...]", 3)
+        min_conf = _number(rule, "min_conf", 0.0, f"{label}的 ")
+        if not 0.0 <= min_conf <= 1.0:
+            raise ValueError(f"{label}的 min_conf 必须在 0~1 之间")
+        rules.append({
+            "name": str(rule.get("name") or f"rule_{i + 1}"),
+            "classes": _classes(rule.get("classes"), label),
+            "min_conf": min_conf,
+            "zone": zone or None
+        })
+    if not rules:
+        raise ValueError("至少需要一条触发规则")
+
+    pre_roll = _number(raw, "pre_roll", EVENT_PRE_ROLL)
+    post_roll = _number(raw, "post_roll", EVENT_POST_ROLL)
+    max_duration = _number(raw, "max_duration", EVENT_MAX_DURATION)
+    buffer_mb = _number(raw, "buffer_mb", EVENT_BUFFER_MAX_MB)
+    if pre_roll < 0 or post_roll < 0:
+        raise ValueError("pre_roll 和 post_roll 不能为负数")
+    if max_duration <= 0 or buffer_mb <= 0:
+        raise ValueError("max_duration 和 buffer_mb 必须大于 0")
+
+    return {
+        "rules": rules,
+        "pre_roll": pre_roll,
+        "post_roll": post_roll,
+        "max_duration": max_duration,
+        "buffer_mb": buffer_mb
+    }
+
+
+class EventRecorder:
+    """
+    单路摄像头的事件录像器
+    内存上限：环形缓冲区和待编码队列各不超过 buffer_mb，编码跟不上时丢弃新帧而不是累积
+    """
+
+    def __init__(self, camera, config: Dict[str, Any],
+                 on_event: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.camera = camera
+        self.config = config
+        self.rules = config["rules"]
+        self.pre_roll = config["pre_roll"]
+        self.post_roll = config["post_roll"]
+        self.max_duration = config["max_duration"]
+        self.max_bytes = int(config["buffer_mb"] * 1024 * 1024)
+        self.on_event = on_event
+
+        self.lock = threading.Lock()
+        # (采集时间, JPEG 字节)
+        self.ring: deque = deque()
+        self.ring_bytes = 0
+        self.active: Optional[Dict[str, Any]] = None
+        self.events: deque = deque(maxlen=50)
+        self.dropped_frames = 0
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._buffer_loop,
+                                        name=f"event-buffer-{self.camera.cam_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止缓冲；进行中的事件按已录制的部分收尾"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self._thread = None
+        with self.lock:
+            if self.active is not None:
+                self._close_event(self.active, time.time())
+            self.ring.clear()
+            self.ring_bytes = 0
+
+    # ---------- 规则匹配（推理线程调用） ----------
+
+    def match(self, detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        hits = []
+        for det in detections:
+            for rule in self.rules:
+                if rule["classes"] and det["class"] not in rule["classes"]:
+                    continue
+                if det["conf"] < rule["min_conf"]:
+                    continue
+                if rule["zone"] and not _point_in_polygon(_anchor_point(det["bbox"], "bottom"), rule["zone"]):
+                    continue
+                hits.append({"rule": rule["name"], **det})
+                break
+        return hits
+
+    def on_detections(self, frame_time: float, detections: List[Dict[str, Any]]):
+        hits = self.match(detections)
+        if not hits:
+            return
+        with self.lock:
+            event = self.active
+            if event is None:
+                event = self._open_event(frame_time)
+            event["last_match"] = max(event["last_match"], frame_time)
+            for hit in hits:
+                event["rules"].add(hit["rule"])
+                if len(event["detections"]) < MAX_EVENT_DETECTIONS:
+                    event["detections"].append({"time": round(frame_time, 3), **hit})
+
+    # ---------- 缓冲线程 ----------
+
+    def _buffer_loop(self):
+        last_seq = 0
+        while not self._stop.is_set():
+            item = self.camera.frames.wait_newer(last_seq, timeout=0.5)
+            if item is None:
+                # 画面中断时也要按时结束事件
+                with self.lock:
+                    if self.active is not None and time.time() > self.active["last_match"] + self.post_roll:
+                        self._close_event(self.active, time.time())
+                continue
+            frame, last_seq, frame_time = item
+            ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), EVENT_JPEG_QUALITY])
+            if not ret:
+                continue
+            payload = buffer.tobytes()
+
+            with self.lock:
+                self.ring.append((frame_time, payload))
+                self.ring_bytes += len(payload)
+                # 只保留 pre_roll 秒，且总字节数不超过上限
+                while self.ring and (self.ring_bytes > self.max_bytes
+                                     or frame_time - self.ring[0][0] > self.pre_roll):
+                    _, old = self.ring.popleft()
+                    self.ring_bytes -= len(old)
+
+                event = self.active
+                if event is None:
+                    continue
+                if (frame_time > event["last_match"] + self.post_roll
+                        or frame_time - event["start_time"] > self.max_duration):
+                    self._close_event(event, frame_time)
+                else:
+                    self._enqueue(event, frame_time, payload)
+
+    # ---------- 事件（调用方持有 self.lock） ----------
+
+    def _open_event(self, trigger_time: float) -> Dict[str, Any]:
+        cam_id = self.camera.cam_id
+        event_id = f"event_{cam_id}_{int(trigger_time * 1000)}"
+        event = {
+            "event_id": event_id,
+            "cam_id": cam_id,
+            "status": "recording",
+            "trigger_time": trigger_time,
+            "start_time": trigger_time,
+            "end_time": None,
+            "last_match": trigger_time,
+            "rules": set(),
+            "detections": [],
+            "frames": 0,
+            "dropped_frames": 0,
+            "clip_path": os.path.join(CAMERA_DIR, f"{event_id}.mp4"),
+            "queue": queue.Queue(),
+            "pending_bytes": 0
+        }
+        # 预录部分直接从环形缓冲区取
+        for frame_time, payload in self.ring:
+            if frame_time >= trigger_time - self.pre_roll:
+                if event["frames"] == 0:
+                    event["start_time"] = frame_time
+                self._enqueue(event, frame_time, payload)
+
+        self.active = event
+        self.events.append(event)
+        threading.Thread(target=self._encode_event, args=(event,),
+                         name=f"event-encoder-{cam_id}", daemon=True).start()
+        logger.info(f"🎬 摄像头 {cam_id} 触发事件录像: {event_id}")
+        return event
+
+    def _enqueue(self, event: Dict[str, Any], frame_time: float, payload: bytes):
+        if event["pending_bytes"] + len(payload) > self.max_bytes:
+            event["dropped_frames"] += 1
+            self.dropped_frames += 1
+            return
+        event["pending_bytes"] += len(payload)
+        event["frames"] += 1
+        event["queue"].put((frame_time, payload))
+
+    def _close_event(self, event: Dict[str, Any], end_time: float):
+        event["status"] = "encoding"
+        event["end_time"] = end_time
+        event["queue"].put(None)
+        if self.active is event:
+            self.active = None
+
+    # ---------- 编码线程 ----------
+
+    def _encode_event(self, event: Dict[str, Any]):
+        temp_path = event["clip_path"].replace(".mp4", "_temp.mp4")
+        fps = self.camera.capture_fps or 25
+        writer = None
+        written = 0
+        try:
+            while True:
+                item = event["queue"].get()
+                if item is None:
+                    break
+                _, payload = item
+                with self.lock:
+                    event["pending_bytes"] -= len(payload)
+                frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    continue
+                if writer is None:
+                    h, w = frame.shape[:2]
+                    writer = cv2.VideoWriter(temp_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+                writer.write(frame)
+                written += 1
+            if writer is not None:
+                writer.release()
+                writer = None
+            if written == 0:
+                raise RuntimeError("事件片段没有可写入的帧")
+
+            event["frames"] = written
+            event["temp_path"] = temp_path
+            if self.on_event is not None:
+                self.on_event(event)
+            event["status"] = "completed"
+            logger.info(f"✅ 事件片段已保存: {event['clip_path']} ({written} 帧)")
+        except Exception as e:
+            logger.error(f"❌ 事件片段保存失败 {event['event_id']}: {e}")
+            event["status"] = "failed"
+            event["error"] = str(getattr(e, "detail", e))
+        finally:
+            if writer is not None:
+                writer.release()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    # ---------- 状态 ----------
+
+    @staticmethod
+    def summarize(event: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "event_id": event["event_id"],
+            "status": event["status"],
+            "trigger_time": event["trigger_time"],
+            "start_time": event["start_time"],
+            "end_time": event["end_time"],
+            "rules": sorted(event["rules"]),
+            "frames": event["frames"],
+            "dropped_frames": event["dropped_frames"],
+            "detections": len(event["detections"]),
+            "record_id": event.get("record_id"),
+            "result_url": event.get("result_url"),
+            "error": event.get("error")
+        }
+
+    def info(self) -> Dict[str, Any]:
+        with self.lock:
+            buffered_seconds = self.ring[-1][0] - self.ring[0][0] if len(self.ring) > 1 else 0.0
+            return {
+                "config": self.config,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "recording": self.active is not None,
+                "buffered_frames": len(self.ring),
+                "buffered_seconds": round(buffered_seconds, 2),
+                "buffered_bytes": self.ring_bytes,
+                "max_bytes": self.max_bytes,
+                "dropped_frames": self.dropped_frames,
+                "events": [self.summarize(event) for event in reversed(self.events)]
+            }
@@ -0,0 +1,173 @@
+"""
+上传/结果文件的 HTTP 缓存与分段传输
+
+Starlette 0.37 的 FileResponse 不支持 Range，浏览器拖动视频进度条时只能从头重新下载整个文件；
+ETag 是大小和修改时间的 md5，每次请求都要重算，也不带缓存策略。这里补上：
+  - 强 ETag：内容寻址的文件直接用摘要，其它文件用 大小-修改时间(ns)；条件请求返回 304
+  - Cache-Control：内容寻址的路径、以及带当前版本号 ?v= 的 URL 永不变化，返回一年的 immutable；
+    其它 URL 返回 no-cache，浏览器可以缓存但每次用 ETag 校验
+  - 单段 Range 和 If-Range，返回 206；多段请求按整个文件返回（RFC 允许），越界返回 416
+  - 服务器支持 ASGI 的 zerocopysend 扩展时用 sendfile 零拷贝发送，否则按大块读文件
+"""
+import os
+import re
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+import anyio
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+CHUNK_SIZE = 256 * 1024
+
+_BLOB_NAME = re.compile(r"^([0-9a-f]{64})(\.\w+)?$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def blob_digest(path: str) -> Optional[str]:
+    """内容寻址路径（.../ab/cd/<摘要>.ext，见 blob_store）的摘要，其它路径返回 None"""
+    match = _BLOB_NAME.match(os.path.basename(path))
+    if not match:
+        return None
+    digest = match.group(1)
+    parent, second = os.path.split(os.path.dirname(path))
+    if second != digest[2:4] or os.path.basename(parent) != digest[:2]:
+        return None
+    return digest
+
+
+def file_version(stat_result: os.stat_result) -> str:
+    return f"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+
+
+def versioned_url(url: str, path: str) -> str:
+    """给非内容寻址的文件 URL 加上版本号，文件不变时 URL 不变，可以长缓存；文件不存在时原样返回"""
+    if blob_digest(path):
+        return url
+    try:
+        return f"{url}?v={file_version(os.stat(path))}"
+    except OSError:
+        return url
+
+
+def _parse_range(value: str, size: int):
+    """
+    解析单段 Range，返回 (start, end)（含 end）；无法识别或多段时返回 None（按整个文件返回），
+    越界返回 False（416）
+    """
+    match = _RANGE.match(value.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N：最后 N 个字节
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _not_modified(headers: Headers, etag: str, mtime: float) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        # 有 If-None-Match 时忽略 If-Modified-Since
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= int(mtime)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class RangeFileResponse(FileResponse):
+    """发送文件的 [start, start + length) 部分"""
+
+    def __init__(self, path: str, stat_result: os.stat_result, start: int, length: int, **kwargs):
+        super().__init__(path, stat_result=stat_result, **kwargs)
+        self.start = start
+        self.length = length
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False
+                })
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.start)
+                remaining = self.length
+                while remaining > 0:
+                    chunk = await file.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    # 文件在发送过程中被截断
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+def file_response(path: str, stat_result: os.stat_result, request_headers: Headers,
+                  version: Optional[str] = None) -> Response:
+    """按缓存和 Range 规则返回文件；version 为 URL 中的 ?v= 参数"""
+    digest = blob_digest(path)
+    current = file_version(stat_result)
+    etag = f'"{digest or current}"'
+    immutable = digest is not None or version == current
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": IMMUTABLE if immutable else REVALIDATE,
+        "accept-ranges": "bytes"
+    }
+    if _not_modified(request_headers, etag, stat_result.st_mtime):
+        return NotModifiedResponse(Headers(headers))
+
+    size = stat_result.st_size
+    byte_range = None
+    range_header = request_headers.get("range")
+    if range_header:
+        if_range = request_headers.get("if-range")
+        # If-Range 与当前版本不一致：文件已变，返回整个文件
+        if if_range is None or if_range.strip() in (etag, headers["last-modified"]):
+            byte_range = _parse_range(range_header, size)
+    if byte_range is False:
+        return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+    if byte_range is None:
+        return RangeFileResponse(path, stat_result, 0, size, headers=headers)
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return RangeFileResponse(path, stat_result, start, end - start + 1, status_code=206, headers=headers)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles 的文件响应换成 file_response：缓存头、条件请求和 Range"""
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        if status_code != 200 or not stat.S_ISREG(stat_result.st_mode):
+            return super().file_response(full_path, stat_result, scope, status_code)
+        version = QueryParams(scope.get("query_string", b"")).get("v")
+        return file_response(str(full_path), stat_result, Headers(scope=scope), version)
@@ -0,0 +1,146 @@
+"""
+视频处理过程中顺带生成的目标截图和缩略图雪碧图
+
+帧已经在内存中，这里只做裁剪和缩放，不需要再次解码源视频
+"""
+import os
+import json
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional
+from config import (GALLERY_DIR, THUMBNAIL_INTERVAL, SPRITE_TILE_WIDTH, SPRITE_COLUMNS,
+                    SPRITE_MAX_TILES, CROP_MAX_SIDE)
+
+
+def get_gallery_dir(video_id: str) -> str:
+    return os.path.join(GALLERY_DIR, video_id)
+
+
+def get_crop_path(video_id: str, display_id: int) -> str:
+    return os.path.join(get_gallery_dir(video_id), f"crop_{display_id}.jpg")
+
+
+def get_sprite_path(video_id: str, sheet: int) -> str:
+    return os.path.join(get_gallery_dir(video_id), f"sprite_{sheet}.jpg")
+
+
+def get_manifest_path(video_id: str) -> str:
+    return os.path.join(get_gallery_dir(video_id), "manifest.json")
+
+
+def load_manifest(video_id: str) -> Optional[Dict[str, Any]]:
+    manifest_path = get_manifest_path(video_id)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _shrink(img, max_side: int):
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+class TrackGallery:
+    """
+    每个 display id 只保留置信度最高的一张截图，每隔固定秒数保留一张缩略图
+    内存占用与目标数量和视频时长/间隔成正比，与帧数无关
+    """
+
+    def __init__(self, video_id: str, width: int, height: int,
+                 interval: float = THUMBNAIL_INTERVAL, tile_width: int = SPRITE_TILE_WIDTH):
+        self.video_id = video_id
+        self.interval = interval
+        self.tile_width = tile_width
+        self.tile_height = max(1, int(round(height * tile_width / width))) if width else tile_width
+        self.best: Dict[int, Dict[str, Any]] = {}
+        self.thumbnails: List[np.ndarray] = []
+        self.thumbnail_times: List[float] = []
+        self._next_thumb_time = 0.0
+
+    def observe(self, frame, frame_idx: int, timestamp: float, detections: List[Dict[str, Any]]):
+        """frame 必须是未绘制检测框的原始帧"""
+        h, w = frame.shape[:2]
+        for det in detections:
+            display_id = det["id"]
+            best = self.best.get(display_id)
+            if best is not None and det["confidence"] <= best["confidence"]:
+                continue
+            x1, y1, x2, y2 = det["bbox"]
+            # 四周留 10% 边距，便于辨认
+            pad_x = int((x2 - x1) * 0.1)
+            pad_y = int((y2 - y1) * 0.1)
+            x1, y1 = max(0, x1 - pad_x), max(0, y1 - pad_y)
+            x2, y2 = min(w, x2 + pad_x), min(h, y2 + pad_y)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            self.best[display_id] = {
+                "display_id": display_id,
+                "class": det["class"],
+                "confidence": det["confidence"],
+                "frame_index": frame_idx,
+                "timestamp": timestamp,
+                "bbox": det["bbox"],
+                "crop": _shrink(frame[y1:y2, x1:x2], CROP_MAX_SIDE).copy()
+            }
+
+        if timestamp >= self._next_thumb_time:
+            self.thumbnails.append(
+                cv2.resize(frame, (self.tile_width, self.tile_height), interpolation=cv2.INTER_AREA)
+            )
+            self.thumbnail_times.append(round(timestamp, 3))
+            self._next_thumb_time += self.interval
+            # 处理速度跟不上时间轴的情况（跳帧）下不补图
+            if self._next_thumb_time < timestamp:
+                self._next_thumb_time = timestamp + self.interval
+
+    def save(self) -> Dict[str, Any]:
+        """写出截图、雪碧图和 manifest，返回 manifest"""
+        out_dir = get_gallery_dir(self.video_id)
+        os.makedirs(out_dir, exist_ok=True)
+
+        tracks = []
+        for display_id in sorted(self.best):
+            item = self.best[display_id]
+            cv2.imwrite(get_crop_path(self.video_id, display_id), item["crop"],
+                        [int(cv2.IMWRITE_JPEG_QUALITY), 85])
+            tracks.append({k: v for k, v in item.items() if k != "crop"})
+
+        sheets = []
+        for sheet, start in enumerate(range(0, len(self.thumbnails), SPRITE_MAX_TILES)):
+            tiles = self.thumbnails[start:start + SPRITE_MAX_TILES]
+            columns = min(SPRITE_COLUMNS, len(tiles))
+            rows = (len(tiles) + columns - 1) // columns
+            canvas = np.zeros((rows * self.tile_height, columns * self.tile_width, 3), dtype=np.uint8)
+            for i, tile in enumerate(tiles):
+                r, c = divmod(i, columns)
+                canvas[r * self.tile_height:(r + 1) * self.tile_height,
+                       c * self.tile_width:(c + 1) * self.tile_width] = tile
+            cv2.imwrite(get_sprite_path(self.video_id, sheet), canvas, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
+            sheets.append({
+                "sheet": sheet,
+                "columns": columns,
+                "rows": rows,
+                "count": len(tiles),
+                "timestamps": self.thumbnail_times[start:start + SPRITE_MAX_TILES]
+            })
+
+        manifest = {
+            "video_id": self.video_id,
+            "interval": self.interval,
+            "tile_width": self.tile_width,
+            "tile_height": self.tile_height,
+            "total_thumbnails": len(self.thumbnails),
+            "sheets": sheets,
+            "tracks": tracks
+        }
+        with open(get_manifest_path(self.video_id), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        # 写盘后释放内存
+        self.best.clear()
+        self.thumbnails = []
+        return manifest
@@ -0,0 +1,150 @@
+"""
+实时推理的自适应控制：根据实测推理耗时、帧到达率和结果滞后，
+调整推理步长（每隔几帧推理一次）和输入尺寸，使检测频率和滞后满足目标
+"""
+import time
+import threading
+from typing import Any, Dict, Iterable, Optional, Sequence
+from config import LIVE_TARGET_HZ, LIVE_MAX_STALENESS_MS, LIVE_IMGSZ_LADDER, LIVE_IMGSZ
+
+
+class AdaptiveRateController:
+    """
+    每个调整周期汇总一次指标：
+    - 达不到目标（频率不足或滞后过大）时先收回步长，再降低输入尺寸
+    - 余量充足时先提高输入尺寸，已是最高档且余量翻倍时再增大步长以节省 CPU
+    视频任务抢占 CPU 时推理变慢，控制器会随之降档，负载消失后再逐步恢复
+    """
+
+    def __init__(self, target_hz: float = LIVE_TARGET_HZ,
+                 max_staleness_ms: float = LIVE_MAX_STALENESS_MS,
+                 ladder: Sequence[int] = LIVE_IMGSZ_LADDER,
+                 initial_imgsz: int = LIVE_IMGSZ,
+                 adjust_interval: float = 1.0,
+                 max_stride: int = 8):
+        self.target_hz = target_hz
+        self.max_staleness_ms = max_staleness_ms
+        self.ladder = sorted(ladder)
+        self.adjust_interval = adjust_interval
+        self.max_stride = max_stride
+        self.enabled = True
+
+        self.stride = 1
+        self.imgsz_index = self._nearest_index(initial_imgsz)
+        self.lock = threading.Lock()
+
+        # 当前周期的累计值
+        self._window_start = time.time()
+        self._counts: Dict[str, int] = {}
+        self._staleness = []
+        self._infer_ms = []
+        self._arrival_hz = 0.0
+
+        # 上一周期的汇总结果
+        self.effective_hz = 0.0
+        self.staleness_ms = 0.0
+        self.infer_ms = 0.0
+        self.arrival_hz = 0.0
+        self.degraded = False
+        self.last_action = None
+
+    def _nearest_index(self, imgsz: int) -> int:
+        return min(range(len(self.ladder)), key=lambda i: abs(self.ladder[i] - imgsz))
+
+    @property
+    def imgsz(self) -> int:
+        return self.ladder[self.imgsz_index]
+
+    def configure(self, target_hz: Optional[float] = None, max_staleness_ms: Optional[float] = None,
+                  enabled: Optional[bool] = None, imgsz: Optional[int] = None, stride: Optional[int] = None):
+        with self.lock:
+            if target_hz is not None:
+                self.target_hz = target_hz
+            if max_staleness_ms is not None:
+                self.max_staleness_ms = max_staleness_ms
+            if enabled is not None:
+                self.enabled = enabled
+            # 手动指定的尺寸和步长在关闭自适应时保持不变
+            if imgsz is not None:
+                self.imgsz_index = self._nearest_index(imgsz)
+            if stride is not None:
+                self.stride = max(1, min(self.max_stride, stride))
+
+    def observe(self, cam_ids: Iterable[str], frame_times: Iterable[float], infer_ms: float,
+                arrival_hz: float, now: Optional[float] = None):
+        """每次合批推理后调用，只做累加；到调整周期时汇总并调整"""
+        now = now or time.time()
+        with self.lock:
+            for cam_id, frame_time in zip(cam_ids, frame_times):
+                self._counts[cam_id] = self._counts.get(cam_id, 0) + 1
+                self._staleness.append((now - frame_time) * 1000)
+            self._infer_ms.append(infer_ms)
+            self._arrival_hz = arrival_hz
+            if now - self._window_start >= self.adjust_interval:
+                self._adjust(now)
+
+    def _adjust(self, now: float):
+        elapsed = max(1e-6, now - self._window_start)
+        # 以最慢的摄像头为准
+        self.effective_hz = min(self._counts.values()) / elapsed if self._counts else 0.0
+        if self._staleness:
+            ordered = sorted(self._staleness)
+            self.staleness_ms = ordered[int(0.9 * (len(ordered) - 1))]
+        self.infer_ms = sum(self._infer_ms) / len(self._infer_ms) if self._infer_ms else 0.0
+        self.arrival_hz = self._arrival_hz
+
+        self._window_start = now
+        self._counts = {}
+        self._staleness = []
+        self._infer_ms = []
+
+        if not self.enabled:
+            return
+
+        # 帧源本身达不到目标频率时，以帧源速率为上限
+        wanted_hz = min(self.target_hz, self.arrival_hz * 0.9) if self.arrival_hz else self.target_hz
+        rate_ok = self.effective_hz >= wanted_hz
+        staleness_ok = self.staleness_ms <= self.max_staleness_ms
+
+        self.last_action = None
+        if not (rate_ok and staleness_ok):
+            if self.stride > 1:
+                self.stride -= 1
+                self.last_action = "stride_down"
+            elif self.imgsz_index > 0:
+                self.imgsz_index -= 1
+                self.last_action = "imgsz_down"
+            self.degraded = self.last_action is None
+            return
+
+        self.degraded = False
+        has_headroom = (self.staleness_ms < self.max_staleness_ms * 0.5
+                        and self.effective_hz > wanted_hz * 1.5)
+        if not has_headroom:
+            return
+        if self.imgsz_index < len(self.ladder) - 1:
+            self.imgsz_index += 1
+            self.last_action = "imgsz_up"
+        elif (self.stride < self.max_stride
+              and self.effective_hz * self.stride / (self.stride + 1) >= wanted_hz * 1.2):
+            self.stride += 1
+            self.last_action = "stride_up"
+
+    def info(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "target_hz": self.target_hz,
+                "max_staleness_ms": self.max_staleness_ms,
+                "imgsz": self.imgsz,
+                "imgsz_ladder": self.ladder,
+                "stride": self.stride,
+                "effective_hz": round(self.effective_hz, 2),
+                "staleness_ms": round(self.staleness_ms, 1),
+                "infer_ms": round(self.infer_ms, 1),
+                "arrival_hz": round(self.arrival_hz, 2),
+                "meeting_target": (self.effective_hz >= min(self.target_hz, self.arrival_hz * 0.9 or self.target_hz)
+                                   and self.staleness_ms <= self.max_staleness_ms),
+                "degraded": self.degraded,
+                "last_action": self.last_action
+            }
@@ -0,0 +1,319 @@
+"""
+实时画面分发：每个新帧只绘制和编码一次，所有观看者共享同一份 JPEG 字节
+"""
+import json
+import time
+import struct
+import asyncio
+import logging
+import threading
+import cv2
+from typing import Any, Dict, List, Optional
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+MJPEG_QUALITY = 75
+RAW_JPEG_QUALITY = 80
+
+# WebSocket 二进制帧头：帧序号(uint64) + 采集时间(float64 秒)，之后是 JPEG 字节
+WS_FRAME_HEADER = struct.Struct("<Qd")
+
+
+def draw_live_detections(frame, detections: List[Dict[str, Any]]):
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        label = det["class"]
+        conf = det["conf"]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(frame, f"{label} {conf:.2f}", (x1, max(15, y1 - 5)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    return frame
+
+
+def mjpeg_part(payload: bytes) -> bytes:
+    return (
+        b"--frame\r\n"
+        b"Content-Type: image/jpeg\r\n\r\n" +
+        payload +
+        b"\r\n"
+    )
+
+
+class AsyncNotifier:
+    """工作线程向多个异步订阅者发通知：每个订阅者一个 asyncio.Event"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._waiters = set()
+
+    def __len__(self):
+        return len(self._waiters)
+
+    def register(self):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self.lock:
+            self._waiters.add(waiter)
+        return waiter
+
+    def unregister(self, waiter):
+        with self.lock:
+            self._waiters.discard(waiter)
+
+    def notify(self):
+        with self.lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+
+class FrameBroadcaster:
+    """
+    一个摄像头每种输出一个渲染线程：有新帧时（可选绘制检测框）编码一次，按序号发布
+    订阅者等待通知而不是轮询；发送慢的客户端只会拿到最新一帧，中间帧直接丢弃
+    """
+
+    def __init__(self, camera, annotate: bool = True, quality: int = MJPEG_QUALITY):
+        self.camera = camera
+        self.annotate = annotate
+        self.quality = quality
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.payload: Optional[bytes] = None
+        self.frame_seq = 0
+        self.frame_time = 0.0
+        self.frames_encoded = 0
+        self.latency_ms = 0.0
+
+        self.notifier = AsyncNotifier()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # 每次 stop() 加一：之前的订阅者被唤醒后结束，之后的新订阅照常启动渲染（摄像头可以重新启动）
+        self.generation = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self.notifier)
+
+    def latest(self):
+        with self.lock:
+            return self.seq, self.payload
+
+    def latest_frame(self):
+        """(发布序号, JPEG 字节, 对应的采集帧序号, 采集时间)"""
+        with self.lock:
+            return self.seq, self.payload, self.frame_seq, self.frame_time
+
+    # ---------- 渲染线程 ----------
+
+    def _ensure_running(self):
+        with self.lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._render_loop,
+                    name=f"{'mjpeg' if self.annotate else 'raw'}-{self.camera.cam_id}",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _render_loop(self):
+        last_seq = 0
+        while not self._stop.is_set():
+            # 最后一个订阅者离开后停止渲染；与订阅在同一把锁下判断，避免漏启动
+            with self.lock:
+                if not self.subscribers:
+                    self._thread = None
+                    return
+            # 等待新帧而不是轮询；超时只是为了定期检查是否还有订阅者
+            item = self.camera.frames.wait_newer(last_seq, timeout=0.5)
+            if item is None:
+                continue
+            frame, last_seq, frame_time = item
+
+            img = frame
+            if self.annotate:
+                img = draw_live_detections(frame.copy(), self.camera.snapshot.detections)
+            ret, buffer = cv2.imencode('.jpg', img, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+            if not ret:
+                continue
+            self.publish(buffer.tobytes(), last_seq, frame_time)
+
+    def publish(self, payload: bytes, frame_seq: int = 0, frame_time: float = None):
+        with self.lock:
+            self.seq += 1
+            self.payload = payload
+            self.frame_seq = frame_seq
+            self.frames_encoded += 1
+            if frame_time:
+                self.frame_time = frame_time
+                # 采集到发布的延迟（指数滑动平均）
+                latency = (time.time() - frame_time) * 1000
+                self.latency_ms = latency if not self.latency_ms else self.latency_ms * 0.9 + latency * 0.1
+        self.notifier.notify()
+
+    def stop(self):
+        """停止渲染线程，并唤醒当前的订阅者让它们结束，不会一直等不到下一帧"""
+        with self.lock:
+            self.generation += 1
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=2)
+        self._thread = None
+        self.notifier.notify()
+
+    # ---------- 订阅 ----------
+
+    async def subscribe(self):
+        """
+        异步生成器，逐个产出最新的 (JPEG 字节, 采集帧序号, 采集时间)，不占用线程池线程
+        stop() 之后正常结束
+        """
+        waiter = self.notifier.register()
+        _, event = waiter
+        generation = self.generation
+        # 注册在前、启动在后，渲染线程不会因为看不到订阅者而提前退出
+        self._ensure_running()
+
+        last_seq = 0
+        try:
+            while self.generation == generation:
+                seq, payload, frame_seq, frame_time = self.latest_frame()
+                if payload is None or seq == last_seq:
+                    await event.wait()
+                    event.clear()
+                    continue
+                last_seq = seq
+                yield payload, frame_seq, frame_time
+        finally:
+            self.notifier.unregister(waiter)
+
+    async def stream(self):
+        """MJPEG 异步生成器"""
+        async for payload, _, _ in self.subscribe():
+            yield mjpeg_part(payload)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self.subscribers,
+            "frames_encoded": self.frames_encoded,
+            "seq": self.seq,
+            "capture_to_publish_ms": round(self.latency_ms, 1)
+        }
+
+
+# ================== WebSocket 实时流 ==================
+
+def compact_detections(snapshot) -> Dict[str, Any]:
+    """检测结果的紧凑消息：每个目标 [id, class, conf, x1, y1, x2, y2]"""
+    return {
+        "type": "detections",
+        "seq": snapshot.seq,
+        "frame_time": snapshot.frame_time,
+        "infer_time": snapshot.infer_time,
+        "d": [
+            [det.get("id"), det["class"], round(det["conf"], 3), *det["bbox"]]
+            for det in snapshot.detections
+        ]
+    }
+
+
+async def serve_live_websocket(websocket: WebSocket, camera, mode: str = "both", max_fps: float = 0):
+    """
+    二进制帧：WS_FRAME_HEADER + 原始 JPEG（不含检测框，所有客户端共享同一次编码）
+    文本帧：每次推理一条检测消息，用 seq / frame_time 与画面对齐
+    客户端可随时发送 {"mode": "frames|detections|both", "max_fps": N} 调整订阅
+    """
+    await websocket.accept()
+    settings = {"mode": mode, "max_fps": max_fps}
+    settings_changed = asyncio.Event()
+    send_lock = asyncio.Lock()
+
+    async def send_bytes(data: bytes):
+        async with send_lock:
+            await websocket.send_bytes(data)
+
+    async def send_json(message: Dict[str, Any]):
+        async with send_lock:
+            await websocket.send_text(json.dumps(message, separators=(",", ":")))
+
+    async def frame_sender():
+        # 只订阅检测结果时不占用原始画面的编码线程
+        while True:
+            if settings["mode"] == "detections":
+                await settings_changed.wait()
+                settings_changed.clear()
+                continue
+            last_sent = 0.0
+            frames = camera.raw_broadcaster.subscribe()
+            try:
+                async for payload, frame_seq, frame_time in frames:
+                    if settings["mode"] == "detections":
+                        break
+                    if settings["max_fps"]:
+                        # 降帧订阅：未到发送时间的帧直接跳过
+                        now = time.time()
+                        if now - last_sent < 1.0 / settings["max_fps"]:
+                            continue
+                        last_sent = now
+                    await send_bytes(WS_FRAME_HEADER.pack(frame_seq, frame_time) + payload)
+                else:
+                    # 摄像头已停止（注销或关闭），结束连接
+                    return
+            finally:
+                await frames.aclose()
+
+    async def detection_sender():
+        waiter = camera.detection_notifier.register()
+        _, event = waiter
+        last_seq = 0
+        try:
+            while True:
+                await event.wait()
+                event.clear()
+                if not camera.running:
+                    return
+                snapshot = camera.snapshot
+                if snapshot.seq == last_seq or settings["mode"] == "frames":
+                    continue
+                last_seq = snapshot.seq
+                await send_json(compact_detections(snapshot))
+        finally:
+            camera.detection_notifier.unregister(waiter)
+
+    async def control_receiver():
+        while True:
+            message = await websocket.receive_text()
+            try:
+                update = json.loads(message)
+            except ValueError:
+                continue
+            if update.get("mode") in ("frames", "detections", "both"):
+                settings["mode"] = update["mode"]
+            if "max_fps" in update:
+                try:
+                    settings["max_fps"] = max(0.0, float(update["max_fps"] or 0))
+                except (TypeError, ValueError):
+                    pass
+            settings_changed.set()
+
+    await send_json({
+        "type": "hello",
+        "cam_id": camera.cam_id,
+        "frame_header": "<Qd: frame_seq(uint64), frame_time(float64 秒)",
+        "detection_fields": ["id", "class", "conf", "x1", "y1", "x2", "y2"],
+        **settings
+    })
+
+    tasks = [asyncio.create_task(coro()) for coro in (frame_sender, detection_sender, control_receiver)]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            exc = task.exception()
+            if exc is not None and not isinstance(exc, WebSocketDisconnect):
+                logger.warning(f"⚠️ WebSocket 推流异常: {exc}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
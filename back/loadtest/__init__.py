@@ -0,0 +1,10 @@
+"""
+混合负载压测：在本机启动 uvicorn（或连接已有服务），按比例回放图片检测、预览、视频上传+状态轮询、
+记录翻页和摄像头 MJPEG 观看，统计各路由的吞吐、延迟分位数、错误率和服务端资源占用。
+
+  python -m loadtest --rate 4 --duration 60
+  python -m loadtest --rates 1,2,4,8 --step-seconds 30 --workers 2    # 逐级加压，找饱和点
+  python -m loadtest --url http://10.0.0.5:8000 --camera-source /data/loop.mp4
+
+在 back 目录下运行，详见 python -m loadtest --help
+"""
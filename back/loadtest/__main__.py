@@ -0,0 +1,188 @@
+"""
+python -m loadtest [--rate 2 | --rates 1,2,4,8] [--mix image=50,preview=20,video=5,records=25] [--workers 2]
+
+在 back 目录下运行。默认在临时目录中启动一个 uvicorn 服务（数据库和文件都放在临时目录），
+给了 --url 时直接压测已有服务。结果写成 JSON；逐级加压时报告第一个饱和的到达率
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+from typing import Any, Dict, List, Optional
+import httpx
+
+from bench import synthetic
+from loadtest import server
+from loadtest.stats import Recorder, format_routes, saturation
+from loadtest.workload import Inputs, Runner, Workload, parse_mix
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description="检测服务的混合负载压测")
+    parser.add_argument("--url", help="压测已有服务（例如 http://127.0.0.1:8000）；不给时在本机启动一个")
+    parser.add_argument("--workers", type=int, default=1, help="本机启动时 uvicorn 的 worker 数")
+    parser.add_argument("--tiny-detector", action="store_true",
+                        help="本机启动时用 bench 的替身检测器代替模型（没有 best.pt 或只看推理之外的开销）")
+    parser.add_argument("--workdir", help="本机启动时的工作目录（默认临时目录，结束后删除）")
+    parser.add_argument("--rate", type=float, default=2.0, help="每秒到达数")
+    parser.add_argument("--rates", help="逐级加压的到达率（逗号分隔），给出时忽略 --rate 和 --duration")
+    parser.add_argument("--duration", type=float, default=60.0, help="压测时长（秒）")
+    parser.add_argument("--step-seconds", type=float, default=30.0, help="逐级加压时每级的时长（秒）")
+    parser.add_argument("--mix", default="image=50,preview=20,video=5,records=25", help="各类请求的比例")
+    parser.add_argument("--viewers", type=int, default=2, help="MJPEG 观看者数量（0 表示不观看）")
+    parser.add_argument("--view-seconds", type=float, default=10.0, help="每次观看的时长，之后重连")
+    parser.add_argument("--camera-source", help="观看者使用的循环视频文件（默认生成一段合成视频；--url 指向其他机器时需给出服务端 "
+                                                "CAMERA_FILE_DIR 下的路径）")
+    parser.add_argument("--image-size", default="1280x720", help="上传图片的分辨率")
+    parser.add_argument("--video-seconds", type=float, default=4.0, help="上传视频的时长（秒）")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="在途请求上限，超过后的到达直接丢弃")
+    parser.add_argument("--slo-p95-ms", type=float, default=2000.0, help="判断饱和的 p95 上限（毫秒）")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="判断饱和的错误率上限")
+    parser.add_argument("--seed", type=int, default=0, help="到达时间和请求类型的随机种子")
+    parser.add_argument("--output", default="loadtest_results.json", help="结果文件")
+    return parser.parse_args(argv)
+
+
+def _workload(args) -> Workload:
+    width, _, height = args.image_size.partition("x")
+    return Workload(
+        rate=args.rate, mix=parse_mix(args.mix), viewers=args.viewers, view_seconds=args.view_seconds,
+        duration=args.duration, max_in_flight=args.max_in_flight, image_size=(int(width), int(height)),
+        video_seconds=args.video_seconds, seed=args.seed
+    )
+
+
+def _camera_source(args, root: str) -> Optional[str]:
+    if args.viewers <= 0:
+        return None
+    if args.camera_source:
+        return os.path.abspath(args.camera_source)
+    return synthetic.make_video(os.path.join(root, "camera_loop.mp4"), 640, 360, frames=250)
+
+
+async def _register_camera(client: httpx.AsyncClient, source: str):
+    """压测已有服务时通过接口注册；已存在（400）时沿用。多 worker 时只注册到接到请求的那个 worker"""
+    response = await client.post("/api/camera/register", params={"cam_id": server.CAMERA_ID, "source": source})
+    if response.status_code == 403:
+        raise SystemExit(f"❌ 服务端拒绝了摄像头源: {response.json().get('detail')}（视频需放在服务端的 CAMERA_FILE_DIR 下）")
+    if response.status_code not in (200, 400):
+        response.raise_for_status()
+
+
+async def _step(client: httpx.AsyncClient, workload: Workload, inputs: Inputs,
+                camera_id: Optional[str], pid: Optional[int]) -> Dict[str, Any]:
+    recorder = Recorder()
+    sampler = server.ResourceSampler(client, pid)
+    before = await server.scrape(client)
+    stop = asyncio.Event()
+    sampling = asyncio.create_task(sampler.run(stop))
+    await Runner(client, workload, inputs, recorder, camera_id).run()
+    stop.set()
+    await sampling
+    after = await server.scrape(client)
+
+    summary = recorder.summary()
+    summary["rate"] = workload.rate
+    summary["server"] = {**sampler.summary(), "stages": server.stage_means(before, after)}
+    return summary
+
+
+def _print_step(summary: Dict[str, Any]):
+    arrivals, viewers, resources = summary["arrivals"], summary["viewers"], summary["server"]
+    print(f"\n📊 到达率 {summary['rate']:g}/s，{summary['duration_s']:.0f}s：{summary['requests']} 个请求，"
+          f"{summary['throughput_rps']:.2f} req/s，错误率 {summary['error_rate']:.1%}，"
+          f"到达 {arrivals['completed']}/{arrivals['scheduled']} 完成、{arrivals['dropped']} 丢弃，"
+          f"压测端最大延迟 {summary['max_client_lag_ms']:.0f}ms")
+    if summary["routes"]:
+        print(format_routes(summary))
+    for outcome, job in summary["video_jobs"].items():
+        print(f"   视频任务 {outcome}: {job['count']} 个，p50 {job['p50_s']}s，p95 {job['p95_s']}s")
+    if viewers["sessions"] or viewers["errors"]:
+        print(f"   观看者: {viewers['sessions']} 次，首帧 p95 {viewers['first_frame_p95_ms']}ms，"
+              f"平均 {viewers['fps_mean']} fps（最低 {viewers['fps_min']}），{viewers['errors']} 次失败")
+    if resources["cpu_percent"]["mean"] is not None:
+        print(f"   服务端: CPU 平均 {resources['cpu_percent']['mean']}%（峰值 {resources['cpu_percent']['max']}%），"
+              f"RSS 峰值 {resources['rss_mb']['max']}MB，线程 {resources['threads_max']}")
+    for name, gauge in resources["gauges"].items():
+        print(f"   {name}: 平均 {gauge['mean']}，峰值 {gauge['max']}")
+
+
+async def _run(args, base_url: str, pid: Optional[int], camera_id: Optional[str],
+               register_source: Optional[str]) -> List[Dict[str, Any]]:
+    workload = _workload(args)
+    rates = [float(r) for r in args.rates.split(",")] if args.rates else [args.rate]
+    duration = args.step_seconds if args.rates else args.duration
+    inputs = Inputs(workload)
+    limits = httpx.Limits(max_connections=args.max_in_flight + args.viewers + 4)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        if register_source:
+            await _register_camera(client, register_source)
+        steps = []
+        for index, rate in enumerate(rates):
+            step_workload = workload._replace(rate=rate, duration=duration, seed=workload.seed + index)
+            summary = await _step(client, step_workload, inputs, camera_id, pid)
+            summary["saturated"] = saturation(summary, args.slo_p95_ms, args.max_error_rate)
+            _print_step(summary)
+            steps.append(summary)
+            if summary["saturated"]:
+                print(f"🔥 到达率 {rate:g}/s 已饱和：{'；'.join(summary['saturated'])}")
+                if args.rates:
+                    break
+        return steps
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    root = args.workdir or tempfile.mkdtemp(prefix="detect-loadtest-")
+    os.makedirs(root, exist_ok=True)
+    local = None
+    try:
+        source = _camera_source(args, root)
+        if args.url:
+            base_url, pid, register_source = args.url.rstrip("/"), None, source
+        else:
+            local = server.LocalServer(root, workers=args.workers, tiny_detector=args.tiny_detector,
+                                       camera_source=source)
+            print(f"🚀 启动服务: {args.workers} 个 worker，日志 {local.log_path}")
+            local.start()
+            print(f"✅ 服务就绪，用时 {local.ready_seconds:.1f}s")
+            base_url, pid, register_source = local.base_url, local.pid, None
+        steps = asyncio.run(_run(args, base_url, pid, server.CAMERA_ID if source else None, register_source))
+    finally:
+        if local:
+            local.stop()
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    saturated = next((step["rate"] for step in steps if step["saturated"]), None)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {"machine": platform.machine(), "cpu_count": os.cpu_count(),
+                        "python": platform.python_version(), "url": args.url, "workers": args.workers,
+                        "tiny_detector": args.tiny_detector,
+                        "server_ready_s": round(local.ready_seconds, 2) if local else None},
+        "workload": {**_workload(args)._asdict(), "rates": args.rates},
+        "saturated_at": saturated,
+        "steps": steps
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.rates:
+        print(f"\n{'🔥 饱和点: ' + format(saturated, 'g') + '/s' if saturated else '✅ 各级到达率均未饱和'}")
+    print(f"💾 结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""
+压测用的服务入口：uvicorn loadtest.serve:app（多 worker 时每个 worker 各自导入一次）
+
+  - LOADTEST_WORKDIR：上传/结果/数据库放到该目录，不碰 back/static 和 back/db
+  - LOADTEST_TINY_DETECTOR=1：用 bench.detector.TinyDetector 代替模型（没有 best.pt 时压测推理之外的部分）
+  - LOADTEST_CAMERA_SOURCE：注册一路循环播放的文件摄像头 CAMERA_ID，供 MJPEG 观看者使用；
+    摄像头注册在进程内存中，所以由每个 worker 自己注册
+"""
+import os
+from bench import detector, workspace
+from loadtest.server import CAMERA_ID
+
+if os.getenv("LOADTEST_WORKDIR"):
+    workspace.redirect(os.environ["LOADTEST_WORKDIR"])
+if os.getenv("LOADTEST_TINY_DETECTOR") == "1":
+    detector.install()
+
+from main import app  # noqa: E402
+
+if os.getenv("LOADTEST_CAMERA_SOURCE"):
+    from routers.camera import camera_manager
+    camera_manager.register(CAMERA_ID, os.environ["LOADTEST_CAMERA_SOURCE"])
@@ -0,0 +1,250 @@
+"""
+本地 uvicorn 服务的启动/停止，以及压测期间服务端的资源采样
+
+ResourceSampler 每隔 interval 秒采一次：
+  - 服务进程树（uvicorn 主进程和各 worker）的 CPU 占用、RSS 和线程数，读 /proc，只在本机启动服务时可用
+  - /metrics 中的队列/任务/摄像头仪表（见 GAUGES），按指标名把各标签的值相加
+压测前后各抓一次 /metrics，两次之差得到压测期间服务端各阶段的平均耗时（detect_stage_duration_seconds）
+"""
+import os
+import re
+import sys
+import time
+import socket
+import asyncio
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 观看者连接的摄像头编号
+CAMERA_ID = "loadtest"
+
+GAUGES = (
+    "record_writer_queue_depth", "video_jobs_active", "video_detection_data_entries", "clip_jobs_active",
+    "camera_running", "camera_capture_fps", "camera_inference_staleness_seconds", "live_inference_hz"
+)
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+# ================== 本地服务 ==================
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """在子进程中启动 uvicorn loadtest.serve:app，日志写到 log_path"""
+
+    def __init__(self, workdir: str, workers: int = 1, tiny_detector: bool = False,
+                 camera_source: Optional[str] = None, port: int = 0):
+        self.workdir = workdir
+        self.workers = workers
+        self.tiny_detector = tiny_detector
+        self.camera_source = camera_source
+        self.port = port or _free_port()
+        self.log_path = os.path.join(workdir, "server.log")
+        self.process: Optional[subprocess.Popen] = None
+        # 从启动进程到 /health/ready 返回 200 的秒数
+        self.ready_seconds: Optional[float] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process else None
+
+    def start(self, timeout: float = 180.0):
+        env = {**os.environ, "LOADTEST_WORKDIR": self.workdir,
+               "LOADTEST_TINY_DETECTOR": "1" if self.tiny_detector else "0"}
+        if self.camera_source:
+            env["LOADTEST_CAMERA_SOURCE"] = self.camera_source
+        cmd = [sys.executable, "-m", "uvicorn", "loadtest.serve:app", "--host", "127.0.0.1",
+               "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning", "--no-access-log"]
+        log = open(self.log_path, "ab")
+        try:
+            self.process = subprocess.Popen(cmd, cwd=BACK_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        finally:
+            log.close()
+
+        # 服务先开始响应、模型在后台加载：等到就绪探针返回 200（模型已加载并预热）再开始压测
+        started = time.monotonic()
+        deadline = started + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"服务启动失败（退出码 {self.process.returncode}），日志: {self.log_path}\n{self.log_tail()}")
+            try:
+                if httpx.get(f"{self.base_url}/health/ready", timeout=2).status_code == 200:
+                    self.ready_seconds = time.monotonic() - started
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        self.stop()
+        raise RuntimeError(f"服务在 {timeout:.0f}s 内没有就绪，日志: {self.log_path}\n{self.log_tail()}")
+
+    def stop(self, timeout: float = 20.0):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def log_tail(self, lines: int = 20) -> str:
+        try:
+            with open(self.log_path, encoding="utf-8", errors="replace") as f:
+                return "".join(f.readlines()[-lines:])
+        except OSError:
+            return ""
+
+
+# ================== /metrics ==================
+
+def parse_metrics(text: str) -> List[Tuple[str, Dict[str, str], float]]:
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        try:
+            samples.append((name, dict(_LABEL.findall(labels or "")), float(value)))
+        except ValueError:
+            continue
+    return samples
+
+
+async def scrape(client: httpx.AsyncClient) -> List[Tuple[str, Dict[str, str], float]]:
+    try:
+        response = await client.get("/metrics", timeout=10)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return []
+    return parse_metrics(response.text)
+
+
+def stage_means(before, after) -> Dict[str, Dict[str, Any]]:
+    """两次抓取之间各 pipeline/stage 的次数和平均耗时（毫秒）"""
+    def totals(samples):
+        result: Dict[Tuple[str, str], List[float]] = {}
+        for name, labels, value in samples:
+            if name in ("detect_stage_duration_seconds_sum", "detect_stage_duration_seconds_count"):
+                key = (labels.get("pipeline", ""), labels.get("stage", ""))
+                result.setdefault(key, [0.0, 0.0])[name.endswith("_count")] += value
+        return result
+
+    start, end = totals(before), totals(after)
+    stages = {}
+    for key, (total, count) in sorted(end.items()):
+        base_total, base_count = start.get(key, (0.0, 0.0))
+        if count - base_count <= 0:
+            continue
+        stages[f"{key[0]}.{key[1]}"] = {
+            "count": int(count - base_count),
+            "mean_ms": round((total - base_total) / (count - base_count) * 1000, 2)
+        }
+    return stages
+
+
+# ================== 资源采样 ==================
+
+def _children() -> Dict[int, List[int]]:
+    tree: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        tree.setdefault(int(fields[1]), []).append(int(entry))
+    return tree
+
+
+def _process_tree(pid: int) -> List[int]:
+    tree, pids, stack = _children(), [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        stack.extend(tree.get(current, ()))
+    return pids
+
+
+def _proc_usage(pid: int) -> Optional[Tuple[float, int, int]]:
+    """进程树的 (CPU 秒数, RSS 字节, 线程数)；没有 /proc 或进程已退出时返回 None"""
+    if not os.path.isdir("/proc"):
+        return None
+    ticks, page = os.sysconf("SC_CLK_TCK"), os.sysconf("SC_PAGE_SIZE")
+    cpu, rss, threads = 0.0, 0, 0
+    found = False
+    for child in _process_tree(pid):
+        try:
+            with open(f"/proc/{child}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        found = True
+        # ")" 之后从 state（第 3 个字段）开始：utime=14, stime=15, num_threads=20, rss=24
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+        threads += int(fields[17])
+        rss += int(fields[21]) * page
+    return (cpu, rss, threads) if found else None
+
+
+def _series(values: List[float], digits: int = 2) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"mean": None, "max": None}
+    return {"mean": round(sum(values) / len(values), digits), "max": round(max(values), digits)}
+
+
+class ResourceSampler:
+    def __init__(self, client: httpx.AsyncClient, pid: Optional[int] = None, interval: float = 1.0):
+        self.client = client
+        self.pid = pid
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_mb: List[float] = []
+        self.threads: List[int] = []
+        self.gauges: Dict[str, List[float]] = {}
+
+    async def run(self, stop: asyncio.Event):
+        last = _proc_usage(self.pid) if self.pid else None
+        last_time = time.monotonic()
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if self.pid:
+                usage = _proc_usage(self.pid)
+                now = time.monotonic()
+                if usage and last:
+                    self.cpu_percent.append((usage[0] - last[0]) / (now - last_time) * 100)
+                    self.rss_mb.append(usage[1] / 1024 / 1024)
+                    self.threads.append(usage[2])
+                last, last_time = usage, now
+            sums: Dict[str, float] = {}
+            for name, _, value in await scrape(self.client):
+                if name in GAUGES:
+                    sums[name] = sums.get(name, 0.0) + value
+            for name, value in sums.items():
+                self.gauges.setdefault(name, []).append(value)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "cpu_percent": _series(self.cpu_percent, 1),
+            "rss_mb": _series(self.rss_mb, 1),
+            "threads_max": max(self.threads) if self.threads else None,
+            "gauges": {name: _series(values, 3) for name, values in sorted(self.gauges.items())}
+        }
@@ -0,0 +1,150 @@
+"""
+压测结果的收集和汇总：每个请求一条样本，按路由统计吞吐、延迟分位数和错误率
+"""
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩法的分位数（q 取 0~100），values 需已排序"""
+    if not values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def _round(value: Optional[float], digits: int = 2) -> Optional[float]:
+    return None if value is None else round(value, digits)
+
+
+class RouteStats:
+    __slots__ = ("latencies", "errors", "statuses", "bytes")
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.statuses: Dict[str, int] = {}
+        self.bytes = 0
+
+    def summary(self, seconds: float) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        count = len(ordered)
+        return {
+            "requests": count,
+            "throughput_rps": _round(count / seconds if seconds else 0.0, 3),
+            "errors": self.errors,
+            "error_rate": _round(self.errors / count if count else 0.0, 4),
+            "p50_ms": _round(percentile(ordered, 50)),
+            "p95_ms": _round(percentile(ordered, 95)),
+            "p99_ms": _round(percentile(ordered, 99)),
+            "max_ms": _round(ordered[-1] if ordered else None),
+            "mean_kb": _round(self.bytes / count / 1024 if count else 0.0),
+            "statuses": dict(sorted(self.statuses.items()))
+        }
+
+
+class Recorder:
+    """
+    请求样本按路由累计；不是 2xx/3xx 的响应和异常（超时、连接失败）都算错误，
+    异常按类型名记在 statuses 里
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, RouteStats] = {}
+        self.started = time.perf_counter()
+        self.stopped: Optional[float] = None
+        # 发出请求时已落后于计划到达时间的秒数（压测机本身跟不上时会变大）
+        self.max_lag = 0.0
+        # 计划的到达数、其中完整执行完的数量（含视频轮询和翻页）、达到并发上限时直接放弃的数量
+        self.scheduled = 0
+        self.completed = 0
+        self.dropped = 0
+        # 视频任务：上传到检测完成（或失败/超时）的端到端结果
+        self.jobs: Dict[str, List[float]] = {}
+        # MJPEG 观看者：首帧等待时间和每个观看者收到的帧率
+        self.first_frame: List[float] = []
+        self.viewer_fps: List[float] = []
+        self.viewer_errors = 0
+
+    def _route(self, route: str) -> RouteStats:
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats()
+        return stats
+
+    def record(self, route: str, seconds: float, status: Optional[int] = None, size: int = 0,
+               error: Optional[str] = None):
+        stats = self._route(route)
+        stats.latencies.append(seconds * 1000)
+        stats.bytes += size
+        key = error or str(status)
+        stats.statuses[key] = stats.statuses.get(key, 0) + 1
+        if error is not None or status is None or status >= 400:
+            stats.errors += 1
+
+    def record_job(self, outcome: str, seconds: float):
+        self.jobs.setdefault(outcome, []).append(seconds)
+
+    def stop(self):
+        self.stopped = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.stopped or time.perf_counter()) - self.started
+
+    def summary(self) -> Dict[str, Any]:
+        seconds = self.elapsed
+        routes = {route: stats.summary(seconds) for route, stats in sorted(self.routes.items())}
+        total = sum(r["requests"] for r in routes.values())
+        errors = sum(r["errors"] for r in routes.values())
+        first_frame = sorted(self.first_frame)
+        return {
+            "duration_s": round(seconds, 2),
+            "requests": total,
+            "throughput_rps": round(total / seconds, 3) if seconds else 0.0,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "arrivals": {"scheduled": self.scheduled, "completed": self.completed, "dropped": self.dropped},
+            "max_client_lag_ms": round(self.max_lag * 1000, 1),
+            "routes": routes,
+            "video_jobs": {
+                outcome: {"count": len(values), "p50_s": _round(percentile(sorted(values), 50)),
+                          "p95_s": _round(percentile(sorted(values), 95))}
+                for outcome, values in sorted(self.jobs.items())
+            },
+            "viewers": {
+                "sessions": len(self.viewer_fps),
+                "errors": self.viewer_errors,
+                "first_frame_p50_ms": _round(percentile(first_frame, 50)),
+                "first_frame_p95_ms": _round(percentile(first_frame, 95)),
+                "fps_mean": _round(sum(self.viewer_fps) / len(self.viewer_fps) if self.viewer_fps else None),
+                "fps_min": _round(min(self.viewer_fps) if self.viewer_fps else None)
+            }
+        }
+
+
+def saturation(summary: Dict[str, Any], slo_p95_ms: float, max_error_rate: float,
+               min_completed: float = 0.9) -> List[str]:
+    """判断一轮压测是否已经饱和，返回原因（空列表表示未饱和）"""
+    reasons = []
+    arrivals = summary["arrivals"]
+    if arrivals["dropped"]:
+        reasons.append(f"{arrivals['dropped']} 个到达因在途请求达到上限被丢弃")
+    if arrivals["scheduled"] and arrivals["completed"] / arrivals["scheduled"] < min_completed:
+        reasons.append(f"只完成了 {arrivals['completed']}/{arrivals['scheduled']} 个到达")
+    if summary["error_rate"] > max_error_rate:
+        reasons.append(f"错误率 {summary['error_rate']:.1%} 超过 {max_error_rate:.1%}")
+    for route, r in summary["routes"].items():
+        if r["p95_ms"] is not None and r["p95_ms"] > slo_p95_ms:
+            reasons.append(f"{route} p95 {r['p95_ms']:.0f}ms 超过 {slo_p95_ms:.0f}ms")
+    return reasons
+
+
+def format_routes(summary: Dict[str, Any]) -> str:
+    rows = summary["routes"]
+    width = max([len(route) for route in rows] + [5])
+    lines = [f"{'route':<{width}}  {'reqs':>6}  {'rps':>7}  {'err%':>6}  {'p50':>8}  {'p95':>8}  {'p99':>8}  (ms)"]
+    for route, r in rows.items():
+        lines.append(f"{route:<{width}}  {r['requests']:>6}  {r['throughput_rps']:>7.2f}  {r['error_rate'] * 100:>5.1f}%  "
+                     f"{r['p50_ms'] or 0:>8.1f}  {r['p95_ms'] or 0:>8.1f}  {r['p99_ms'] or 0:>8.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,237 @@
+"""
+混合负载：按泊松过程（开环）产生到达，每次到达按 mix 的比例选一种请求：
+
+  image    POST /api/detect/image
+  preview  POST /api/detect/image/preview
+  video    POST /api/detect/video，再轮询 /api/video/{id}/status 直到完成、失败或超时
+  records  GET /api/records/list，再沿 next_cursor 往后翻 record_pages - 1 页
+
+另有 viewers 个 MJPEG 观看者持续连接 /api/camera/{id}/stream，每次观看 view_seconds 秒后重连。
+开环意味着服务变慢时到达不会跟着变少，排队和超时会如实反映在延迟和错误率上；
+同时在途的请求数达到 max_in_flight 时新到达直接丢弃并计数，避免压测机自身被拖垮。
+"""
+import time
+import random
+import asyncio
+import tempfile
+from typing import Dict, NamedTuple, Optional, Tuple
+import httpx
+
+from bench import synthetic
+from loadtest.stats import Recorder
+
+SCENARIOS = ("image", "preview", "video", "records")
+FRAME_BOUNDARY = b"--frame\r\n"
+
+
+class Workload(NamedTuple):
+    rate: float = 2.0  # 每秒到达数
+    mix: Dict[str, float] = {"image": 0.5, "preview": 0.2, "video": 0.05, "records": 0.25}
+    viewers: int = 2
+    view_seconds: float = 10.0
+    duration: float = 60.0
+    max_in_flight: int = 64
+    image_size: Tuple[int, int] = (1280, 720)
+    image_pool: int = 50
+    video_seconds: float = 4.0
+    video_size: Tuple[int, int] = (640, 360)
+    video_conf: float = 0.25
+    poll_interval: float = 1.0
+    video_timeout: float = 300.0
+    record_pages: int = 3
+    timeout: float = 120.0  # 单个请求的超时
+    drain_seconds: float = 30.0  # 到达结束后等待在途请求的时间
+    seed: int = 0
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """"image=50,preview=20,video=5,records=25" -> 归一化后的比例"""
+    mix = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"未知请求类型: {name}，可选: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("mix 的比例之和必须大于 0")
+    return {name: weight / total for name, weight in mix.items() if weight > 0}
+
+
+class Inputs:
+    """预先生成的上传内容：不同种子的图片轮流使用，视频只生成一个"""
+
+    def __init__(self, workload: Workload):
+        width, height = workload.image_size
+        self.images = [synthetic.encode_image(synthetic.make_image(width, height, seed=seed))
+                       for seed in range(max(1, workload.image_pool))]
+        self.video: Optional[bytes] = None
+        if workload.mix.get("video"):
+            width, height = workload.video_size
+            with tempfile.NamedTemporaryFile(suffix=".mp4") as f:
+                synthetic.make_video(f.name, width, height, frames=max(1, round(workload.video_seconds * 25)))
+                with open(f.name, "rb") as video:
+                    self.video = video.read()
+        self._next = 0
+
+    def image(self) -> bytes:
+        self._next = (self._next + 1) % len(self.images)
+        return self.images[self._next]
+
+
+class Runner:
+    def __init__(self, client: httpx.AsyncClient, workload: Workload, inputs: Inputs,
+                 recorder: Recorder, camera_id: Optional[str] = None):
+        self.client = client
+        self.workload = workload
+        self.inputs = inputs
+        self.recorder = recorder
+        self.camera_id = camera_id
+        self.random = random.Random(workload.seed)
+        self.in_flight = 0
+
+    # ---------- 单个请求 ----------
+
+    async def _request(self, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, timeout=self.workload.timeout, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(route, time.perf_counter() - start, error=type(e).__name__)
+            return None
+        self.recorder.record(route, time.perf_counter() - start, response.status_code, len(response.content))
+        return response
+
+    # ---------- 场景 ----------
+
+    async def image(self):
+        await self._request("detect.image", "POST", "/api/detect/image",
+                            files={"file": ("load.jpg", self.inputs.image(), "image/jpeg")})
+
+    async def preview(self):
+        await self._request("detect.preview", "POST", "/api/detect/image/preview", params={"hidden_ids": "1"},
+                            files={"file": ("load.jpg", self.inputs.image(), "image/jpeg")})
+
+    async def video(self):
+        start = time.perf_counter()
+        response = await self._request("video.upload", "POST", "/api/detect/video",
+                                       params={"conf": self.workload.video_conf},
+                                       files={"file": ("load.mp4", self.inputs.video, "video/mp4")})
+        if response is None or response.status_code >= 400:
+            self.recorder.record_job("rejected", time.perf_counter() - start)
+            return
+        video_id = response.json()["video_id"]
+        try:
+            while time.perf_counter() - start < self.workload.video_timeout:
+                await asyncio.sleep(self.workload.poll_interval)
+                status = await self._request("video.status", "GET", f"/api/video/{video_id}/status")
+                if status is None or status.status_code >= 400:
+                    continue
+                state = status.json().get("status")
+                # not_found：多 worker 时状态只在处理该视频的 worker 内存中，轮询落到别的 worker 上
+                if state in ("completed", "failed", "not_found"):
+                    self.recorder.record_job(state, time.perf_counter() - start)
+                    return
+            self.recorder.record_job("timeout", time.perf_counter() - start)
+        except asyncio.CancelledError:
+            self.recorder.record_job("cancelled", time.perf_counter() - start)
+            raise
+
+    async def records(self):
+        response = await self._request("records.list", "GET", "/api/records/list", params={"limit": 20})
+        for _ in range(self.workload.record_pages - 1):
+            if response is None or response.status_code >= 400:
+                return
+            cursor = response.json().get("next_cursor")
+            if not cursor:
+                return
+            response = await self._request("records.list.cursor", "GET", "/api/records/list",
+                                           params={"limit": 20, "cursor": cursor})
+
+    # ---------- MJPEG 观看者 ----------
+
+    async def _view_once(self):
+        start = time.perf_counter()
+        frames, first, tail = 0, None, b""
+        try:
+            async with self.client.stream("GET", f"/api/camera/{self.camera_id}/stream",
+                                          timeout=self.workload.timeout) as response:
+                if response.status_code >= 400:
+                    self.recorder.viewer_errors += 1
+                    await asyncio.sleep(1)
+                    return
+                async for chunk in response.aiter_bytes():
+                    data = tail + chunk
+                    frames += data.count(FRAME_BOUNDARY)
+                    # 分隔符可能被切在两个块之间
+                    tail = data[-(len(FRAME_BOUNDARY) - 1):]
+                    if frames and first is None:
+                        first = time.perf_counter() - start
+                    if time.perf_counter() - start >= self.workload.view_seconds:
+                        break
+        except httpx.HTTPError:
+            self.recorder.viewer_errors += 1
+            await asyncio.sleep(1)
+            return
+        if first is None:
+            self.recorder.viewer_errors += 1
+            return
+        self.recorder.first_frame.append(first * 1000)
+        self.recorder.viewer_fps.append(frames / (time.perf_counter() - start))
+
+    async def _viewer(self, deadline: float, offset: float):
+        # 错开各观看者的连接时间
+        await asyncio.sleep(offset)
+        while time.perf_counter() < deadline:
+            await self._view_once()
+
+    # ---------- 到达 ----------
+
+    async def _arrival(self, scenario: str):
+        self.in_flight += 1
+        try:
+            await getattr(self, scenario)()
+            self.recorder.completed += 1
+        finally:
+            self.in_flight -= 1
+
+    async def run(self):
+        workload = self.workload
+        names = list(workload.mix)
+        weights = [workload.mix[name] for name in names]
+        start = time.perf_counter()
+        deadline = start + workload.duration
+
+        viewers = []
+        if self.camera_id and workload.viewers > 0:
+            viewers = [asyncio.create_task(self._viewer(deadline, i * workload.view_seconds / workload.viewers))
+                       for i in range(workload.viewers)]
+
+        tasks = set()
+        scheduled = start
+        while True:
+            scheduled += self.random.expovariate(workload.rate)
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.recorder.max_lag = max(self.recorder.max_lag, -delay)
+            self.recorder.scheduled += 1
+            if self.in_flight >= workload.max_in_flight:
+                self.recorder.dropped += 1
+                continue
+            task = asyncio.create_task(self._arrival(self.random.choices(names, weights)[0]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.wait(tasks, timeout=workload.drain_seconds)
+        for task in list(tasks) + viewers:
+            task.cancel()
+        await asyncio.gather(*tasks, *viewers, return_exceptions=True)
+        self.recorder.stop()
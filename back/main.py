@@ -1,10 +1,19 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from routers import detect, video, camera, records
+from routers import detect, video, camera, records, upload, detections, storage, export, health
 import uvicorn
 import os
 from pathlib import Path
+from config import CAMERA_DIR, THUMB_DIR
+from file_serving import CachedStaticFiles
+from db_writer import record_writer
+from storage_lifecycle import storage_lifecycle
+from thumbnails import thumbnail_backfill
+from model_registry import model_registry, ModelUnavailable
+import metrics
+import tracing
+from migrations import run_migrations
 
 # 获取项目根目录
 BASE_DIR = Path(__file__).resolve().parent
@@ -24,9 +33,13 @@ os.makedirs(RESULT_DIR, exist_ok=True)
 app = FastAPI(title="YOLOv8 Detection & Tracking")
 
 
-# 挂载静态文件服务
-app.mount("/files/upload", StaticFiles(directory=UPLOAD_DIR), name="upload")
-app.mount("/files/result", StaticFiles(directory=RESULT_DIR), name="result")
+# 挂载静态文件服务（ETag/长缓存/Range，见 file_serving）
+app.mount("/files/upload", CachedStaticFiles(directory=UPLOAD_DIR), name="upload")
+app.mount("/files/result", CachedStaticFiles(directory=RESULT_DIR), name="result")
+# 摄像头抓拍和事件录像片段
+app.mount("/files/camera", CachedStaticFiles(directory=CAMERA_DIR), name="camera")
+# 记录列表的缩略图（内容寻址，长缓存）
+app.mount("/files/thumb", CachedStaticFiles(directory=THUMB_DIR), name="thumb")
 
 # CORS
 app.add_middleware(
@@ -36,12 +49,65 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 按路由/状态码统计请求数和耗时，见 /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+# 各阶段耗时写入 Server-Timing 响应头，慢请求记入 logs/slow_requests.log
+app.add_middleware(tracing.TracingMiddleware)
 
 # 路由
 app.include_router(detect.router, prefix="/api")
 app.include_router(video.router, prefix="/api")
 app.include_router(camera.router, prefix="/api")
 app.include_router(records.router, prefix="/api")
+app.include_router(upload.router, prefix="/api")
+app.include_router(detections.router, prefix="/api")
+app.include_router(storage.router, prefix="/api")
+app.include_router(export.router, prefix="/api")
+# 存活 / 就绪探针
+app.include_router(health.router)
+
+
+@app.exception_handler(ModelUnavailable)
+async def model_unavailable_handler(request: Request, exc: ModelUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus 文本格式的运行指标：各阶段耗时直方图、请求计数、任务队列和摄像头状态"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.on_event("startup")
+def prepare_database():
+    # 建表并执行尚未执行的数据库迁移（放在启动阶段，导入 main 时不访问数据库）
+    run_migrations()
+
+
+@app.on_event("startup")
+def preload_model():
+    # 模型在后台线程加载，服务先开始响应；加载完成前 /health/ready 返回 503
+    model_registry.start()
+
+
+@app.on_event("startup")
+def start_storage_lifecycle():
+    # 保留策略、配额和孤儿文件清理在后台线程中按小段执行
+    storage_lifecycle.start()
+    # 历史记录的缩略图在后台补齐
+    thumbnail_backfill.start()
+
+
+@app.on_event("shutdown")
+def flush_record_writer():
+    thumbnail_backfill.stop()
+    storage_lifecycle.stop()
+    # 退出前写完队列中尚未提交的检测记录
+    record_writer.stop()
+
+
+metrics.mark_startup("imported")
+
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,303 @@
+"""
+运行指标，以 Prometheus 文本格式在 /metrics 输出
+
+只需要计数器、固定桶直方图和仪表，没有引入 prometheus_client：
+  - 热路径上一次观测是一次 bisect 加几次加法（持一把细粒度锁），约 1 µs，相比解码/推理可以忽略；
+    循环里先用 labels() 取到子指标再反复 observe，省掉每次的标签查找
+  - 取值有开销的仪表（内存中的视频任务、摄像头帧率等）不在热路径上维护，
+    由各模块用 register_collector 注册回调，抓取 /metrics 时才计算
+"""
+import os
+import math
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import tracing
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 阶段耗时的桶（秒）：覆盖单帧绘制（亚毫秒）到整段视频转码（分钟）
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+# 回调返回 [(指标名, 说明, [(标签, 值), ...]), ...]，都按 gauge 输出
+_collectors: List[Callable[[], Iterable[Tuple[str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# ================== 指标类型 ==================
+
+class _Metric(ABC):
+    """带标签的指标；子类给出 kind、如何创建子指标以及如何输出一个子指标"""
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """某组标签值第一次出现时创建的子指标"""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    @abstractmethod
+    def _render_child(self, key, child) -> List[str]:
+        """一个子指标的 Prometheus 文本行"""
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "Timer":
+        return Timer(self)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, key, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Timer:
+    """with 块的耗时记入直方图（块内抛异常也记录）；给了 span 时同时记到当前请求的 Trace 上"""
+    __slots__ = ("_child", "_span", "_start")
+
+    def __init__(self, child: _HistogramChild, span: Optional[str] = None):
+        self._child = child
+        self._span = span
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        self._child.observe(elapsed)
+        if self._span is not None:
+            tracing.add(self._span, elapsed)
+        return False
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, List[Tuple[Dict[str, str], float]]]]]):
+    """注册抓取时计算的仪表"""
+    _collectors.append(collector)
+
+
+# ================== 公共指标 ==================
+
+STAGE_SECONDS = Histogram(
+    "detect_stage_duration_seconds",
+    "Time spent per processing stage (upload_read, decode, inference, postprocess, draw, encode, "
+    "thumbnail, transcode, db_commit)",
+    ("pipeline", "stage")
+)
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency including the response body",
+                          ("method", "route"), buckets=HTTP_BUCKETS)
+
+
+def stage(pipeline: str, name: str) -> Timer:
+    """with metrics.stage("image", "inference"): ...；循环里请先取 STAGE_SECONDS.labels(...) 再 observe"""
+    return Timer(STAGE_SECONDS.labels(pipeline, name), span=name)
+
+
+# ================== 启动耗时 ==================
+
+def _process_start_time() -> float:
+    """进程的启动时间（含解释器启动和本模块之前的导入）；没有 /proc 时取本模块导入的时间"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_START = _process_start_time()
+# 阶段 -> 距进程启动的秒数：imported（导入 main 完成）/ first_response（第一个响应发完）/ model_ready
+_startup: Dict[str, float] = {}
+
+
+def mark_startup(phase: str):
+    """记录启动阶段完成的时间，每个阶段只记第一次"""
+    if phase not in _startup:
+        _startup[phase] = time.time() - PROCESS_START
+
+
+def startup_timings() -> Dict[str, float]:
+    return {phase: round(seconds, 3) for phase, seconds in _startup.items()}
+
+
+def _startup_metrics():
+    yield ("app_startup_seconds", "Seconds from process start until each startup phase completed",
+           [({"phase": phase}, seconds) for phase, seconds in _startup.items()])
+
+
+register_collector(_startup_metrics)
+
+
+# ================== 输出 ==================
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    for collector in list(_collectors):
+        try:
+            families = list(collector())
+        except Exception as e:
+            logger.warning(f"⚠️ 指标采集失败: {e}")
+            continue
+        for name, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ================== HTTP 中间件 ==================
+
+def _route_label(scope) -> str:
+    """
+    用路由模板（/api/records/{record_id}）而不是实际路径做标签，基数与路由数相同；
+    静态文件按挂载点计，没有匹配到路由的请求（404 扫描等）归为一类
+    """
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unknown")
+    path = scope.get("path", "")
+    if path.startswith("/files/"):
+        return "/".join(path.split("/", 3)[:3])
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """按 方法/路由/状态码 计数，并记录请求耗时（流式响应到最后一个字节为止）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        finished = None
+
+        async def send_with_status(message):
+            nonlocal status, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = time.perf_counter()
+                if "first_response" not in _startup:
+                    mark_startup("first_response")
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = _route_label(scope)
+            method = scope.get("method", "")
+            HTTP_REQUESTS.labels(method, route, status).inc()
+            # 响应发完之后运行的 BackgroundTasks 不算在请求耗时里
+            HTTP_DURATION.labels(method, route).observe((finished or time.perf_counter()) - start)
@@ -0,0 +1,156 @@
+"""
+轻量数据库迁移：按版本号顺序执行，已执行的版本记录在 schema_version 表中
+
+新增迁移时在 MIGRATIONS 末尾追加 (版本号, 说明, 函数)，函数需要可重复执行（先检查再修改），
+这样中途失败后重启可以从失败的那一步继续
+"""
+import logging
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, text, bindparam, Column, Integer, MetaData, Table, select, update
+from sqlalchemy.engine import Connection
+from db import engine
+from models import Base, DetectRecord
+from db_writer import summarize_objects, summarize_file
+from detection_index import index_records
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH = 5000
+
+_version_table = Table(
+    "schema_version", MetaData(),
+    Column("version", Integer, primary_key=True)
+)
+
+
+def _columns(conn: Connection, table: str) -> List[str]:
+    return [col["name"] for col in inspect(conn).get_columns(table)]
+
+
+def _add_missing_columns(conn: Connection, names: List[str]):
+    existing = _columns(conn, DetectRecord.__tablename__)
+    for name in names:
+        if name in existing:
+            continue
+        column = DetectRecord.__table__.c[name]
+        col_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {DetectRecord.__tablename__} ADD COLUMN {name} {col_type}"))
+        logger.info(f"🛠️ 新增列 {DetectRecord.__tablename__}.{name}")
+
+
+# ================== 迁移步骤 ==================
+
+def _add_result_url(conn: Connection):
+    _add_missing_columns(conn, ["result_url"])
+
+
+def _add_summary_columns(conn: Connection):
+    _add_missing_columns(conn, ["detection_count", "class_counts", "duration",
+                                "file_size", "result_available"])
+
+
+def _add_thumbnail_path(conn: Connection):
+    _add_missing_columns(conn, ["thumbnail_path"])
+    _create_indexes(conn)
+
+
+def _add_image_size(conn: Connection):
+    _add_missing_columns(conn, ["width", "height"])
+
+
+def _create_indexes(conn: Connection):
+    existing = set(_columns(conn, DetectRecord.__tablename__))
+    for index in DetectRecord.__table__.indexes:
+        # 列由后面的迁移新增时，索引也由那一步创建
+        if all(column.name in existing for column in index.columns):
+            index.create(conn, checkfirst=True)
+
+
+def _backfill_summaries(conn: Connection):
+    """旧记录按 id 分段回填摘要列，每段只解析一次 JSON"""
+    table = DetectRecord.__table__
+    last_id = 0
+    filled = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.objects, table.c.result_path)
+            .where(table.c.id > last_id, table.c.class_counts.is_(None))
+            .order_by(table.c.id)
+            .limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for record_id, objects, result_path in rows:
+            detection_count, class_counts = summarize_objects(objects)
+            available, size = summarize_file(result_path)
+            params.append({
+                "record_id": record_id,
+                "count": detection_count,
+                "counts": class_counts,
+                "available": available,
+                "size": size
+            })
+        conn.execute(
+            update(table).where(table.c.id == bindparam("record_id")).values(
+                detection_count=bindparam("count"),
+                class_counts=bindparam("counts", type_=table.c.class_counts.type),
+                result_available=bindparam("available"),
+                file_size=bindparam("size")
+            ),
+            params
+        )
+        last_id = rows[-1][0]
+        filled += len(rows)
+    if filled:
+        logger.info(f"🛠️ 已回填 {filled} 条记录的摘要列")
+
+
+def _backfill_detections(conn: Connection):
+    """把已有记录的 objects 展开到 detection 表并生成小时聚合；整步在一个事务里，失败重跑不会重复"""
+    table = DetectRecord.__table__
+    last_id = 0
+    indexed = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.type, table.c.detect_time, table.c.objects)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            break
+        indexed += index_records(conn, rows)
+        last_id = rows[-1][0]
+    if indexed:
+        logger.info(f"🛠️ 已为历史记录生成 {indexed} 条检测数据")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "add detect_record.result_url", _add_result_url),
+    (2, "add summary columns", _add_summary_columns),
+    (3, "index (type, detect_time) and detect_time", _create_indexes),
+    (4, "backfill summary columns", _backfill_summaries),
+    (5, "backfill detection / detection_stat", _backfill_detections),
+    (6, "index source_path and result_path", _create_indexes),
+    (7, "add detect_record.thumbnail_path", _add_thumbnail_path),
+    (8, "add detect_record.width / height", _add_image_size),
+]
+
+
+def run_migrations(bind=engine):
+    """建表并执行尚未执行的迁移，每一步单独提交"""
+    Base.metadata.create_all(bind=bind)
+    _version_table.create(bind=bind, checkfirst=True)
+
+    with bind.connect() as conn:
+        current = conn.execute(select(_version_table.c.version).order_by(
+            _version_table.c.version.desc()).limit(1)).scalar() or 0
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        with bind.begin() as conn:
+            migrate(conn)
+            conn.execute(_version_table.insert().values(version=version))
+        logger.info(f"✅ 数据库迁移 {version}: {description}")
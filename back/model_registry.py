@@ -0,0 +1,162 @@
+"""
+模型注册表：整个进程共享一份 YOLO 模型，第一次使用时才导入 ultralytics / torch 并加载
+
+原来三个路由模块在导入时各自 YOLO(MODEL_PATH)，导入 main 要加载三次模型，--reload 每次重启都要等。
+现在各路由持有同一个 LazyModel 代理，访问 predict / track / names 时才加载；
+MODEL_PRELOAD 时应用启动后在后台线程预加载（并按 MODEL_WARMUP 空跑一次），
+加载完成前服务已经可以响应，/health/ready 据此报告是否可以接流量。
+
+加载失败时抛出 ModelUnavailable（main 中转成 503），下一次使用时重新尝试加载。
+"""
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+import numpy as np
+from config import MODEL_PATH, MODEL_PRELOAD, MODEL_WARMUP, MODEL_WARMUP_IMGSZ
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 结果文件按 (原图摘要, 参数, 模型) 寻址（blob_store.derived_key）；换了模型文件就不再复用旧结果
+MODEL_TAG = f"{os.path.getsize(MODEL_PATH)}-{int(os.path.getmtime(MODEL_PATH))}" if os.path.exists(MODEL_PATH) else MODEL_PATH
+
+# 状态：cold（未加载）/ loading / warming / ready / failed
+STATES = ("cold", "loading", "warming", "ready", "failed")
+
+
+def _device() -> str:
+    """CUDA 可用时为 cuda；没有安装 torch（如使用替身检测器）时按 cpu 处理"""
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class ModelUnavailable(RuntimeError):
+    """模型加载失败"""
+
+
+class ModelRegistry:
+    def __init__(self, path: str = MODEL_PATH, preload: bool = MODEL_PRELOAD, warmup: bool = MODEL_WARMUP):
+        self.path = path
+        self.preload_enabled = preload
+        self.warmup_enabled = warmup
+        self._model = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.state = "cold"
+        self.error: Optional[str] = None
+        self.device: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.ready_at: Optional[float] = None
+
+    # ---------- 加载 ----------
+
+    def get(self):
+        """返回已加载的模型；尚未加载时在当前线程加载（其它线程正在加载时等它完成）"""
+        model = self._model
+        if model is not None:
+            return model
+        with self._lock:
+            if self._model is None:
+                self._load()
+            return self._model
+
+    def _load(self):
+        self.state, self.error = "loading", None
+        start = time.perf_counter()
+        try:
+            # 重量级依赖只在这里导入
+            from ultralytics import YOLO
+            self.device = _device()
+            model = YOLO(self.path)
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            logger.error(f"❌ 模型加载失败: {e}")
+            raise ModelUnavailable(f"模型加载失败: {e}") from e
+        self.load_seconds = time.perf_counter() - start
+        logger.info(f"✅ 模型加载成功（{self.load_seconds:.1f}s，设备: {self.device.upper()}），"
+                    f"类别数: {len(model.names)} | 类别: {model.names}")
+
+        if self.warmup_enabled:
+            self.state = "warming"
+            start = time.perf_counter()
+            try:
+                blank = np.zeros((MODEL_WARMUP_IMGSZ, MODEL_WARMUP_IMGSZ, 3), dtype=np.uint8)
+                model.predict(blank, imgsz=MODEL_WARMUP_IMGSZ, save=False, verbose=False)
+                self.warmup_seconds = time.perf_counter() - start
+            except Exception as e:
+                # 预热失败不影响使用，第一次推理时再初始化
+                logger.warning(f"⚠️ 模型预热失败: {e}")
+        self._model = model
+        self.state = "ready"
+        self.ready_at = time.time()
+        metrics.mark_startup("model_ready")
+
+    def preload(self) -> bool:
+        """在后台线程加载模型；已加载或正在加载时返回 False"""
+        with self._lock:
+            if self._model is not None or (self._thread is not None and self._thread.is_alive()):
+                return False
+            self._thread = threading.Thread(target=self._preload, name="model-preload", daemon=True)
+            self._thread.start()
+        return True
+
+    def _preload(self):
+        try:
+            self.get()
+        except ModelUnavailable:
+            pass
+
+    def start(self):
+        """应用启动时调用：按 MODEL_PRELOAD 决定是否预加载"""
+        if self.preload_enabled:
+            self.preload()
+
+    # ---------- 状态 ----------
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "device": self.device,
+            "error": self.error,
+            "load_seconds": None if self.load_seconds is None else round(self.load_seconds, 3),
+            "warmup_seconds": None if self.warmup_seconds is None else round(self.warmup_seconds, 3),
+            "preload": self.preload_enabled
+        }
+
+
+class LazyModel:
+    """路由中 model.predict(...) / model.names 等属性访问转给注册表里的模型，第一次访问时触发加载"""
+
+    def __init__(self, registry: ModelRegistry):
+        self._registry = registry
+
+    def __getattr__(self, name: str):
+        return getattr(self._registry.get(), name)
+
+
+model_registry = ModelRegistry()
+model = LazyModel(model_registry)
+
+
+def _model_metrics():
+    yield ("model_ready", "1 once the detection model is loaded (and warmed up)",
+           [({}, 1.0 if model_registry.ready else 0.0)])
+    yield ("model_state", "Detection model loading state",
+           [({"state": state}, 1.0 if model_registry.state == state else 0.0) for state in STATES])
+    if model_registry.load_seconds is not None:
+        yield ("model_load_seconds", "Time spent importing the framework and loading the model",
+               [({}, model_registry.load_seconds)])
+
+
+metrics.register_collector(_model_metrics)
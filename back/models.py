@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, Float, Boolean, Index, SmallInteger
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import JSON
 from datetime import datetime
@@ -14,4 +14,81 @@ class DetectRecord(Base):
     result_path = Column(String(512))
     result_url = Column(String(512))
     objects = Column(JSON)
-    detect_time = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    detect_time = Column(DateTime, default=datetime.utcnow)
+
+    # 写入时计算的摘要，列表页直接读取，不再解析 objects 或访问文件系统
+    detection_count = Column(Integer, default=0)
+    class_counts = Column(JSON)
+    duration = Column(Float)  # 视频类记录的时长（秒）
+    file_size = Column(BigInteger)  # 结果文件大小（字节）
+    result_available = Column(Boolean, default=False)
+    # 列表页的缩略图（视频为封面帧），见 thumbnails；空字符串表示无法生成，回填不再重试
+    thumbnail_path = Column(String(512))
+    # 图片/抓拍原图的尺寸（像素），COCO 导出需要；加列之前的旧记录为空，导出时从原图读取
+    width = Column(Integer)
+    height = Column(Integer)
+
+    __table_args__ = (
+        # 列表页按类型筛选并按时间倒序
+        Index("ix_detect_record_type_time", "type", "detect_time"),
+        Index("ix_detect_record_detect_time", "detect_time"),
+        # 存储巡检按文件路径反查记录
+        Index("ix_detect_record_source_path", "source_path"),
+        Index("ix_detect_record_result_path", "result_path"),
+        # 巡检反查缩略图引用；回填按 thumbnail_path IS NULL 查找待处理的记录
+        Index("ix_detect_record_thumbnail_path", "thumbnail_path"),
+    )
+
+
+class Detection(Base):
+    """
+    objects 展开后的单个目标，写入记录时同步生成，用于跨记录检索
+    图片/抓拍每个检测框一行；视频和事件录像每个跟踪目标一行（与 detection_count 口径一致）
+    type、detect_time 从记录冗余过来，检索时不需要关联 detect_record
+    """
+    __tablename__ = "detection"
+    id = Column(Integer, primary_key=True)
+    record_id = Column(Integer, nullable=False)
+    type = Column(String(20))
+    detect_time = Column(DateTime)
+    class_name = Column(String(64))
+    confidence = Column(Float)  # 视频目标为整段跟踪中的最高置信度，旧记录没有时为空
+    x1 = Column(Integer)
+    y1 = Column(Integer)
+    x2 = Column(Integer)
+    y2 = Column(Integer)
+    area = Column(Integer)
+    track_id = Column(Integer)  # 视频/事件中的目标编号
+    frame = Column(Integer)  # 视频中首次出现的帧号
+
+    __table_args__ = (
+        # 按（类别 +）时间倒序检索；置信度/面积/类型也放进索引，筛选时不回表
+        Index("ix_detection_class_time", "class_name", "detect_time", "record_id", "confidence", "area", "type"),
+        Index("ix_detection_time", "detect_time", "record_id", "confidence", "area", "type"),
+        Index("ix_detection_record", "record_id"),
+    )
+
+
+class DetectionStat(Base):
+    """
+    按小时和按天两级预聚合的目标计数，写入/删除记录时增量维护
+    直方图和置信度分布只读这张表：整天的范围读天级，首尾不足一天的部分读小时级，
+    扫描行数与时间跨度和类别数成正比，与目标总数无关
+    """
+    __tablename__ = "detection_stat"
+    period = Column(String(8), primary_key=True)  # hour / day
+    bucket = Column(DateTime, primary_key=True)  # 整点或零点（UTC）
+    type = Column(String(20), primary_key=True)
+    class_name = Column(String(64), primary_key=True)
+    conf_bin = Column(SmallInteger, primary_key=True)  # floor(confidence * 10)，0~9；未知置信度为 -1
+    count = Column(Integer, nullable=False, default=0)
+
+
+class KeptFile(Base):
+    """
+    删除记录时要求保留（delete_files=false）的文件
+    记录删除后这些文件不再被引用，存储巡检和之后的删除都把这里的路径当作仍被引用，不会清理
+    """
+    __tablename__ = "kept_file"
+    path = Column(String(512), primary_key=True)
+    kept_at = Column(DateTime, default=datetime.utcnow)
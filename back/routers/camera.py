@@ -1,174 +1,367 @@
-from fastapi import APIRouter, UploadFile, File
+from fastapi import APIRouter, UploadFile, File, HTTPException, Body, Query, WebSocket
 from fastapi.responses import StreamingResponse
-import cv2, time, os, aiofiles
-from config import CAMERA_DIR, RESULT_DIR, MODEL_PATH
-from ultralytics import YOLO
-from db import SessionLocal
-from models import DetectRecord
+import cv2, time, os
+from config import CAMERA_DIR, RESULT_DIR, DEFAULT_CAMERA_SOURCE
+from model_registry import model, MODEL_TAG
+from db_writer import record_writer
+import blob_store
+import thumbnails
+import metrics
+import tracing
+from analytics import AnalyticsEngine, parse_analytics_config
+from camera_manager import CameraManager, check_source_allowed
+from event_recorder import EventRecorder, parse_event_config
+from routers.video import convert_to_h264_compatible
+from live_stream import serve_live_websocket
 import numpy as np
-import threading
+import copy
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-model = YOLO(MODEL_PATH)
 
 # -----------------------------
-# 全局变量
+# 多路摄像头管理（共享一个合批推理线程）
 # -----------------------------
-latest_frame = None
-latest_detections = []
-stop_camera = False
-camera_started = False
+camera_manager = CameraManager(model)
+metrics.register_collector(camera_manager.collect_metrics)
+DEFAULT_CAMERA_ID = "default"
 
-# -----------------------------
-# 摄像头读取线程
-# -----------------------------
-def camera_reader():
-    global latest_frame, stop_camera
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-    cap.set(cv2.CAP_PROP_FPS, 30)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-    if not cap.isOpened():
-        print("❌ 无法打开摄像头")
-        return
 
-    while not stop_camera:
-        ret, frame = cap.read()
-        if ret:
-            latest_frame = frame
-        time.sleep(0.001)
-    cap.release()
+def _get_camera(cam_id: str):
+    # 兼容旧接口：默认摄像头在第一次访问时按配置注册
+    if cam_id == DEFAULT_CAMERA_ID and camera_manager.get(cam_id) is None:
+        try:
+            camera_manager.register(DEFAULT_CAMERA_ID, DEFAULT_CAMERA_SOURCE)
+        except ValueError:
+            pass
+    camera = camera_manager.get(cam_id)
+    if camera is None:
+        raise HTTPException(status_code=404, detail="摄像头不存在")
+    return camera
 
 # -----------------------------
-# YOLO 异步推理线程
+# 摄像头注册与查询
 # -----------------------------
-def yolo_worker(conf=0.25):
-    global latest_frame, latest_detections, stop_camera
-    frame_count = 0
-
-    while not stop_camera:
-        if latest_frame is None:
-            time.sleep(0.01)
-            continue
-
-        frame_count += 1
-        # 每隔2帧做一次推理
-        if frame_count % 2 != 0:
-            time.sleep(0.01)
-            continue
-
-        frame = latest_frame.copy()
-        results = model.predict(frame, imgsz=416, conf=conf, save=False, verbose=False)
-        r = results[0]
-
-        new_detections = []
-        if r.boxes is not None and len(r.boxes) > 0:
-            for box, conf_i, cls_i in zip(r.boxes.xyxy.tolist(), r.boxes.conf.tolist(), r.boxes.cls.tolist()):
-                new_detections.append({
-                    "class": model.names[int(cls_i)],
-                    "conf": float(conf_i),
-                    "bbox": list(map(int, box))
-                })
-        latest_detections[:] = new_detections  # 更新检测结果
+@router.get("/camera/list")
+def list_cameras():
+    return {"cameras": camera_manager.list(), "inference": camera_manager.stats()}
 
-# -----------------------------
-# MJPEG 推流生成器
-# -----------------------------
-def gen_frames():
-    global latest_frame, latest_detections
-    while True:
-        if latest_frame is None:
-            time.sleep(0.01)
-            continue
-
-        frame = latest_frame.copy()
-
-        # 绘制最新检测框
-        for det in latest_detections:
-            x1, y1, x2, y2 = det["bbox"]
-            label = det["class"]
-            conf = det["conf"]
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(frame, f"{label} {conf:.2f}", (x1, max(15, y1 - 5)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
-        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 75])
-        frame_bytes = buffer.tobytes()
+@router.post("/camera/register")
+def register_camera(cam_id: str, source: str, start: bool = False):
+    """
+    注册摄像头源：设备号（0、/dev/video0）、RTSP/HTTP 地址或本地视频文件（循环播放）
+    只接受配置的白名单内的源，见 config.CAMERA_ALLOWED_*、CAMERA_FILE_DIR
+    """
+    if not cam_id or not cam_id.replace("_", "").replace("-", "").isalnum():
+        raise HTTPException(status_code=400, detail="无效的 cam_id")
+    try:
+        check_source_allowed(source)
+        camera = camera_manager.register(cam_id, source)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if start:
+        camera_manager.acquire(cam_id, "manual")
+    return camera.info()
+
+
+@router.get("/camera/controller")
+def get_live_controller():
+    """当前实时推理的有效频率、滞后、输入尺寸和步长"""
+    return camera_manager.controller.info()
+
+
+@router.post("/camera/controller")
+def configure_live_controller(
+    target_hz: float = Query(None, gt=0, le=60),
+    max_staleness_ms: float = Query(None, gt=0),
+    enabled: bool = None,
+    imgsz: int = Query(None, ge=160, le=1280),
+    stride: int = Query(None, ge=1)
+):
+    camera_manager.controller.configure(target_hz, max_staleness_ms, enabled, imgsz, stride)
+    return camera_manager.controller.info()
+
 
-        yield (
-            b"--frame\r\n"
-            b"Content-Type: image/jpeg\r\n\r\n" +
-            frame_bytes +
-            b"\r\n"
-        )
-        time.sleep(0.01)
+def _camera_status(camera) -> dict:
+    info = camera.info()
+    info["subscribers"] = sum(info["leases"].values())
+    info["idle_timeout"] = camera_manager.idle_timeout
+    info["inference_running"] = camera_manager.worker_running
+    return info
+
+
+@router.post("/camera/start")
+def start_camera(cam_id: str = DEFAULT_CAMERA_ID):
+    """
+    手动启动摄像头和推理，直到调用 /camera/stop；重复调用不会叠加
+    """
+    camera = _get_camera(cam_id)
+    if "manual" not in camera.leases:
+        camera_manager.acquire(cam_id, "manual")
+    return _camera_status(camera)
+
+
+@router.post("/camera/stop")
+def stop_camera(cam_id: str = DEFAULT_CAMERA_ID):
+    """
+    撤销手动启动；仍有观看者或事件录像时继续运行，全部离开后按空闲超时关闭
+    """
+    camera = _get_camera(cam_id)
+    if "manual" in camera.leases:
+        camera_manager.release(cam_id, "manual")
+    return _camera_status(camera)
+
+
+@router.get("/camera/status")
+def camera_status(cam_id: str = DEFAULT_CAMERA_ID):
+    return _camera_status(_get_camera(cam_id))
+
+
+@router.delete("/camera/{cam_id}")
+def unregister_camera(cam_id: str):
+    _get_camera(cam_id)
+    camera_manager.unregister(cam_id)
+    return {"status": "removed", "cam_id": cam_id}
 
 # -----------------------------
 # 摄像头流接口
 # -----------------------------
 @router.get("/camera/stream")
 def stream_camera():
-    global camera_started
-    if not camera_started:
-        camera_started = True
-        threading.Thread(target=camera_reader, daemon=True).start()
-        threading.Thread(target=yolo_worker, daemon=True).start()
+    return stream_camera_by_id(DEFAULT_CAMERA_ID)
+
+
+@router.get("/camera/{cam_id}/stream")
+def stream_camera_by_id(cam_id: str):
+    _get_camera(cam_id)
 
+    # 所有观看者共享同一个编码结果
     return StreamingResponse(
-        gen_frames(),
+        _leased_stream(cam_id),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
+
+async def _leased_stream(cam_id: str):
+    # 连接期间占用一个订阅，断开后释放，最后一个观看者离开后摄像头按空闲超时关闭
+    with camera_manager.lease(cam_id, "stream") as camera:
+        async for part in camera.broadcaster.stream():
+            yield part
+
+
+@router.websocket("/camera/{cam_id}/ws")
+async def camera_websocket(
+    websocket: WebSocket,
+    cam_id: str,
+    mode: str = "both",
+    max_fps: float = 0
+):
+    """
+    二进制消息为原始 JPEG 帧（带帧头），文本消息为每次推理的检测结果
+    mode: both / frames / detections；max_fps 限制帧率（0 表示不限）
+    """
+    camera = camera_manager.get(cam_id)
+    if camera is None and cam_id == DEFAULT_CAMERA_ID:
+        camera = _get_camera(cam_id)
+    if camera is None or mode not in ("both", "frames", "detections"):
+        await websocket.close(code=1008)
+        return
+    with camera_manager.lease(cam_id, "websocket"):
+        await serve_live_websocket(websocket, camera, mode=mode, max_fps=max(0.0, max_fps))
+
+
+@router.get("/camera/{cam_id}/detections")
+def get_camera_detections(cam_id: str):
+    _get_camera(cam_id)
+    camera = camera_manager.touch(cam_id)
+    detections, seq, frame_time = camera.get_detections()
+    return {
+        "cam_id": cam_id,
+        "seq": seq,
+        "timestamp": frame_time,
+        "detections": detections
+    }
+
+# -----------------------------
+# 实时分析配置
+# -----------------------------
+@router.post("/camera/{cam_id}/analytics")
+def set_camera_analytics(cam_id: str, config: dict = Body(...)):
+    camera = _get_camera(cam_id)
+    try:
+        parsed = parse_analytics_config(config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with camera.analytics_lock:
+        # 实时场景只保留最近的事件和时间窗口，避免无限增长
+        camera.analytics = AnalyticsEngine(parsed, max_events=500, max_windows=500) if parsed else None
+    return {"status": "configured", "cam_id": cam_id, "config": parsed}
+
+
+@router.get("/camera/{cam_id}/analytics")
+def get_camera_analytics(cam_id: str):
+    camera = _get_camera(cam_id)
+    engine = camera.analytics
+    if engine is None:
+        raise HTTPException(status_code=404, detail="未配置实时分析")
+    with camera.analytics_lock:
+        return copy.deepcopy(engine.snapshot())
+
+
+@router.delete("/camera/{cam_id}/analytics")
+def clear_camera_analytics(cam_id: str):
+    camera = _get_camera(cam_id)
+    with camera.analytics_lock:
+        camera.analytics = None
+    return {"status": "cleared", "cam_id": cam_id}
+
+# -----------------------------
+# 事件触发录像
+# -----------------------------
+def _save_camera_event(event: dict):
+    """在编码线程中调用：转码为网页兼容格式并写入检测记录"""
+    convert_to_h264_compatible(event["temp_path"], event["clip_path"], pipeline="event")
+
+    clip_name = os.path.basename(event["clip_path"])
+    result_url = f"/files/camera/{clip_name}"
+    thumbnail_path = thumbnails.create_for_file("camera_event", event["clip_path"])
+    # 编码线程可以直接阻塞等待后台写入线程分配的 id
+    try:
+        event["record_id"] = record_writer.submit_insert(
+            type="camera_event",
+            filename=clip_name,
+            source_path=event["clip_path"],
+            result_path=event["clip_path"],
+            result_url=result_url,
+            thumbnail_path=thumbnail_path,
+            duration=event["end_time"] - event["start_time"],
+            objects=json.dumps({
+                "event_id": event["event_id"],
+                "cam_id": event["cam_id"],
+                "rules": sorted(event["rules"]),
+                "trigger_time": event["trigger_time"],
+                "start_time": event["start_time"],
+                "end_time": event["end_time"],
+                "frames": event["frames"],
+                "detections": event["detections"]
+            })
+        ).result()
+    finally:
+        blob_store.release(thumbnail_path)
+    event["result_url"] = result_url
+
+
+@router.post("/camera/{cam_id}/events")
+def set_camera_events(cam_id: str, config: dict = Body(...)):
+    """
+    配置触发规则（类别、最低置信度、区域），命中时保存带预录和后录的片段
+    """
+    camera = _get_camera(cam_id)
+    try:
+        parsed = parse_event_config(config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 规则依赖实时推理，录像器在配置期间占用一个订阅，保持摄像头运行
+    camera_manager.set_recorder(cam_id, EventRecorder(camera, parsed, on_event=_save_camera_event))
+    return {"status": "configured", "cam_id": cam_id, "config": parsed}
+
+
+@router.get("/camera/{cam_id}/events")
+def get_camera_events(cam_id: str):
+    camera = _get_camera(cam_id)
+    recorder = camera.recorder
+    if recorder is None:
+        raise HTTPException(status_code=404, detail="未配置事件录像")
+    return recorder.info()
+
+
+@router.delete("/camera/{cam_id}/events")
+def clear_camera_events(cam_id: str):
+    _get_camera(cam_id)
+    camera_manager.set_recorder(cam_id, None)
+    return {"status": "cleared", "cam_id": cam_id}
+
 # -----------------------------
 # 单帧抓拍模式（保持原样）
 # -----------------------------
 @router.post("/camera/frame")
-async def camera_frame(file: UploadFile = File(...), conf: float = 0.25):
+async def camera_frame(
+    file: UploadFile = File(...),
+    conf: float = 0.25,
+    timings: bool = Query(False, description="响应中附带各阶段耗时（毫秒）")
+):
     timestamp = int(time.time() * 1000)
     save_name = f"{timestamp}_{file.filename}"
-    save_path = os.path.join(CAMERA_DIR, save_name)
+    with metrics.stage("camera", "upload_read"):
+        source = await blob_store.put_upload(file, CAMERA_DIR, os.path.splitext(file.filename)[1] or ".jpg")
+    try:
+        response = await _detect_frame(source, save_name, conf)
+    finally:
+        blob_store.release(source.path)
+    if timings:
+        response["timings"] = tracing.timings()
+    return response
 
-    async with aiofiles.open(save_path, "wb") as out_file:
-        content = await file.read()
-        await out_file.write(content)
 
-    frame = cv2.imdecode(np.frombuffer(open(save_path, 'rb').read(), np.uint8), cv2.IMREAD_COLOR)
+async def _detect_frame(source: blob_store.Blob, save_name: str, conf: float):
+    with metrics.stage("camera", "decode"):
+        frame = cv2.imread(source.path)
+    if frame is None:
+        raise HTTPException(status_code=400, detail="无法解码图片")
 
-    results = model.predict(frame, imgsz=960, conf=conf, save=False, verbose=False)
+    with metrics.stage("camera", "inference"):
+        results = model.predict(frame, imgsz=960, conf=conf, save=False, verbose=False)
     r = results[0]
 
     detections = []
     img = frame.copy()
 
-    if r.boxes is not None and len(r.boxes) > 0:
-        for box, conf_i, cls_i in zip(r.boxes.xyxy.tolist(), r.boxes.conf.tolist(), r.boxes.cls.tolist()):
-            x1, y1, x2, y2 = map(int, box)
-            label = model.names[int(cls_i)]
-            detections.append({"class": label, "conf": float(conf_i), "bbox": [x1, y1, x2, y2]})
+    with metrics.stage("camera", "postprocess"):
+        if r.boxes is not None and len(r.boxes) > 0:
+            for box, conf_i, cls_i in zip(r.boxes.xyxy.tolist(), r.boxes.conf.tolist(), r.boxes.cls.tolist()):
+                x1, y1, x2, y2 = map(int, box)
+                detections.append({"class": model.names[int(cls_i)], "conf": float(conf_i), "bbox": [x1, y1, x2, y2]})
+
+    with metrics.stage("camera", "draw"):
+        for d in detections:
+            x1, y1, x2, y2 = d["bbox"]
             cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(img, f"{label} {conf_i:.2f}", (x1, max(15, y1 - 5)),
+            cv2.putText(img, f"{d['class']} {d['conf']:.2f}", (x1, max(15, y1 - 5)),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
-    out_name = f"res_{save_name}"
-    out_path = os.path.join(RESULT_DIR, out_name)
-    cv2.imwrite(out_path, img)
-
-    db = SessionLocal()
-    record = DetectRecord(
-        type="camera",
-        filename=save_name,
-        source_path=save_path,
-        result_path=out_path,
-        objects=detections
-    )
-    db.add(record)
-    db.commit()
-    db.refresh(record)
-    db.close()
+    with metrics.stage("camera", "encode"):
+        ok, buffer = cv2.imencode(".jpg", img)
+        if not ok:
+            raise HTTPException(status_code=500, detail="结果图片编码失败")
+        # 与图片检测一样按模型区分结果，换了模型文件不会复用或碰到旧结果
+        result_key = blob_store.derived_key(source.digest, "camera", conf, MODEL_TAG)
+        result = blob_store.put_bytes(RESULT_DIR, result_key, buffer.tobytes(), ".jpg")
+    with metrics.stage("camera", "thumbnail"):
+        thumbnail_path = thumbnails.from_image(img)
+    try:
+        with tracing.span("db_commit"):
+            record_id = await record_writer.insert(
+                type="camera",
+                filename=save_name,
+                source_path=source.path,
+                result_path=result.path,
+                thumbnail_path=thumbnail_path,
+                objects=detections,
+                width=frame.shape[1],
+                height=frame.shape[0]
+            )
+    finally:
+        blob_store.release(result.path, thumbnail_path)
 
     return {
-        "id": record.id,
-        "result_url": f"/api/files/result/{os.path.basename(out_path)}",
+        "id": record_id,
+        "result_url": f"/api/files/result/{os.path.relpath(result.path, RESULT_DIR).replace(os.sep, '/')}",
+        "thumbnail_url": thumbnails.thumbnail_url(thumbnail_path),
         "objects": detections
     }
@@ -1,42 +1,31 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
 from fastapi.responses import FileResponse, JSONResponse
 import os
 import time
-import aiofiles
 import json
 from typing import List, Dict, Any
-from config import UPLOAD_DIR, RESULT_DIR, MODEL_PATH
+from config import UPLOAD_DIR, RESULT_DIR
 from db import SessionLocal
-from models import DetectRecord, Base
-from ultralytics import YOLO
+from db_writer import record_writer
+from models import DetectRecord
+import blob_store
+import thumbnails
+import metrics
+import tracing
+from model_registry import model, MODEL_TAG
 import cv2
 import numpy as np
 import base64
 
 router = APIRouter()
-model = YOLO(MODEL_PATH)
-
-
-# 初始化数据库表
-def init_db():
-    from db import engine
-    from sqlalchemy import inspect, text
-
-    Base.metadata.create_all(bind=engine)
-
-    inspector = inspect(engine)
-    columns = [col["name"] for col in inspector.get_columns("detect_record")]
-    if "result_url" not in columns:
-        with engine.connect() as conn:
-            conn.execute(text("ALTER TABLE detect_record ADD COLUMN result_url TEXT"))
-            conn.commit()
-
-
-init_db()
 
 
 @router.post("/detect/image")
-async def detect_image(file: UploadFile = File(...), conf: float = 0.25):
+async def detect_image(
+    file: UploadFile = File(...),
+    conf: float = 0.25,
+    timings: bool = Query(False, description="响应中附带各阶段耗时（毫秒）")
+):
     """
     增强的图像检测接口 - 支持框编号和自定义显示
     """
@@ -46,89 +35,70 @@ async def detect_image(file: UploadFile = File(...), conf: float = 0.25):
 
     timestamp = int(time.time() * 1000)
     save_name = f"{timestamp}_{file.filename}"
-    save_path = os.path.join(UPLOAD_DIR, save_name)
-
-    async with aiofiles.open(save_path, "wb") as out_file:
-        content = await file.read()
-        await out_file.write(content)
-
-    results = model.predict(source=save_path, imgsz=1280, conf=conf, save=False, verbose=False)
-    r = results[0]
-
-    img = cv2.imread(save_path)
-    if img is None:
-        raise HTTPException(status_code=500, detail="无法读取图片文件")
-
-    detections = []
-    detection_id = 1
-
-    if r.boxes is not None and len(r.boxes) > 0:
-        boxes = r.boxes.xyxy.cpu().numpy()
-        confs = r.boxes.conf.cpu().numpy()
-        cls_ids = r.boxes.cls.cpu().numpy().astype(int)
-
-        for box, confs_i, cls_i in zip(boxes, confs, cls_ids):
-            x1, y1, x2, y2 = map(int, box)
-            label = model.names[int(cls_i)]
-            color = get_color_by_class_and_id(label, detection_id)
-
-            detection_info = {
-                "id": detection_id,
-                "class": label,
-                "confidence": float(confs_i),
-                "bbox": [x1, y1, x2, y2],
-                "color": color,
-                "visible": True,
-                "area": (x2 - x1) * (y2 - y1)
-            }
-            detections.append(detection_info)
-            draw_detection_box(img, detection_info)
-            detection_id += 1
+    with metrics.stage("image", "upload_read"):
+        source = await blob_store.put_upload(file, UPLOAD_DIR, suffix)
+    result_key = blob_store.derived_key(source.digest, "image", conf, MODEL_TAG)
+    result_path = blob_store.blob_path(RESULT_DIR, result_key, ".jpg")
+    pinned = [source.path]
+    try:
+        # 同一张图用同样的参数检测过：复用结果图和检测结果，不再推理
+        detections, img = _reusable_result(result_path)
+        if detections is None:
+            detections, img = _detect_and_draw(source.path, result_key, conf)
+        pinned.append(result_path)
+        out_name = _result_name(result_path)
+        height, width = img.shape[:2]
+        image_size = f"{width}x{height}"
+        # 列表页的缩略图由画好框的结果图缩小得到
+        with metrics.stage("image", "thumbnail"):
+            thumbnail_path = thumbnails.from_image(img)
+        pinned.append(thumbnail_path)
 
-    out_name = f"res_{save_name}"
-    out_path = os.path.join(RESULT_DIR, out_name)
-    cv2.imwrite(out_path, img)
+        try:
+            # 写入由后台线程合批提交，这里只等待分配到的记录 id
+            with tracing.span("db_commit"):
+                record_id = await record_writer.insert(
+                    type="image",
+                    filename=save_name,
+                    source_path=source.path,
+                    result_path=result_path,
+                    result_url=f"/files/result/{out_name}",  # ✅ 关键：保存 result_url
+                    thumbnail_path=thumbnail_path,
+                    objects=json.dumps(detections),
+                    width=width,
+                    height=height
+                )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"数据库保存失败: {str(e)}")
+    finally:
+        blob_store.release(*pinned)
 
-    db = SessionLocal()
-    try:
-        record = DetectRecord(
-            type="image",
-            filename=save_name,
-            source_path=save_path,
-            result_path=out_path,
-            result_url=f"/files/result/{out_name}",  # ✅ 关键：保存 result_url
-            objects=json.dumps(detections)
-        )
-        db.add(record)
-        db.commit()
-        db.refresh(record)
-
-        return {
-            "id": record.id,
-            "result_url": f"/files/result/{out_name}",
-            "detections": detections,
-            "summary": {
-                "total_detections": len(detections),
-                "classes_count": count_classes(detections),
-                "image_size": f"{img.shape[1]}x{img.shape[0]}"
-            },
-            "config": {
-                "confidence_threshold": conf,
-                "detection_ids": list(range(1, len(detections) + 1))
-            }
+    response = {
+        "id": record_id,
+        "result_url": f"/files/result/{out_name}",
+        "thumbnail_url": thumbnails.thumbnail_url(thumbnail_path),
+        "detections": detections,
+        "summary": {
+            "total_detections": len(detections),
+            "classes_count": count_classes(detections),
+            "image_size": image_size
+        },
+        "config": {
+            "confidence_threshold": conf,
+            "detection_ids": list(range(1, len(detections) + 1))
         }
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"数据库保存失败: {str(e)}")
-    finally:
-        db.close()
+    }
+    if timings:
+        response["timings"] = tracing.timings()
+    return response
 
 
 @router.post("/detect/image/custom")
 async def detect_image_custom(
     file: UploadFile = File(...),
     conf: float = 0.25,
-    hidden_ids: str = ""
+    hidden_ids: str = "",
+    timings: bool = Query(False, description="响应中附带各阶段耗时（毫秒）")
 ):
     """
     自定义显示/隐藏检测框的接口
@@ -144,59 +114,28 @@ async def detect_image_custom(
     if suffix not in [".jpg", ".jpeg", ".png", ".bmp"]:
         raise HTTPException(status_code=400, detail="不支持的图片格式")
 
-    timestamp = int(time.time() * 1000)
-    save_name = f"{timestamp}_{file.filename}"
-    save_path = os.path.join(UPLOAD_DIR, save_name)
-
-    async with aiofiles.open(save_path, "wb") as out_file:
-        content = await file.read()
-        await out_file.write(content)
-
-    results = model.predict(source=save_path, imgsz=1280, conf=conf, save=False, verbose=False)
-    r = results[0]
-    img = cv2.imread(save_path)
-    if img is None:
-        raise HTTPException(status_code=500, detail="无法读取图片文件")
-
-    detections = []
-    detection_id = 1
-
-    if r.boxes is not None and len(r.boxes) > 0:
-        boxes = r.boxes.xyxy.cpu().numpy()
-        confs = r.boxes.conf.cpu().numpy()
-        cls_ids = r.boxes.cls.cpu().numpy().astype(int)
-
-        for box, confs_i, cls_i in zip(boxes, confs, cls_ids):
-            x1, y1, x2, y2 = map(int, box)
-            label = model.names[int(cls_i)]
-            is_visible = detection_id not in hidden_id_list
-            color = get_color_by_class_and_id(label, detection_id)
-
-            detection_info = {
-                "id": detection_id,
-                "class": label,
-                "confidence": float(confs_i),
-                "bbox": [x1, y1, x2, y2],
-                "color": color,
-                "visible": is_visible,
-                "area": (x2 - x1) * (y2 - y1)
-            }
-            detections.append(detection_info)
-            if is_visible:
-                draw_detection_box(img, detection_info)
-            detection_id += 1
-
-    out_name = f"res_custom_{save_name}"
-    out_path = os.path.join(RESULT_DIR, out_name)
-    cv2.imwrite(out_path, img)
+    with metrics.stage("image", "upload_read"):
+        source = await blob_store.put_upload(file, UPLOAD_DIR, suffix)
+    result_key = blob_store.derived_key(source.digest, "custom", conf, sorted(set(hidden_id_list)), MODEL_TAG)
+    result_path = blob_store.blob_path(RESULT_DIR, result_key, ".jpg")
+    try:
+        detections, _ = _detect_and_draw(source.path, result_key, conf, hidden_id_list)
+        # 预览结果不写记录，上传文件和结果图过了宽限期由存储巡检清理
+        blob_store.release(result_path)
+    finally:
+        blob_store.release(source.path)
+    out_name = _result_name(result_path)
 
-    return {
+    response = {
         "result_url": f"/files/result/{out_name}",  # ✅ 修正：去掉 /api 前缀
         "detections": detections,
         "hidden_ids": hidden_id_list,
         "visible_count": len([d for d in detections if d["visible"]]),
         "hidden_count": len(hidden_id_list)
     }
+    if timings:
+        response["timings"] = tracing.timings()
+    return response
 
 
 @router.post("/detect/image/preview")
@@ -268,25 +207,111 @@ async def toggle_detection_visibility(record_id: int, detection_id: int, visible
         record = db.query(DetectRecord).filter(DetectRecord.id == record_id).first()
         if not record:
             raise HTTPException(status_code=404, detail="记录不存在")
-
         detections = json.loads(record.objects) if record.objects else []
-        for detection in detections:
-            if detection.get("id") == detection_id:
-                detection["visible"] = visible
-                break
+    finally:
+        db.close()
 
-        record.objects = json.dumps(detections)
-        db.commit()
+    for detection in detections:
+        if detection.get("id") == detection_id:
+            detection["visible"] = visible
+            break
 
-        return {"success": True, "detection_id": detection_id, "visible": visible}
+    try:
+        await record_writer.update(record_id, objects=json.dumps(detections))
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"更新失败: {str(e)}")
+
+    return {"success": True, "detection_id": detection_id, "visible": visible}
+
+
+# ========== 工具函数 ==========
+
+def _result_name(result_path: str) -> str:
+    """结果文件相对结果目录的路径，用于 /files/result/ 下的 URL"""
+    return os.path.relpath(result_path, RESULT_DIR).replace(os.sep, "/")
+
+
+def _reusable_result(result_path: str):
+    """
+    结果图已存在且有记录保存了对应的检测结果时直接复用，返回 (detections, 结果图)；否则返回 (None, None)
+    复用成功时结果图已 pin 住
+    """
+    db = SessionLocal()
+    try:
+        record = (
+            db.query(DetectRecord)
+            .filter(DetectRecord.result_path == result_path, DetectRecord.type == "image")
+            .order_by(DetectRecord.id.desc())
+            .first()
+        )
+        objects = record.objects if record else None
     finally:
         db.close()
+    try:
+        detections = json.loads(objects) if isinstance(objects, str) else objects
+    except ValueError:
+        detections = None
+    if not isinstance(detections, list) or not blob_store.reuse(result_path):
+        return None, None
 
+    img = cv2.imread(result_path)
+    if img is None:
+        blob_store.release(result_path)
+        return None, None
+    for detection in detections:
+        # 记录上切换过的显示状态不属于检测结果
+        detection["visible"] = True
+    return detections, img
+
+
+def _detect_and_draw(source_path: str, result_key: str, conf: float, hidden_ids: List[int] = ()):
+    """推理并把画好框的结果图写入存储（已 pin 住），返回 (detections, 结果图)"""
+    with metrics.stage("image", "decode"):
+        img = cv2.imread(source_path)
+    if img is None:
+        raise HTTPException(status_code=500, detail="无法读取图片文件")
+    with metrics.stage("image", "inference"):
+        results = model.predict(source=img, imgsz=1280, conf=conf, save=False, verbose=False)
+    with metrics.stage("image", "postprocess"):
+        detections = collect_detections(results[0], hidden_ids)
+
+    with metrics.stage("image", "draw"):
+        for detection_info in detections:
+            if detection_info["visible"]:
+                draw_detection_box(img, detection_info)
+
+    with metrics.stage("image", "encode"):
+        ok, buffer = cv2.imencode(".jpg", img)
+        if not ok:
+            raise HTTPException(status_code=500, detail="结果图片编码失败")
+        blob_store.put_bytes(RESULT_DIR, result_key, buffer.tobytes(), ".jpg")
+    return detections, img
+
+
+def collect_detections(r, hidden_ids: List[int] = ()) -> List[Dict[str, Any]]:
+    """把模型输出的框转成检测结果列表（编号从 1 开始），hidden_ids 中的框标记为不可见"""
+    detections = []
+    if r.boxes is None or len(r.boxes) == 0:
+        return detections
+    boxes = r.boxes.xyxy.cpu().numpy()
+    confs = r.boxes.conf.cpu().numpy()
+    cls_ids = r.boxes.cls.cpu().numpy().astype(int)
+    names = model.names
+
+    for detection_id, (box, confs_i, cls_i) in enumerate(zip(boxes, confs, cls_ids), start=1):
+        x1, y1, x2, y2 = map(int, box)
+        label = names[int(cls_i)]
+        detections.append({
+            "id": detection_id,
+            "class": label,
+            "confidence": float(confs_i),
+            "bbox": [x1, y1, x2, y2],
+            "color": get_color_by_class_and_id(label, detection_id),
+            "visible": detection_id not in hidden_ids,
+            "area": (x2 - x1) * (y2 - y1)
+        })
+    return detections
 
-# ========== 工具函数 ==========
 
 def get_color_by_class_and_id(class_name: str, detection_id: int):
     base_colors = {
@@ -0,0 +1,286 @@
+from fastapi import APIRouter, HTTPException, Query
+from db import SessionLocal
+from models import DetectRecord, Detection, DetectionStat
+from detection_index import CONF_BINS, UNKNOWN_CONF_BIN, conf_bin, hour_bucket, day_bucket
+from config import DETECTION_SEARCH_SCAN_LIMIT
+from routers.records import SUMMARY_COLUMNS, record_summary, encode_cursor, decode_cursor, to_utc_naive
+from sqlalchemy import select, func, desc, or_
+from sqlalchemy.orm import load_only
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+router = APIRouter()
+
+_det = Detection.__table__.c
+_stat = DetectionStat.__table__.c
+
+# 检索时每次从索引读取的行数，从小块开始逐步放大：命中密集时第一块就能凑够一页
+SEARCH_CHUNK_MIN = 1000
+SEARCH_CHUNK_MAX = 50000
+
+
+def _classes(value: Optional[str]) -> List[str]:
+    """class 参数支持逗号分隔多个类别"""
+    return [c.strip() for c in value.split(",") if c.strip()] if value else []
+
+
+def _time_window(start: Optional[datetime], end: Optional[datetime],
+                 before: Optional[tuple] = None, from_: Optional[tuple] = None) -> list:
+    """
+    扫描范围：(detect_time, record_id) 严格早于 before、不早于 from_，并限制在 [start, end) 内
+    每一侧只生成一个 detect_time 边界：SQLite 遇到同一列的多个下限（或上限）只会拿其中一个做索引范围，
+    选中较宽的那个就会每次从头扫描
+    """
+    conditions = []
+    if before and (end is None or before[0] < end):
+        conditions.append(_det.detect_time <= before[0])
+        conditions.append(or_(_det.detect_time < before[0], _det.record_id < before[1]))
+    elif end:
+        conditions.append(_det.detect_time < end)
+    if from_ and (start is None or from_[0] >= start):
+        conditions.append(_det.detect_time >= from_[0])
+        conditions.append(or_(_det.detect_time > from_[0], _det.record_id >= from_[1]))
+    elif start:
+        conditions.append(_det.detect_time >= start)
+    return conditions
+
+
+@router.get("/detections/search")
+def search_detections(
+    class_name: Optional[str] = Query(None, alias="class", description="类别，多个用逗号分隔"),
+    min_conf: Optional[float] = Query(None, ge=0, le=1),
+    max_conf: Optional[float] = Query(None, ge=0, le=1),
+    min_area: Optional[int] = Query(None, ge=0),
+    max_area: Optional[int] = Query(None, ge=0),
+    type: str = None,
+    start: Optional[datetime] = Query(None, description="检测时间下限（含），ISO 格式"),
+    end: Optional[datetime] = Query(None, description="检测时间上限（不含），ISO 格式"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor")
+):
+    """
+    按目标条件检索记录，例如 ?class=truck&min_conf=0.8&start=...
+    每条记录附带命中的目标数和最高置信度，按 (detect_time, id) 倒序，游标翻页
+    单次请求最多沿索引扫描 DETECTION_SEARCH_SCAN_LIMIT 行：条件很稀疏时可能返回不足一页，
+    此时 scan_truncated 为 true，带上 next_cursor 继续请求即可
+    """
+    # 类别、时间、游标决定索引上的扫描范围；置信度/面积/类型在范围内过滤（都在索引里，不回表）
+    seek = []
+    classes = _classes(class_name)
+    if classes:
+        seek.append(_det.class_name.in_(classes))
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    filters = []
+    if min_conf is not None:
+        filters.append(_det.confidence >= min_conf)
+    if max_conf is not None:
+        filters.append(_det.confidence <= max_conf)
+    if min_area is not None:
+        filters.append(_det.area >= min_area)
+    if max_area is not None:
+        filters.append(_det.area <= max_area)
+    if type:
+        filters.append(_det.type == type)
+    position = decode_cursor(cursor) if cursor else None
+
+    db = SessionLocal()
+    try:
+        # 按块沿索引倒序推进：先用 OFFSET 在索引上跳过一块找到块的下边界，再在块内过滤、按记录分组；
+        # 凑够 limit + 1 条记录或扫满额度即停。同一记录的目标 detect_time 相同，
+        # 块边界按 (detect_time, record_id) 划分，一条记录不会被拆到两块里
+        groups = {}
+        scanned = 0
+        chunk = SEARCH_CHUNK_MIN
+        exhausted = False
+        while len(groups) <= limit and scanned < DETECTION_SEARCH_SCAN_LIMIT:
+            boundary = db.execute(
+                select(_det.detect_time, _det.record_id)
+                .where(*seek, *_time_window(start, end, position))
+                .order_by(desc(_det.detect_time), desc(_det.record_id))
+                .offset(chunk - 1).limit(1)
+            ).first()
+            window = seek + _time_window(start, end, position, boundary)
+
+            for record_id, detect_time, count, best_conf in db.execute(
+                select(_det.record_id, _det.detect_time, func.count(), func.max(_det.confidence))
+                .where(*window, *filters)
+                .group_by(_det.detect_time, _det.record_id)
+                .order_by(desc(_det.detect_time), desc(_det.record_id))
+                .limit(limit + 1 - len(groups))
+            ):
+                groups[(detect_time, record_id)] = (count, best_conf)
+
+            scanned += chunk
+            if boundary is None:
+                exhausted = True
+                break
+            position = (boundary.detect_time, boundary.record_id)
+            chunk = min(chunk * 4, SEARCH_CHUNK_MAX)
+
+        hits = list(groups.items())
+        has_more = len(hits) > limit
+        hits = hits[:limit]
+        truncated = not has_more and not exhausted
+        if has_more:
+            next_cursor = encode_cursor(*hits[-1][0])
+        elif truncated:
+            # 扫描额度用完，从已扫描到的位置继续
+            next_cursor = encode_cursor(*position)
+            has_more = True
+        else:
+            next_cursor = None
+
+        records = {}
+        if hits:
+            records = {
+                r.id: r for r in db.query(DetectRecord)
+                .options(load_only(*SUMMARY_COLUMNS))
+                .filter(DetectRecord.id.in_([record_id for (_, record_id), _ in hits]))
+            }
+
+        data = []
+        for (_, record_id), (count, best_conf) in hits:
+            record = records.get(record_id)
+            if record is None:
+                continue
+            data.append({
+                **record_summary(record),
+                "matches": count,
+                "best_confidence": best_conf
+            })
+
+        return {
+            "data": data,
+            "has_more": has_more,
+            "scan_truncated": truncated,
+            "next_cursor": next_cursor
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+    finally:
+        db.close()
+
+
+def _stat_segments(start: Optional[datetime], end: Optional[datetime], hourly_only: bool = False) -> list:
+    """
+    把 [start, end) 按小时取整后拆成几段：中间的整天读天级聚合，首尾不足一天的部分读小时级
+    返回 [(period, 下限, 上限)]，None 表示不限
+    """
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    lower = hour_bucket(start) if start else None
+    upper = None
+    if end:
+        upper = hour_bucket(end)
+        if upper < end:
+            upper += timedelta(hours=1)
+    if hourly_only:
+        return [("hour", lower, upper)]
+
+    day_lower = None
+    if lower:
+        day_lower = day_bucket(lower)
+        if day_lower < lower:
+            day_lower += timedelta(days=1)
+    day_upper = day_bucket(upper) if upper else None
+    if day_lower and day_upper and day_lower >= day_upper:
+        return [("hour", lower, upper)]
+
+    segments = [("day", day_lower, day_upper)]
+    if lower and lower < day_lower:
+        segments.append(("hour", lower, day_lower))
+    if upper and day_upper < upper:
+        segments.append(("hour", day_upper, upper))
+    return segments
+
+
+def _query_stats(columns: list, class_name: Optional[str], type: Optional[str],
+                 segments: list, conditions: list = ()) -> list:
+    """对每一段分别聚合后合并，返回 [(*分组键, 计数)]"""
+    base = list(conditions)
+    classes = _classes(class_name)
+    if classes:
+        base.append(_stat.class_name.in_(classes))
+    if type:
+        base.append(_stat.type == type)
+
+    merged = {}
+    db = SessionLocal()
+    try:
+        for period, lower, upper in segments:
+            where = base + [_stat.period == period]
+            if lower:
+                where.append(_stat.bucket >= lower)
+            if upper:
+                where.append(_stat.bucket < upper)
+            for *key, count in db.execute(
+                select(*columns, func.sum(_stat.count)).where(*where).group_by(*columns)
+            ):
+                key = tuple(key)
+                merged[key] = merged.get(key, 0) + int(count)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+    finally:
+        db.close()
+    return [key + (count,) for key, count in merged.items() if count]
+
+
+@router.get("/detections/histogram")
+def detection_histogram(
+    class_name: Optional[str] = Query(None, alias="class", description="类别，多个用逗号分隔"),
+    type: str = None,
+    start: Optional[datetime] = Query(None, description="按所在小时取整"),
+    end: Optional[datetime] = Query(None, description="按所在小时取整"),
+    interval: str = Query("hour", pattern="^(hour|day)$"),
+    min_conf: Optional[float] = Query(None, ge=0, le=1, description="按 0.1 分档向下取整")
+):
+    """按小时或按天统计各类别的目标数（UTC），只读聚合表"""
+    conditions = []
+    if min_conf is not None:
+        conditions.append(_stat.conf_bin >= conf_bin(min_conf))
+    bucket = _stat.bucket if interval == "hour" else func.date(_stat.bucket)
+    rows = _query_stats(
+        [bucket, _stat.class_name], class_name, type,
+        _stat_segments(start, end, hourly_only=interval == "hour"), conditions
+    )
+
+    buckets = {}
+    classes = set()
+    for value, name, count in rows:
+        key = value.isoformat() if hasattr(value, "isoformat") else str(value)
+        entry = buckets.setdefault(key, {"time": key, "counts": {}, "total": 0})
+        entry["counts"][name] = count
+        entry["total"] += count
+        classes.add(name)
+
+    return {
+        "interval": interval,
+        "classes": sorted(classes),
+        "buckets": [buckets[key] for key in sorted(buckets)]
+    }
+
+
+@router.get("/detections/confidence")
+def confidence_distribution(
+    class_name: Optional[str] = Query(None, alias="class", description="类别，多个用逗号分隔"),
+    type: str = None,
+    start: Optional[datetime] = Query(None, description="按所在小时取整"),
+    end: Optional[datetime] = Query(None, description="按所在小时取整")
+):
+    """各类别的置信度分布，0.1 一档；没有置信度的旧视频目标计入 unknown"""
+    rows = _query_stats([_stat.class_name, _stat.conf_bin], class_name, type, _stat_segments(start, end))
+
+    classes = {}
+    unknown = {}
+    for name, bin_index, count in rows:
+        if bin_index == UNKNOWN_CONF_BIN:
+            unknown[name] = count
+            continue
+        classes.setdefault(name, [0] * CONF_BINS)[bin_index] = count
+
+    return {
+        "bins": [round(i / CONF_BINS, 1) for i in range(CONF_BINS + 1)],
+        "classes": classes,
+        "unknown": unknown
+    }
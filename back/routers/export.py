@@ -0,0 +1,311 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+import io
+import os
+import cv2
+import csv
+import json
+import zlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import select, func, or_
+from config import UPLOAD_DIR, CAMERA_DIR, EXPORT_BATCH_SIZE, EXPORT_FLUSH_BYTES
+from db import engine
+from models import DetectRecord
+from detection_index import extract_detections
+from routers.records import to_utc_naive
+from routers.video import iter_frame_detections
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+_EXPORT_COLUMNS = (
+    DetectRecord.id, DetectRecord.type, DetectRecord.filename, DetectRecord.source_path,
+    DetectRecord.result_path, DetectRecord.result_url, DetectRecord.detect_time,
+    DetectRecord.duration, DetectRecord.objects, DetectRecord.width, DetectRecord.height
+)
+_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8", "coco": "application/json"}
+_FILE_EXT = {"ndjson": "ndjson", "csv": "csv", "coco": "json"}
+
+CSV_HEADER = ["record_id", "type", "filename", "detect_time", "frame", "timestamp", "track_id",
+              "class", "confidence", "x1", "y1", "x2", "y2", "area"]
+# COCO 的 image id 必须是整数：视频帧用 record_id * FRAME_ID_BASE + 帧号 + 1，两遍扫描得到的 id 一致
+FRAME_ID_BASE = 10 ** 7
+COCO_IMAGE_TYPES = ("image", "camera")
+
+
+# ========== 读取 ==========
+
+def _iter_records(type: Optional[str], start: Optional[datetime], end: Optional[datetime],
+                  max_id: int) -> Iterator[Any]:
+    """
+    按 (detect_time, id) 顺序分批读取，每批一个短连接，读完即释放：
+    导出几分钟也不会长时间占着读事务和连接；max_id 固定导出开始时的快照，期间新写入的记录不会混进来
+    """
+    position = None
+    while True:
+        query = select(*_EXPORT_COLUMNS).where(DetectRecord.id <= max_id)
+        if type:
+            query = query.where(DetectRecord.type == type)
+        if end:
+            query = query.where(DetectRecord.detect_time < end)
+        # detect_time 每侧只给一个边界，SQLite 才会按索引做范围扫描
+        if position:
+            query = query.where(
+                DetectRecord.detect_time >= position[0],
+                or_(DetectRecord.detect_time > position[0], DetectRecord.id > position[1])
+            )
+        elif start:
+            query = query.where(DetectRecord.detect_time >= start)
+        with engine.connect() as conn:
+            rows = conn.execute(
+                query.order_by(DetectRecord.detect_time, DetectRecord.id).limit(EXPORT_BATCH_SIZE)
+            ).all()
+        if not rows:
+            return
+        yield from rows
+        position = (rows[-1].detect_time, rows[-1].id)
+
+
+def _video_id(row) -> Optional[str]:
+    if row.type != "video" or not row.result_path:
+        return None
+    return os.path.splitext(os.path.basename(row.result_path))[0]
+
+
+def _frames(row):
+    """视频记录的 (video_info, 逐帧迭代器)，其它记录或没有逐帧数据时为 (None, None)"""
+    video_id = _video_id(row)
+    return iter_frame_detections(video_id) if video_id else (None, None)
+
+
+def _relative(path: Optional[str]) -> Optional[str]:
+    """原始文件相对上传/抓拍目录的路径，即 /files/upload/ 或 /files/camera/ 之后的部分"""
+    if not path:
+        return None
+    for base in (UPLOAD_DIR, CAMERA_DIR):
+        if path.startswith(base + os.sep):
+            return os.path.relpath(path, base).replace(os.sep, "/")
+    return os.path.basename(path)
+
+
+def _image_size(row) -> Tuple[Optional[int], Optional[int]]:
+    """图片/抓拍记录的 (width, height)；加列之前的旧记录从原图读取，原图已删除时为 (None, None)"""
+    if row.width and row.height:
+        return row.width, row.height
+    img = cv2.imread(row.source_path) if row.source_path else None
+    if img is None:
+        return None, None
+    return img.shape[1], img.shape[0]
+
+
+def _detection(d: Dict[str, Any]) -> Dict[str, Any]:
+    """extract_detections 的行去掉空值"""
+    return {k: v for k, v in d.items() if v is not None}
+
+
+def _frame_detection(d: Dict[str, Any]) -> Dict[str, Any]:
+    x1, y1, x2, y2 = d["bbox"]
+    return {"class_name": d["class"], "confidence": d.get("confidence"), "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+            "area": (x2 - x1) * (y2 - y1), "track_id": d.get("track_id"), "id": d.get("id")}
+
+
+# ========== 格式 ==========
+
+def _ndjson(rows: Iterator[Any], include_frames: bool) -> Iterator[str]:
+    """每条记录一行；视频的逐帧结果在行内逐帧输出，不在内存里拼整条记录"""
+    for row in rows:
+        record = {
+            "id": row.id,
+            "type": row.type,
+            "filename": row.filename,
+            "detect_time": row.detect_time.isoformat() if row.detect_time else None,
+            "duration": row.duration,
+            "source": _relative(row.source_path),
+            "result_url": row.result_url,
+            "detections": [_detection(d) for d in extract_detections(row.objects)]
+        }
+        video_info, frames = _frames(row) if include_frames else (None, None)
+        if frames is None:
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+            continue
+        record["video_info"] = video_info
+        yield json.dumps(record, ensure_ascii=False)[:-1] + ', "frames": ['
+        for i, frame in enumerate(frames):
+            yield ("," if i else "") + json.dumps(frame, ensure_ascii=False)
+        yield "]}\n"
+
+
+def _csv(rows: Iterator[Any], include_frames: bool) -> Iterator[str]:
+    """每个目标一行；视频有逐帧结果时每帧每个目标一行，没有目标的记录也输出一行"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take() -> str:
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(CSV_HEADER)
+    for row in rows:
+        head = [row.id, row.type, row.filename, row.detect_time.isoformat() if row.detect_time else ""]
+        _, frames = _frames(row) if include_frames else (None, None)
+        written = False
+        if frames is not None:
+            for frame in frames:
+                for d in frame["detections"]:
+                    d = _frame_detection(d)
+                    writer.writerow(head + [frame["frame_index"], frame["timestamp"], d["track_id"],
+                                            d["class_name"], d["confidence"],
+                                            d["x1"], d["y1"], d["x2"], d["y2"], d["area"]])
+                    written = True
+                yield take()
+        else:
+            for d in extract_detections(row.objects):
+                writer.writerow(head + [d["frame"], "", d["track_id"], d["class_name"], d["confidence"],
+                                        d["x1"], d["y1"], d["x2"], d["y2"], d["area"]])
+                written = True
+        if not written:
+            writer.writerow(head + [""] * (len(CSV_HEADER) - len(head)))
+        yield take()
+
+
+def _coco(records, include_frames: bool) -> Iterator[str]:
+    """
+    COCO 格式：images 和 annotations 是两个数组，按记录顺序扫描两遍（records 每次调用返回新的迭代器）；
+    图片/抓拍记录各是一张图，视频按帧展开（只输出有目标的帧），类别在扫描中编号，最后输出
+    """
+    yield json.dumps({
+        "info": {"description": "detect_record export", "date_created": datetime.utcnow().isoformat()}
+    }, ensure_ascii=False)[:-1] + ', "images": ['
+
+    first = True
+    for row in records():
+        if row.type in COCO_IMAGE_TYPES:
+            width, height = _image_size(row)
+            images = [{"id": row.id * FRAME_ID_BASE, "file_name": _relative(row.source_path), "record_id": row.id,
+                       "type": row.type, "detect_time": row.detect_time.isoformat() if row.detect_time else None,
+                       "width": width, "height": height}]
+        elif include_frames:
+            video_info, frames = _frames(row)
+            if frames is None:
+                continue
+            images = (
+                {"id": row.id * FRAME_ID_BASE + frame["frame_index"] + 1, "file_name": _relative(row.source_path),
+                 "record_id": row.id, "type": row.type, "frame_index": frame["frame_index"],
+                 "timestamp": frame["timestamp"], "width": video_info.get("width"),
+                 "height": video_info.get("height")}
+                for frame in frames if frame["detections"]
+            )
+        else:
+            continue
+        for image in images:
+            yield ("" if first else ",") + json.dumps(image, ensure_ascii=False)
+            first = False
+
+    yield '], "annotations": ['
+    categories: Dict[str, int] = {}
+    annotation_id = 0
+    for row in records():
+        if row.type in COCO_IMAGE_TYPES:
+            items = [(row.id * FRAME_ID_BASE, [_detection(d) for d in extract_detections(row.objects)])]
+        elif include_frames:
+            _, frames = _frames(row)
+            if frames is None:
+                continue
+            items = ((row.id * FRAME_ID_BASE + frame["frame_index"] + 1,
+                      [_frame_detection(d) for d in frame["detections"]]) for frame in frames)
+        else:
+            continue
+        parts = []
+        for image_id, detections in items:
+            for d in detections:
+                if d.get("x1") is None:
+                    continue
+                annotation_id += 1
+                width, height = d["x2"] - d["x1"], d["y2"] - d["y1"]
+                annotation = {
+                    "id": annotation_id,
+                    "image_id": image_id,
+                    "category_id": categories.setdefault(d["class_name"], len(categories) + 1),
+                    "bbox": [d["x1"], d["y1"], width, height],
+                    "area": width * height,
+                    "iscrowd": 0,
+                    "score": d.get("confidence")
+                }
+                if d.get("track_id") is not None:
+                    annotation["track_id"] = d["track_id"]
+                parts.append(("," if annotation_id > 1 else "") + json.dumps(annotation, ensure_ascii=False))
+        if parts:
+            yield "".join(parts)
+
+    yield '], "categories": ' + json.dumps(
+        [{"id": i, "name": name} for name, i in categories.items()], ensure_ascii=False
+    ) + "}\n"
+
+
+# ========== 输出 ==========
+
+def _encode(chunks: Iterator[str], compress: bool) -> Iterator[bytes]:
+    """攒够 EXPORT_FLUSH_BYTES 再发送；gzip 时流式压缩，内存里只有一个缓冲区"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending: List[str] = []
+    size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if size < EXPORT_FLUSH_BYTES:
+            continue
+        data = "".join(pending).encode("utf-8")
+        pending, size = [], 0
+        data = compressor.compress(data) if compressor else data
+        if data:
+            yield data
+    data = "".join(pending).encode("utf-8")
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+@router.get("/export/records")
+def export_records(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|coco)$"),
+    type: str = None,
+    start: Optional[datetime] = Query(None, description="检测时间下限（含），ISO 格式"),
+    end: Optional[datetime] = Query(None, description="检测时间上限（不含），ISO 格式"),
+    frames: bool = Query(True, description="视频是否展开逐帧检测结果"),
+    gzip: bool = False
+):
+    """
+    流式导出记录及检测结果：ndjson 每条记录一行，csv 每个目标一行，coco 为 COCO 检测格式
+    分批读库、边读边写，内存占用与导出的记录数无关；gzip=true 时输出 .gz 文件
+    """
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    with engine.connect() as conn:
+        max_id = conn.execute(select(func.max(DetectRecord.id))).scalar() or 0
+
+    def records():
+        return _iter_records(type, start, end, max_id)
+
+    if format == "coco":
+        chunks = _coco(records, frames)
+    elif format == "csv":
+        chunks = _csv(records(), frames)
+    else:
+        chunks = _ndjson(records(), frames)
+
+    filename = f"records-{datetime.utcnow():%Y%m%d%H%M%S}.{_FILE_EXT[format]}"
+    media_type = _MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    logger.info(f"📤 开始导出: format={format}, type={type}, start={start}, end={end}, gzip={gzip}")
+    return StreamingResponse(
+        _encode(chunks, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
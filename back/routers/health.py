@@ -0,0 +1,41 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+import os
+import time
+from db import engine
+from model_registry import model_registry
+import metrics
+
+router = APIRouter()
+
+
+@router.get("/health/live")
+def health_live():
+    """存活探针：进程能响应就返回 200，不检查模型和数据库（失败时应重启进程）"""
+    return {"status": "alive", "pid": os.getpid(), "uptime_seconds": round(time.time() - metrics.PROCESS_START, 1)}
+
+
+@router.get("/health/ready")
+def health_ready():
+    """
+    就绪探针：模型已加载（并预热）且数据库可用时返回 200，否则 503（暂不分配流量，但不必重启）
+    模型还没开始加载（关闭了预加载）时在这里触发后台加载
+    """
+    checks = {"model": model_registry.ready}
+    if not model_registry.ready and model_registry.state in ("cold", "failed"):
+        model_registry.preload()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        checks["database"] = True
+    except Exception:
+        checks["database"] = False
+
+    ready = all(checks.values())
+    return JSONResponse(status_code=200 if ready else 503, content={
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "model": model_registry.status(),
+        "startup": metrics.startup_timings()
+    })
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Body, HTTPException, Query, Request
 from db import SessionLocal
+from db_writer import record_writer
+from storage_lifecycle import storage_lifecycle, delete_records
 from models import DetectRecord
-from sqlalchemy import desc
-from fastapi.responses import FileResponse
+from sqlalchemy import desc, or_
+from sqlalchemy.orm import load_only
+from file_serving import file_response, versioned_url
+from thumbnails import thumbnail_url
 import os
 import json
-from config import RESULT_DIR, UPLOAD_DIR, CAMERA_DIR
+import time
+import base64
+import threading
+from datetime import datetime, timezone
+from config import RESULT_DIR, UPLOAD_DIR, CAMERA_DIR, RECORD_COUNT_CACHE_TTL
 import re
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 router = APIRouter()
 
@@ -19,66 +27,159 @@ def _make_safe_url(filepath: Optional[str], base_dir: str, prefix: str) -> Optio
     try:
         real_path = os.path.realpath(filepath)
         real_base = os.path.realpath(base_dir)
-        if not real_path.startswith(real_base):
+        if not real_path.startswith(real_base + os.sep):
             return None
-        filename = os.path.basename(filepath)
-        if re.match(r"^[^\x00/\x00]+$", filename):
-            return f"{prefix}/{filename}"
+        # 内容寻址的文件位于扇出子目录中，URL 带上相对路径
+        relative = os.path.relpath(real_path, real_base).split(os.sep)
+        if all(re.match(r"^[^\x00/]+$", part) and part != ".." for part in relative):
+            # 带上版本号：文件不变 URL 就不变，浏览器可以长期缓存
+            return versioned_url(f"{prefix}/{'/'.join(relative)}", real_path)
     except Exception:
         return None
     return None
 
 
+# ---------- 列表摘要 ----------
+
+# 列表只读这些列，不加载 objects
+SUMMARY_COLUMNS = (
+    DetectRecord.id, DetectRecord.type, DetectRecord.filename, DetectRecord.detect_time,
+    DetectRecord.detection_count, DetectRecord.class_counts, DetectRecord.duration,
+    DetectRecord.file_size, DetectRecord.result_available, DetectRecord.thumbnail_path
+)
+
+
+def record_summary(r: DetectRecord) -> dict:
+    # 摘要列在写入时已经算好，这里不解析 objects，也不访问文件系统
+    return {
+        "id": r.id,
+        "type": r.type,
+        "filename": r.filename,
+        "detect_time": r.detect_time.isoformat() if r.detect_time else None,
+        "detection_count": r.detection_count or 0,
+        "class_counts": r.class_counts or {},
+        "duration": r.duration,
+        "file_size": r.file_size,
+        "has_result": bool(r.result_available),
+        "thumbnail_url": thumbnail_url(r.thumbnail_path)
+    }
+
+
+# ---------- 游标与计数缓存 ----------
+
+_COUNT_CACHE_MAX = 256
+_count_cache: Dict[tuple, Tuple[int, float, int]] = {}  # 筛选条件 -> (版本号, 缓存时间, 总数)
+_count_lock = threading.Lock()
+
+
+def encode_cursor(detect_time: Optional[datetime], record_id: int) -> Optional[str]:
+    """游标 = 本页最后一条的 (detect_time, id)，对前端不透明"""
+    if detect_time is None:
+        return None
+    raw = json.dumps([detect_time.isoformat(), record_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        detect_time, record_id = json.loads(raw)
+        return datetime.fromisoformat(detect_time), int(record_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的游标")
+
+
+def to_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """detect_time 按 UTC 无时区保存，带时区的筛选参数先换算"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _cached_count(query, key: tuple) -> int:
+    """总数按筛选条件缓存，有插入或删除（record_writer.generation 变化）或超过 TTL 时重新 COUNT"""
+    generation = record_writer.generation
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+    if cached and cached[0] == generation and now - cached[1] < RECORD_COUNT_CACHE_TTL:
+        return cached[2]
+
+    total = query.count()
+    with _count_lock:
+        if len(_count_cache) >= _COUNT_CACHE_MAX:
+            _count_cache.clear()
+        _count_cache[key] = (generation, now, total)
+    return total
+
+
 @router.get("/records/list")
 def list_records(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    type: str = None
+    type: str = None,
+    start: Optional[datetime] = Query(None, description="检测时间下限（含），ISO 格式"),
+    end: Optional[datetime] = Query(None, description="检测时间上限（不含），ISO 格式"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，传入时忽略 page")
 ):
-    """获取检测记录列表"""
+    """
+    获取检测记录列表，按 (detect_time, id) 倒序
+    传 cursor 时走键集分页，翻到多深都只扫 limit 行；不传时保持原来的 page/limit 偏移分页
+    两种方式都返回 next_cursor，前端可以从任意一页切换到游标翻页
+    """
+    start, end = to_utc_naive(start), to_utc_naive(end)
     db = SessionLocal()
     try:
         query = db.query(DetectRecord)
         if type:
             query = query.filter(DetectRecord.type == type)
+        if start:
+            query = query.filter(DetectRecord.detect_time >= start)
+        page_query = query
+        if end:
+            query = query.filter(DetectRecord.detect_time < end)
+
+        total = _cached_count(query, (type, start, end))
 
-        total = query.count()
-        offset = (page - 1) * limit
+        if cursor:
+            last_time, last_id = decode_cursor(cursor)
+            # 冗余的 detect_time <= last_time 让数据库可以直接在时间索引上做范围扫描；
+            # 游标已在 end 之前时不再叠加 end，否则 SQLite 可能拿 end 做上限，每次从 end 开始扫
+            if end and last_time >= end:
+                page_query = page_query.filter(DetectRecord.detect_time < end)
+            page_query = page_query.filter(
+                DetectRecord.detect_time <= last_time,
+                or_(DetectRecord.detect_time < last_time, DetectRecord.id < last_id)
+            )
+        else:
+            page_query = query
 
-        records = (
-            query
-            .order_by(desc(DetectRecord.detect_time))
-            .offset(offset)
-            .limit(limit)
-            .all()
+        page_query = (
+            page_query
+            .options(load_only(*SUMMARY_COLUMNS))
+            # id 参与排序，保证同一时间的记录顺序稳定，游标不会漏行或重复
+            .order_by(desc(DetectRecord.detect_time), desc(DetectRecord.id))
         )
+        if not cursor:
+            page_query = page_query.offset((page - 1) * limit)
 
-        data = []
-        for r in records:
-            detection_count = 0
-            if r.objects:
-                try:
-                    obj = json.loads(r.objects)
-                    detection_count = len(obj) if isinstance(obj, list) else 0
-                except:
-                    pass
-
-            record_info = {
-                "id": r.id,
-                "type": r.type,
-                "filename": r.filename,
-                "detect_time": r.detect_time.isoformat() if r.detect_time else None,
-                "detection_count": detection_count,
-                "has_result": bool(r.result_path and os.path.exists(r.result_path))
-            }
-            data.append(record_info)
+        # 多取一条判断是否还有下一页
+        records = page_query.limit(limit + 1).all()
+        has_more = len(records) > limit
+        records = records[:limit]
+
+        data = [record_summary(r) for r in records]
 
         return {
             "total": total,
             "page": page,
             "limit": limit,
-            "data": data
+            "data": data,
+            "has_more": has_more,
+            "next_cursor": encode_cursor(records[-1].detect_time, records[-1].id) if has_more else None
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
     finally:
@@ -101,8 +202,13 @@ def get_record_detail(record_id: int):
             except:
                 objects_data = []
 
-        source_url = _make_safe_url(record.source_path, UPLOAD_DIR, "/files/upload")
-        result_url = _make_safe_url(record.result_path, RESULT_DIR, "/files/result")
+        if record.type == "camera_event":
+            # 事件片段保存在摄像头目录，原始和结果是同一个文件
+            result_url = _make_safe_url(record.result_path, CAMERA_DIR, "/files/camera")
+            source_url = result_url
+        else:
+            source_url = _make_safe_url(record.source_path, UPLOAD_DIR, "/files/upload")
+            result_url = _make_safe_url(record.result_path, RESULT_DIR, "/files/result")
 
         return {
             "id": record.id,
@@ -111,6 +217,7 @@ def get_record_detail(record_id: int):
             "detect_time": record.detect_time.isoformat() if record.detect_time else None,
             "source_url": source_url,
             "result_url": result_url,  # ← 现在是 /files/result/xxx
+            "thumbnail_url": thumbnail_url(record.thumbnail_path),
             "objects": objects_data,
             "file_status": {
                 "source_exists": source_url is not None,
@@ -127,11 +234,16 @@ def get_record_detail(record_id: int):
 
 @router.get("/records/file/{record_id}")
 def get_record_file(
+    request: Request,
     record_id: int,
     which: str = "result",
-    check_exists: bool = True
+    check_exists: bool = True,
+    v: Optional[str] = Query(None, description="文件版本号，与当前版本一致时返回长缓存")
 ):
-    """获取记录对应的原始或结果文件（兼容旧接口）"""
+    """
+    获取记录对应的原始或结果文件（兼容旧接口），支持 Range 和条件请求
+    check_exists 仅为兼容保留：文件不存在时总是返回 404
+    """
     db = SessionLocal()
     try:
         record = db.query(DetectRecord).filter(DetectRecord.id == record_id).first()
@@ -147,10 +259,12 @@ def get_record_file(
         if not any(real_file.startswith(os.path.realpath(d)) for d in allowed_dirs):
             raise HTTPException(status_code=403, detail="文件访问被拒绝")
 
-        if check_exists and not os.path.exists(file_path):
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
             raise HTTPException(status_code=404, detail="文件不存在")
 
-        return FileResponse(file_path)
+        return file_response(file_path, stat_result, request.headers, v)
     except HTTPException:
         raise
     except Exception as e:
@@ -159,44 +273,49 @@ def get_record_file(
         db.close()
 
 
+@router.post("/records/bulk-delete")
+def bulk_delete_records(
+    ids: Optional[List[int]] = Body(None, embed=True),
+    type: str = None,
+    start: Optional[datetime] = Query(None, description="检测时间下限（含），ISO 格式"),
+    end: Optional[datetime] = Query(None, description="检测时间上限（不含），ISO 格式"),
+    delete_files: bool = True
+):
+    """
+    后台批量删除：按 id 列表（请求体 {"ids": [...]}），或按类型/时间范围
+    立即返回任务，进度通过 status_url 查询
+    """
+    if not ids and not (type or start or end):
+        raise HTTPException(status_code=400, detail="请指定要删除的记录（ids 或 type/start/end）")
+    job = storage_lifecycle.submit_delete(
+        ids=ids, type=type, start=to_utc_naive(start), end=to_utc_naive(end), delete_files=delete_files
+    )
+    return {**job, "status_url": f"/api/records/bulk-delete/{job['job_id']}"}
+
+
+@router.get("/records/bulk-delete/{job_id}")
+def get_bulk_delete_job(job_id: str):
+    job = storage_lifecycle.job_info(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
 @router.delete("/records/{record_id}")
 def delete_record(record_id: int, delete_files: bool = False):
-    """删除记录（可选删除物理文件）"""
-    db = SessionLocal()
+    """
+    删除记录（可选删除物理文件）
+    不删除的文件记入 kept_file，存储巡检不会把它们当作孤儿清理
+    """
     try:
-        record = db.query(DetectRecord).filter(DetectRecord.id == record_id).first()
-        if not record:
-            raise HTTPException(status_code=404, detail="记录不存在")
-
-        file_paths = []
-        if record.source_path:
-            file_paths.append(record.source_path)
-        if record.result_path and record.result_path != record.source_path:
-            file_paths.append(record.result_path)
-
-        db.delete(record)
-        db.commit()
-
-        deleted_files = []
-        if delete_files:
-            for fp in file_paths:
-                if os.path.exists(fp):
-                    try:
-                        os.remove(fp)
-                        deleted_files.append(fp)
-                    except OSError:
-                        pass  # 忽略删除失败
-
-        return {
-            "message": "记录删除成功",
-            "record_id": record_id,
-            "deleted_files": deleted_files if delete_files else []
-        }
-    except HTTPException:
-        db.rollback()
-        raise
+        result = delete_records([record_id], delete_files)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
-    finally:
-        db.close()
\ No newline at end of file
+    if not result["records"]:
+        raise HTTPException(status_code=404, detail="记录不存在")
+
+    return {
+        "message": "记录删除成功",
+        "record_id": record_id,
+        "deleted_files": result["paths"]
+    }
@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from storage_lifecycle import storage_lifecycle
+from thumbnails import thumbnail_backfill
+
+router = APIRouter()
+
+
+@router.get("/storage/status")
+def get_storage_status():
+    """保留策略、配额、磁盘空间，以及当前/上一轮孤儿巡检的进度和各目录占用"""
+    return storage_lifecycle.status()
+
+
+@router.post("/storage/sweep")
+def start_storage_sweep():
+    """立即开始新一轮孤儿巡检（后台分段执行）"""
+    storage_lifecycle.request_sweep()
+    return {"message": "已安排新一轮巡检", "status_url": "/api/storage/status"}
+
+
+@router.get("/storage/thumbnails")
+def get_thumbnail_status():
+    """缩略图回填进度：待处理的记录数、本轮已处理/生成/失败数"""
+    return thumbnail_backfill.status()
+
+
+@router.post("/storage/thumbnails/backfill")
+def start_thumbnail_backfill():
+    """为还没有缩略图的记录生成缩略图（后台从新到旧执行）"""
+    started = thumbnail_backfill.start(force=True)
+    return {
+        "message": "已开始回填缩略图" if started else "回填正在进行中",
+        "status_url": "/api/storage/thumbnails"
+    }
@@ -0,0 +1,207 @@
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+import os
+import re
+import json
+import uuid
+import asyncio
+import logging
+import weakref
+import aiofiles
+from config import UPLOAD_DIR, PARTIAL_UPLOAD_DIR, RESUMABLE_CHUNK_SIZE
+from upload_utils import file_sha256
+import blob_store
+from routers.video import build_video_names, start_video_job, load_analytics_config
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 同一个上传会话的分块写入需要串行；锁只在有请求持有或等待时存在，放弃的会话不会留下条目
+_upload_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _validate_upload_id(upload_id: str):
+    if not re.match(r"^[a-f0-9]{32}$", upload_id):
+        raise HTTPException(status_code=400, detail="无效的 upload_id")
+
+
+def _meta_path(upload_id: str) -> str:
+    return os.path.join(PARTIAL_UPLOAD_DIR, f"{upload_id}.json")
+
+
+def _part_path(upload_id: str) -> str:
+    return os.path.join(PARTIAL_UPLOAD_DIR, f"{upload_id}.part")
+
+
+def _load_meta(upload_id: str) -> dict:
+    _validate_upload_id(upload_id)
+    meta_path = _meta_path(upload_id)
+    if not os.path.exists(meta_path):
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _received_size(upload_id: str) -> int:
+    part_path = _part_path(upload_id)
+    return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+
+def _get_lock(upload_id: str) -> asyncio.Lock:
+    lock = _upload_locks.get(upload_id)
+    if lock is None:
+        lock = _upload_locks[upload_id] = asyncio.Lock()
+    return lock
+
+
+def _cleanup_session(upload_id: str):
+    for path in (_meta_path(upload_id), _part_path(upload_id)):
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"⚠️ 无法删除上传临时文件 {path}: {e}")
+    _upload_locks.pop(upload_id, None)
+
+
+@router.post("/upload/init")
+async def init_upload(filename: str, total_size: int = Query(..., gt=0)):
+    """
+    创建分块续传会话
+    """
+    # 提前校验格式，避免传完才发现不支持
+    save_name, out_name, video_id = build_video_names(filename)
+
+    upload_id = uuid.uuid4().hex
+    meta = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "total_size": total_size,
+        "save_name": save_name,
+        "out_name": out_name,
+        "video_id": video_id
+    }
+    with open(_meta_path(upload_id), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    open(_part_path(upload_id), "wb").close()
+
+    return {
+        "upload_id": upload_id,
+        "offset": 0,
+        "total_size": total_size,
+        "chunk_size": RESUMABLE_CHUNK_SIZE
+    }
+
+
+@router.get("/upload/{upload_id}")
+async def get_upload_status(upload_id: str):
+    """
+    查询已接收的字节数，断线后从该偏移继续上传
+    """
+    meta = _load_meta(upload_id)
+    offset = _received_size(upload_id)
+    return {
+        "upload_id": upload_id,
+        "filename": meta["filename"],
+        "offset": offset,
+        "total_size": meta["total_size"],
+        "complete": offset == meta["total_size"]
+    }
+
+
+@router.put("/upload/{upload_id}/chunk")
+async def put_upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """
+    按偏移写入一个分块（请求体为原始字节），请求体边读边写，不在内存中累积
+    """
+    meta = _load_meta(upload_id)
+    total_size = meta["total_size"]
+
+    async with _get_lock(upload_id):
+        received = _received_size(upload_id)
+        if offset > received:
+            raise HTTPException(
+                status_code=409,
+                detail=f"偏移不连续，服务端已接收 {received} 字节"
+            )
+
+        written = 0
+        async with aiofiles.open(_part_path(upload_id), "r+b") as part_file:
+            # 允许从已接收范围内的任意位置重传，之后的数据作废
+            await part_file.truncate(offset)
+            await part_file.seek(offset)
+            async for chunk in request.stream():
+                if not chunk:
+                    continue
+                if offset + written + len(chunk) > total_size:
+                    await part_file.truncate(offset + written)
+                    raise HTTPException(status_code=413, detail="分块超出文件总大小")
+                await part_file.write(chunk)
+                written += len(chunk)
+
+    new_offset = offset + written
+    return {
+        "upload_id": upload_id,
+        "offset": new_offset,
+        "total_size": total_size,
+        "complete": new_offset == total_size
+    }
+
+
+@router.post("/upload/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    sha256: str,
+    background_tasks: BackgroundTasks = None,
+    conf: float = Query(0.5, ge=0.0, le=1.0),
+    auto_conf: bool = Query(False),
+    analytics: str = Query(None)
+):
+    """
+    校验完整性后把拼好的文件移入上传目录，并启动视频检测任务
+    """
+    meta = _load_meta(upload_id)
+    analytics_config = load_analytics_config(analytics)
+
+    async with _get_lock(upload_id):
+        received = _received_size(upload_id)
+        if received != meta["total_size"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"文件未传完: {received}/{meta['total_size']} 字节"
+            )
+
+        part_path = _part_path(upload_id)
+        actual = await run_in_threadpool(file_sha256, part_path)
+        if actual.lower() != sha256.strip().lower():
+            raise HTTPException(status_code=400, detail="校验和不匹配，请从 0 偏移重新上传")
+
+        # 校验时算出的摘要就是内容地址，直接移入存储；相同的视频已存在时丢弃本次拼好的文件
+        blob = await run_in_threadpool(blob_store.put_file, UPLOAD_DIR, part_path,
+                                       os.path.splitext(meta["save_name"])[1], actual)
+        save_path = blob.path
+        _cleanup_session(upload_id)
+
+    logger.info(f"📦 分块上传完成: {meta['save_name']} ({received} 字节)")
+    return start_video_job(
+        save_path,
+        meta["save_name"],
+        meta["out_name"],
+        meta["video_id"],
+        conf,
+        auto_conf,
+        background_tasks,
+        analytics_config
+    )
+
+
+@router.delete("/upload/{upload_id}")
+async def abort_upload(upload_id: str):
+    """
+    放弃上传，删除已接收的分块
+    """
+    _load_meta(upload_id)
+    async with _get_lock(upload_id):
+        _cleanup_session(upload_id)
+    return {"upload_id": upload_id, "status": "aborted"}
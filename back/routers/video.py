@@ -2,19 +2,26 @@ from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException,
 from fastapi.responses import FileResponse
 import os
 import time
-import aiofiles
 import json
+import gzip
 import re
 from typing import List, Dict, Any
-from config import UPLOAD_DIR, RESULT_DIR, MODEL_PATH
+from config import UPLOAD_DIR, RESULT_DIR
 from db import SessionLocal
+from db_writer import record_writer
 from models import DetectRecord
-from ultralytics import YOLO
+import blob_store
+import thumbnails
+import metrics
+import tracing
+from file_serving import versioned_url
+from analytics import AnalyticsEngine, parse_analytics_config
+from gallery import TrackGallery, load_manifest, get_crop_path, get_sprite_path
+from model_registry import model, model_registry
 import cv2
 import numpy as np
 import logging
 import subprocess
-import torch
 
 # ================== 日志 ==================
 logging.basicConfig(
@@ -28,18 +35,6 @@ router = APIRouter()
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULT_DIR, exist_ok=True)
 
-# ================== 设备 ==================
-device = "cuda" if torch.cuda.is_available() else "cpu"
-logger.info(f"ℹ️ 使用设备: {device.upper()}")
-
-# ================== 加载模型 ==================
-try:
-    model = YOLO(MODEL_PATH)
-    logger.info(f"✅ 模型加载成功，类别数: {len(model.names)} | 类别: {model.names}")
-except Exception as e:
-    logger.error(f"❌ 模型加载失败: {e}")
-    model = None
-
 # ================== 视频状态存储 ==================
 video_detection_data: Dict[str, Any] = {}
 
@@ -71,10 +66,10 @@ def _is_safe_path(base_dir: str, path: str) -> bool:
     except Exception:
         return False
 
-def convert_to_h264_compatible(input_path: str, output_path: str):
+def convert_to_h264_compatible(input_path: str, output_path: str, pipeline: str = "video"):
     """
     使用 ffmpeg 将视频转为 H.264 + AAC 的 MP4（网页兼容格式）
-    并删除原始临时文件
+    并删除原始临时文件；耗时按 pipeline 记入 transcode 阶段
     """
     cmd = [
         "ffmpeg",
@@ -91,7 +86,8 @@ def convert_to_h264_compatible(input_path: str, output_path: str):
     ]
     try:
         logger.info(f"🔄 开始转码为 H.264 兼容格式: {output_path}")
-        subprocess.run(cmd, capture_output=True, text=True, check=True)
+        with metrics.stage(pipeline, "transcode"):
+            subprocess.run(cmd, capture_output=True, text=True, check=True)
         logger.info("✅ 转码完成")
     except subprocess.CalledProcessError as e:
         logger.error(f"❌ FFmpeg 转码失败: {e.stderr}")
@@ -104,26 +100,37 @@ def convert_to_h264_compatible(input_path: str, output_path: str):
             except OSError as e:
                 logger.warning(f"⚠️ 无法删除临时文件 {input_path}: {e}")
 
+def _remove_temp_output(output_path: str):
+    """处理失败时删除尚未转码的临时输出，避免残留 *_temp.mp4"""
+    temp_output_path = output_path.replace(".mp4", "_temp.mp4")
+    if os.path.exists(temp_output_path):
+        try:
+            os.remove(temp_output_path)
+        except OSError as e:
+            logger.warning(f"⚠️ 无法删除临时文件 {temp_output_path}: {e}")
+
+
 # ================== 视频处理核心函数 ==================
 def process_video_with_controls(
     video_id: str,
     input_path: str,
     output_path: str,
     conf: float = 0.5,
-    auto_conf: bool = False):
+    auto_conf: bool = False,
+    analytics_config: Dict[str, Any] = None):
     if auto_conf:
         conf_threshold = get_optimal_confidence()
     else:
         conf_threshold = conf
 
-    if model is None:
-        raise HTTPException(status_code=500, detail="模型未加载成功")
+    # 模型尚未加载时在这里加载（失败时抛出 ModelUnavailable）
+    model_registry.get()
 
     logger.info(f"🚀 开始视频处理: {input_path}")
     start_time = time.time()
 
     # GPU 强制使用
-    device_opt = "cuda" if torch.cuda.is_available() else "cpu"
+    device_opt = model_registry.device
 
     cap = cv2.VideoCapture(input_path)
     if not cap.isOpened():
@@ -153,9 +160,28 @@ def process_video_with_controls(
     active_tracks = {}
     track_id_to_display_id = {}
     next_display_id = 1
+    # 每个 display id 首次/最后出现的帧，用于按目标导出片段时直接定位
+    track_ranges = {}
     frame_detections = []
-
+    analytics_engine = AnalyticsEngine(analytics_config) if analytics_config else None
+    gallery = TrackGallery(video_id, w, h)
+    # 列表封面：取画好框的帧，不需要之后再解码一遍结果视频
+    poster_at = thumbnails.poster_index(total_frames)
+    poster = None
+    # 逐帧的阶段耗时：先取好子指标，循环里只做 observe
+    infer_seconds = metrics.STAGE_SECONDS.labels("video", "inference")
+    postprocess_seconds = metrics.STAGE_SECONDS.labels("video", "postprocess")
+    draw_seconds = metrics.STAGE_SECONDS.labels("video", "draw")
+    encode_seconds = metrics.STAGE_SECONDS.labels("video", "encode")
+    # 整段视频各阶段的累计耗时，结束时记到任务的 Trace 上
+    stage_totals = dict.fromkeys(("inference", "postprocess", "draw", "encode"), 0.0)
+
+    waited = time.perf_counter()
     for frame_idx, result in enumerate(results):
+        # 流式推理：等待下一帧结果的时间 = 解码 + 推理 + 跟踪
+        received = time.perf_counter()
+        infer_seconds.observe(received - waited)
+        stage_totals["inference"] += received - waited
         # 实时更新进度
         progress = frame_idx / total_frames if total_frames > 0 else 0
         if video_id in video_detection_data:
@@ -188,6 +214,15 @@ def process_video_with_controls(
 
                 display_id = track_id_to_display_id[track_id]
                 color = get_color_by_class_and_id(class_name, display_id)
+                if display_id not in track_ranges:
+                    track_ranges[display_id] = {"class": class_name, "first_frame": frame_idx, "last_frame": frame_idx,
+                                                "max_conf": float(conf), "bbox": [x1, y1, x2, y2]}
+                else:
+                    track_ranges[display_id]["last_frame"] = frame_idx
+                    # 保留置信度最高的一帧，写入检测表供跨记录检索
+                    if conf > track_ranges[display_id]["max_conf"]:
+                        track_ranges[display_id]["max_conf"] = float(conf)
+                        track_ranges[display_id]["bbox"] = [x1, y1, x2, y2]
 
                 detection_info = {
                     "id": display_id,
@@ -201,7 +236,6 @@ def process_video_with_controls(
                 }
 
                 frame_detection_data["detections"].append(detection_info)
-                draw_detection_box(frame, detection_info)
                 active_tracks[track_id] = {
                     'class': class_name,
                     'last_seen': frame_idx,
@@ -211,28 +245,62 @@ def process_video_with_controls(
 
         # draw_frame_stats(frame, frame_idx, len(frame_detection_data["detections"]),
         #                  total_frames, fps, w)
+        if analytics_engine is not None:
+            analytics_engine.update(frame_detection_data["timestamp"], frame_detection_data["detections"])
+        # orig_img 未绘制检测框，直接用于截图和缩略图
+        gallery.observe(result.orig_img, frame_idx, frame_detection_data["timestamp"],
+                        frame_detection_data["detections"])
         frame_detections.append(frame_detection_data)
+        processed = time.perf_counter()
+        postprocess_seconds.observe(processed - received)
+        stage_totals["postprocess"] += processed - received
+
+        for detection_info in frame_detection_data["detections"]:
+            draw_detection_box(frame, detection_info)
+        drawn = time.perf_counter()
+        draw_seconds.observe(drawn - processed)
+        stage_totals["draw"] += drawn - processed
+
         out.write(frame)
+        if poster is None or frame_idx == poster_at:
+            poster = frame
+        waited = time.perf_counter()
+        encode_seconds.observe(waited - drawn)
+        stage_totals["encode"] += waited - drawn
 
         if frame_idx % 50 == 0:
             logger.info(f"📊 处理进度: {frame_idx}/{total_frames} 帧 ({progress * 100:.2f}%)")
 
     cap.release()
     out.release()
+    for name, seconds in stage_totals.items():
+        tracing.add(name, seconds)
 
     convert_to_h264_compatible(temp_output_path, output_path)
 
+    analytics = None
+    if analytics_engine is not None:
+        analytics = analytics_engine.finalize()
+        save_video_analytics(video_id, analytics)
+
+    gallery_manifest = gallery.save()
+    video_info = {
+        "width": w,
+        "height": h,
+        "fps": fps,
+        "total_frames": total_frames,
+        "processing_time": time.time() - start_time,
+        "total_tracks": len(track_id_to_display_id)
+    }
+    save_frame_detections(video_id, frame_detections, video_info)
+
     video_detection_data[video_id] = {
         "status": "completed",
+        "analytics": analytics,
+        "gallery": gallery_manifest,
+        "track_ranges": track_ranges,
         "detections": frame_detections,
-        "video_info": {
-            "width": w,
-            "height": h,
-            "fps": fps,
-            "total_frames": total_frames,
-            "processing_time": time.time() - start_time,
-            "total_tracks": len(track_id_to_display_id)
-        },
+        "video_info": video_info,
         "display_settings": {
             "visible_ids": list(range(1, next_display_id)),
             "hidden_ids": []
@@ -240,31 +308,113 @@ def process_video_with_controls(
     }
 
     logger.info(f"✅ 视频处理完成! 总跟踪目标: {len(track_id_to_display_id)}")
+    with metrics.stage("video", "thumbnail"):
+        thumbnail_path = thumbnails.from_image(poster)
     return {
         "video_id": video_id,
+        "thumbnail_path": thumbnail_path,
         "total_frames": total_frames,
+        "fps": fps,
         "total_tracks": len(track_id_to_display_id),
         "processing_time": time.time() - start_time,
+        "track_ranges": track_ranges,
     }
 
 
+def get_analytics_path(video_id: str) -> str:
+    return os.path.join(RESULT_DIR, f"{video_id}_analytics.json")
+
+
+def get_frames_path(video_id: str) -> str:
+    return os.path.join(RESULT_DIR, f"{video_id}_frames.ndjson.gz")
+
+
+def _frame_line(frame_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "frame_index": frame_data["frame_index"],
+        "timestamp": frame_data["timestamp"],
+        "detections": [
+            {k: d[k] for k in ("id", "track_id", "class", "confidence", "bbox") if k in d}
+            for d in frame_data["detections"]
+        ]
+    }
+
+
+def save_frame_detections(video_id: str, frame_detections: List[Dict[str, Any]], video_info: Dict[str, Any]):
+    """
+    逐帧检测结果按行写入 gzip 文件（首行为视频信息），服务重启后仍可导出；
+    先写临时文件再原子替换，读者不会读到写了一半的文件
+    """
+    path = get_frames_path(video_id)
+    temp_path = f"{path}.part"
+    with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"video_info": video_info}, ensure_ascii=False) + "\n")
+        for frame_data in frame_detections:
+            f.write(json.dumps(_frame_line(frame_data), ensure_ascii=False) + "\n")
+    os.replace(temp_path, path)
+
+
+def iter_frame_detections(video_id: str):
+    """
+    读取视频的逐帧检测结果，返回 (video_info, 逐帧迭代器)，逐行读取，内存占用与视频长度无关；
+    没有落盘文件时退回内存中的数据（本次运行处理的视频），都没有时返回 (None, None)
+    """
+    path = get_frames_path(video_id)
+    if os.path.exists(path):
+        f = gzip.open(path, "rt", encoding="utf-8")
+        try:
+            video_info = json.loads(f.readline()).get("video_info")
+        except (OSError, ValueError):
+            f.close()
+            return None, None
+
+        def frames():
+            with f:
+                for line in f:
+                    yield json.loads(line)
+        return video_info, frames()
+
+    data = video_detection_data.get(video_id)
+    if data and data.get("status") == "completed" and data.get("detections"):
+        return data["video_info"], (_frame_line(frame) for frame in data["detections"])
+    return None, None
+
+
+def save_video_analytics(video_id: str, analytics: Dict[str, Any]):
+    """分析结果与结果视频放在一起，服务重启后仍可查询"""
+    with open(get_analytics_path(video_id), "w", encoding="utf-8") as f:
+        json.dump(analytics, f, ensure_ascii=False)
+
+
 # ================== 视频检测路由 ==================
 def _validate_video_id(video_id: str):
     if not re.match(r"^[a-zA-Z0-9_-]+$", video_id):
         raise HTTPException(status_code=400, detail="无效的 video_id")
 
 
-@router.post("/detect/video")
-async def detect_video(
-    file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = None,
-    conf: float = Query(0.5, ge=0.0, le=1.0),  # 用户可选
-    auto_conf: bool = Query(False)  # 是否启用自动最优阈值
-):
-    if conf < 0 or conf > 1:
-        raise HTTPException(status_code=400, detail="置信度应在 0~1 之间")
+def _find_video_record(video_id: str):
+    """按 video_id 查找原视频检测记录（排除导出的片段等衍生记录）"""
+    db = SessionLocal()
+    try:
+        return db.query(DetectRecord).filter(
+            DetectRecord.type == "video",
+            DetectRecord.result_path.like(f"%{video_id}%")
+        ).first()
+    finally:
+        db.close()
+
+
+def load_analytics_config(raw: str):
+    """解析请求中的分析配置，非法时返回 400"""
+    try:
+        return parse_analytics_config(raw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
-    filename = sanitize_filename(file.filename)
+def build_video_names(filename: str):
+    """根据原始文件名生成上传文件名、结果文件名和 video_id"""
+    filename = sanitize_filename(filename)
     name_no_ext, ext = os.path.splitext(filename)
     ext = ext.lower()
     if ext not in [".mp4", ".avi", ".mov", ".mkv"]:
@@ -274,15 +424,27 @@ async def detect_video(
     save_name = f"{timestamp}_{name_no_ext}{ext}"
     out_name = f"res_{timestamp}_{name_no_ext}.mp4"
     video_id = f"res_{timestamp}_{name_no_ext}"
+    return save_name, out_name, video_id
 
-    save_path = os.path.join(UPLOAD_DIR, save_name)
-    out_path = os.path.join(RESULT_DIR, out_name)
 
-    async with aiofiles.open(save_path, "wb") as out_file:
-        content = await file.read()
-        await out_file.write(content)
+def start_video_job(
+    save_path: str,
+    save_name: str,
+    out_name: str,
+    video_id: str,
+    conf: float,
+    auto_conf: bool,
+    background_tasks: BackgroundTasks = None,
+    analytics_config: Dict[str, Any] = None
+):
+    """
+    把已落盘的视频交给后台检测任务，返回与 /detect/video 一致的响应
+    save_path 是已 pin 住的内容寻址文件，任务结束（记录写入或失败）时解除
+    """
+    out_path = os.path.join(RESULT_DIR, out_name)
 
-    def _bg_task():
+    def _process(job_trace: tracing.Trace):
+        thumbnail_path = None
         video_detection_data[video_id] = {
             "status": "processing",
             "progress": 0.0,
@@ -295,34 +457,43 @@ async def detect_video(
                 save_path,
                 out_path,
                 conf=conf,
-                auto_conf=auto_conf
+                auto_conf=auto_conf,
+                analytics_config=analytics_config
             )
+            thumbnail_path = result_info["thumbnail_path"]
 
-            db = SessionLocal()
             try:
-                record = DetectRecord(
-                    type="video",
-                    filename=save_name,
-                    source_path=save_path,
-                    result_path=out_path,
-                    objects=json.dumps({
-                        "video_id": video_id,
-                        "total_tracks": result_info["total_tracks"],
-                        "processing_time": result_info["processing_time"]
-                    })
-                )
-                db.add(record)
-                db.commit()
-                logger.info(f"💾 数据库记录已保存，记录ID: {record.id}")
+                with tracing.span("db_commit"):
+                    record_id = record_writer.submit_insert(
+                        type="video",
+                        filename=save_name,
+                        source_path=save_path,
+                        result_path=out_path,
+                        thumbnail_path=thumbnail_path,
+                        duration=result_info["total_frames"] / result_info["fps"] if result_info["fps"] else None,
+                        objects=json.dumps({
+                            "video_id": video_id,
+                            "total_tracks": result_info["total_tracks"],
+                            "processing_time": result_info["processing_time"],
+                            "track_ranges": result_info["track_ranges"]
+                        })
+                    ).result()
+                logger.info(f"💾 数据库记录已保存，记录ID: {record_id}")
             except Exception as db_error:
                 logger.error(f"❌ 数据库保存失败: {db_error}")
-                db.rollback()
-            finally:
-                db.close()
+            video_detection_data[video_id]["timings"] = job_trace.timings()
         except Exception as e:
             logger.error(f"❌ 处理视频时出错: {e}")
             if video_id in video_detection_data:
                 video_detection_data[video_id]["status"] = "failed"
+            _remove_temp_output(out_path)
+        finally:
+            blob_store.release(save_path, thumbnail_path)
+
+    def _bg_task():
+        # 任务在响应发出之后运行，单独计时；完成后由 /video/{video_id}/status?timings=true 返回
+        with tracing.background_trace() as job_trace:
+            _process(job_trace)
 
     if background_tasks:
         background_tasks.add_task(_bg_task)
@@ -337,9 +508,36 @@ async def detect_video(
         "features": {
             "box_controls": True,
             "realtime_toggle": True,
-            "confidence_threshold": conf
+            "confidence_threshold": conf,
+            "analytics": analytics_config is not None
         }
     }
+
+
+@router.post("/detect/video")
+async def detect_video(
+    file: UploadFile = File(...),
+    background_tasks: BackgroundTasks = None,
+    conf: float = Query(0.5, ge=0.0, le=1.0),  # 用户可选
+    auto_conf: bool = Query(False),  # 是否启用自动最优阈值
+    analytics: str = Query(None),  # 越线/区域分析配置（JSON）
+    timings: bool = Query(False, description="响应中附带上传阶段的耗时（毫秒）；检测耗时见状态接口")
+):
+    if conf < 0 or conf > 1:
+        raise HTTPException(status_code=400, detail="置信度应在 0~1 之间")
+    analytics_config = load_analytics_config(analytics)
+
+    save_name, out_name, video_id = build_video_names(file.filename)
+
+    # 分块写盘，避免大视频整体读入内存；同样的视频只存一份
+    with metrics.stage("video", "upload_read"):
+        source = await blob_store.put_upload(file, UPLOAD_DIR, os.path.splitext(save_name)[1])
+
+    response = start_video_job(source.path, save_name, out_name, video_id, conf, auto_conf,
+                               background_tasks, analytics_config)
+    if timings:
+        response["timings"] = tracing.timings()
+    return response
 # ================== 框控制和辅助函数 ==================
 
 # ================== 自动置信度选择函数 ==================
@@ -394,7 +592,7 @@ def regenerate_video_with_controls(video_id: str, hidden_ids: List[int],
     cap.release()
     out.release()
 
-    convert_to_h264_compatible(temp_output_path, output_path)
+    convert_to_h264_compatible(temp_output_path, output_path, pipeline="regenerate")
 
     video_detection_data[video_id]["display_settings"] = {
         "visible_ids": [i for i in range(1, video_info["total_tracks"] + 1) if i not in hidden_ids],
@@ -476,23 +674,19 @@ async def toggle_video_boxes(
         raise HTTPException(status_code=400, detail=f"无效的隐藏ID: {invalid_ids}")
 
     if regenerate:
-        source_path = None
-        db = SessionLocal()
-        try:
-            record = db.query(DetectRecord).filter(
-                DetectRecord.result_path.like(f"%{video_id}%")
-            ).first()
-            if record and os.path.exists(record.source_path):
-                source_path = record.source_path
-        finally:
-            db.close()
+        record = _find_video_record(video_id)
+        source_path = record.source_path if record else None
 
         if not source_path or not os.path.exists(source_path):
             raise HTTPException(status_code=404, detail="原始视频文件不存在")
 
         new_out_name = f"res_{video_id}_controlled.mp4"
         new_out_path = os.path.join(RESULT_DIR, new_out_name)
-        regenerate_video_with_controls(video_id, hidden_ids, source_path, new_out_path)
+        try:
+            regenerate_video_with_controls(video_id, hidden_ids, source_path, new_out_path)
+        except Exception:
+            _remove_temp_output(new_out_path)
+            raise
 
         return {
             "status": "regenerated",
@@ -569,6 +763,87 @@ async def get_video_objects(video_id: str):
     }
 
 
+@router.get("/video/{video_id}/analytics")
+async def get_video_analytics(video_id: str, include_events: bool = True):
+    _validate_video_id(video_id)
+    analytics = None
+    if video_id in video_detection_data:
+        data = video_detection_data[video_id]
+        if data.get("status") == "processing":
+            return {"status": "processing", "progress": round(data.get("progress", 0), 3)}
+        analytics = data.get("analytics")
+
+    if analytics is None:
+        analytics_path = get_analytics_path(video_id)
+        if not os.path.exists(analytics_path):
+            raise HTTPException(status_code=404, detail="该视频没有分析结果")
+        with open(analytics_path, "r", encoding="utf-8") as f:
+            analytics = json.load(f)
+
+    result = {"video_id": video_id, "status": "completed", **analytics}
+    if not include_events:
+        result.pop("events", None)
+    return result
+
+
+def _get_gallery_manifest(video_id: str):
+    manifest = None
+    if video_id in video_detection_data:
+        manifest = video_detection_data[video_id].get("gallery")
+    if manifest is None:
+        manifest = load_manifest(video_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="该视频没有截图数据")
+    return manifest
+
+
+@router.get("/video/{video_id}/tracks")
+async def get_video_tracks(video_id: str):
+    _validate_video_id(video_id)
+    manifest = _get_gallery_manifest(video_id)
+    tracks = [
+        {**track, "crop_url": f"/api/video/{video_id}/tracks/{track['display_id']}/crop"}
+        for track in manifest["tracks"]
+    ]
+    return {"video_id": video_id, "tracks": tracks, "total_tracks": len(tracks)}
+
+
+@router.get("/video/{video_id}/tracks/{display_id}/crop")
+async def get_track_crop(video_id: str, display_id: int):
+    _validate_video_id(video_id)
+    crop_path = get_crop_path(video_id, display_id)
+    if not os.path.exists(crop_path):
+        raise HTTPException(status_code=404, detail="目标截图不存在")
+    return FileResponse(crop_path, media_type="image/jpeg")
+
+
+@router.get("/video/{video_id}/sprites")
+async def get_video_sprites(video_id: str):
+    _validate_video_id(video_id)
+    manifest = _get_gallery_manifest(video_id)
+    sheets = [
+        {**sheet, "url": f"/api/video/{video_id}/sprites/{sheet['sheet']}"}
+        for sheet in manifest["sheets"]
+    ]
+    return {
+        "video_id": video_id,
+        "interval": manifest["interval"],
+        "tile_width": manifest["tile_width"],
+        "tile_height": manifest["tile_height"],
+        "total_thumbnails": manifest["total_thumbnails"],
+        "sheets": sheets
+    }
+
+
+@router.get("/video/{video_id}/sprites/{sheet}")
+async def get_video_sprite_sheet(video_id: str, sheet: int):
+    _validate_video_id(video_id)
+    sprite_path = get_sprite_path(video_id, sheet)
+    if not os.path.exists(sprite_path):
+        raise HTTPException(status_code=404, detail="缩略图不存在")
+    return FileResponse(sprite_path, media_type="image/jpeg")
+
+
 @router.post("/video/{video_id}/reset")
 async def reset_video_boxes(video_id: str):
     _validate_video_id(video_id)
@@ -588,7 +863,7 @@ async def reset_video_boxes(video_id: str):
 
 
 @router.get("/video/{video_id}/status")
-async def get_video_status(video_id: str):
+async def get_video_status(video_id: str, timings: bool = Query(False, description="完成后附带各阶段耗时（毫秒）")):
     _validate_video_id(video_id)
     if video_id not in video_detection_data:
         return {"status": "not_found"}
@@ -602,10 +877,241 @@ async def get_video_status(video_id: str):
             "progress": round(data.get("progress", 0), 3)
         }
     elif status == "completed":
-        return {
+        out_name = f"{video_id}.mp4"
+        response = {
             "status": "completed",
             "total_frames": len(data["detections"]),
-            "total_tracks": data["video_info"]["total_tracks"]
+            "total_tracks": data["video_info"]["total_tracks"],
+            # 带版本号的结果地址：文件不变时地址不变，播放器可以直接命中缓存
+            "result_url": versioned_url(f"/files/result/{out_name}", os.path.join(RESULT_DIR, out_name))
         }
+        if timings:
+            response["timings"] = data.get("timings")
+        return response
     else:
-        return {"status": status}
\ No newline at end of file
+        return {"status": status}
+
+# ================== 单目标片段导出 ==================
+clip_jobs: Dict[str, Any] = {}
+
+
+def _video_metrics():
+    """/metrics 抓取时统计内存中的视频任务"""
+    entries = list(video_detection_data.values())
+    clips = list(clip_jobs.values())
+    yield ("video_jobs_active", "Video detection jobs currently processing",
+           [({}, sum(1 for data in entries if data.get("status") == "processing"))])
+    yield ("video_detection_data_entries", "Videos held in the in-memory video_detection_data map",
+           [({}, len(entries))])
+    yield ("video_detection_data_frames", "Per-frame detection entries held in memory",
+           [({}, sum(len(data.get("detections") or ()) for data in entries))])
+    yield ("clip_jobs_active", "Track clip exports currently running",
+           [({}, sum(1 for job in clips if job.get("status") == "processing"))])
+
+
+metrics.register_collector(_video_metrics)
+
+
+def _get_track_range(video_id: str, display_id: int):
+    """优先取内存中的轨迹范围，服务重启后从数据库记录中恢复"""
+    data = video_detection_data.get(video_id)
+    ranges = data.get("track_ranges") if data else None
+    if ranges is None:
+        record = _find_video_record(video_id)
+        ranges = {}
+        if record and record.objects:
+            try:
+                ranges = json.loads(record.objects).get("track_ranges", {})
+            except (ValueError, AttributeError):
+                ranges = {}
+    # 从 JSON 恢复时键是字符串
+    return ranges.get(display_id) or ranges.get(str(display_id))
+
+
+def _get_track_detections(video_id: str, display_id: int, first_frame: int, last_frame: int):
+    """取目标在 [first_frame, last_frame] 内每帧的检测框，只扫描该区间"""
+    data = video_detection_data.get(video_id)
+    if not data or data.get("status") != "completed":
+        return None
+    frames = data["detections"]
+    track_dets = {}
+    for frame_idx in range(first_frame, min(last_frame + 1, len(frames))):
+        for det in frames[frame_idx]["detections"]:
+            if det["id"] == display_id:
+                track_dets[frame_idx] = det
+                break
+    return track_dets
+
+
+def _crop_size(track_dets: Dict[int, Any], frame_w: int, frame_h: int):
+    """固定的裁剪尺寸：目标最大框外扩 20%，保证偶数宽高以兼容 H.264"""
+    max_w = max(d["bbox"][2] - d["bbox"][0] for d in track_dets.values())
+    max_h = max(d["bbox"][3] - d["bbox"][1] for d in track_dets.values())
+    crop_w = min(frame_w, int(max_w * 1.2)) // 2 * 2
+    crop_h = min(frame_h, int(max_h * 1.2)) // 2 * 2
+    return max(2, crop_w), max(2, crop_h)
+
+
+def export_track_clip(clip_id: str, video_id: str, display_id: int, source_path: str,
+                      track_range: Dict[str, Any], track_dets: Dict[int, Any],
+                      crop: bool, padding: float, draw_box: bool):
+    """
+    导出单个目标出现的片段：直接 seek 到首帧附近，只解码需要的帧
+    """
+    job = clip_jobs[clip_id]
+    start_time = time.time()
+    temp_output_path = None
+    thumbnail_path = None
+    try:
+        cap = cv2.VideoCapture(source_path)
+        if not cap.isOpened():
+            raise RuntimeError("无法打开视频文件")
+
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25
+        w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        pad_frames = int(round(padding * fps))
+        start_frame = max(0, track_range["first_frame"] - pad_frames)
+        end_frame = track_range["last_frame"] + pad_frames
+        if total_frames > 0:
+            end_frame = min(end_frame, total_frames - 1)
+
+        if crop and track_dets:
+            out_size = _crop_size(track_dets, w, h)
+        else:
+            crop = False
+            out_size = (w, h)
+
+        temp_output_path = job["result_path"].replace(".mp4", "_temp.mp4")
+        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        out = cv2.VideoWriter(temp_output_path, fourcc, fps, out_size)
+
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        # 片段开头（padding 部分）目标还未出现时，用首个检测框定位裁剪窗口
+        current_det = track_dets[min(track_dets)] if track_dets else None
+        span = max(1, end_frame - start_frame + 1)
+        written = 0
+        # 片段封面：目标第一次出现的帧（裁剪后），没有检测时用第一帧
+        poster, poster_has_target = None, False
+
+        for frame_idx in range(start_frame, end_frame + 1):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            det = track_dets.get(frame_idx) if track_dets else None
+            if det is not None:
+                current_det = det
+                if draw_box:
+                    draw_detection_box(frame, det)
+
+            if crop and current_det is not None:
+                x1, y1, x2, y2 = current_det["bbox"]
+                crop_w, crop_h = out_size
+                left = min(max(0, (x1 + x2) // 2 - crop_w // 2), w - crop_w)
+                top = min(max(0, (y1 + y2) // 2 - crop_h // 2), h - crop_h)
+                frame = frame[top:top + crop_h, left:left + crop_w]
+
+            out.write(frame)
+            if not poster_has_target and (poster is None or det is not None):
+                poster, poster_has_target = frame, det is not None
+            written += 1
+            job["progress"] = written / span
+
+        cap.release()
+        out.release()
+
+        if written == 0:
+            raise RuntimeError("没有读取到任何帧")
+
+        convert_to_h264_compatible(temp_output_path, job["result_path"], pipeline="clip")
+
+        thumbnail_path = thumbnails.from_image(poster)
+        job["record_id"] = record_writer.submit_insert(
+            type="video_clip",
+            filename=os.path.basename(job["result_path"]),
+            source_path=source_path,
+            result_path=job["result_path"],
+            result_url=job["result_url"],
+            thumbnail_path=thumbnail_path,
+            duration=written / fps,
+            objects=json.dumps({
+                "video_id": video_id,
+                "display_id": display_id,
+                "class": track_range.get("class"),
+                "start_frame": start_frame,
+                "end_frame": start_frame + written - 1,
+                "fps": fps,
+                "crop": crop
+            })
+        ).result()
+
+        job.update({
+            "status": "completed",
+            "progress": 1.0,
+            "frames": written,
+            "processing_time": time.time() - start_time
+        })
+        logger.info(f"✅ 片段导出完成: {job['result_path']} ({written} 帧, {time.time() - start_time:.2f}s)")
+    except Exception as e:
+        logger.error(f"❌ 片段导出失败: {e}")
+        job.update({"status": "failed", "error": str(getattr(e, "detail", e))})
+        if temp_output_path and os.path.exists(temp_output_path):
+            os.remove(temp_output_path)
+    finally:
+        blob_store.release(thumbnail_path)
+
+
+@router.post("/video/{video_id}/tracks/{display_id}/clip")
+async def export_track_clip_route(
+    video_id: str,
+    display_id: int,
+    background_tasks: BackgroundTasks,
+    crop: bool = False,
+    padding: float = Query(0.5, ge=0.0, le=10.0),
+    draw_box: bool = True
+):
+    _validate_video_id(video_id)
+    track_range = _get_track_range(video_id, display_id)
+    if track_range is None:
+        raise HTTPException(status_code=404, detail="目标不存在或视频轨迹数据不存在")
+
+    record = _find_video_record(video_id)
+    source_path = record.source_path if record else None
+    if not source_path or not os.path.exists(source_path):
+        raise HTTPException(status_code=404, detail="原始视频文件不存在")
+
+    track_dets = _get_track_detections(video_id, display_id,
+                                       track_range["first_frame"], track_range["last_frame"])
+    if crop and not track_dets:
+        raise HTTPException(status_code=409, detail="逐帧检测数据不在内存中，无法跟随目标裁剪")
+
+    timestamp = int(time.time() * 1000)
+    clip_id = f"clip_{timestamp}_{display_id}"
+    out_name = f"clip_{video_id}_{display_id}_{timestamp}.mp4"
+    clip_jobs[clip_id] = {
+        "clip_id": clip_id,
+        "video_id": video_id,
+        "display_id": display_id,
+        "status": "processing",
+        "progress": 0.0,
+        "result_path": os.path.join(RESULT_DIR, out_name),
+        "result_url": f"/files/result/{out_name}"
+    }
+    background_tasks.add_task(export_track_clip, clip_id, video_id, display_id, source_path,
+                              track_range, track_dets, crop, padding, draw_box)
+
+    return {
+        "status": "processing",
+        "clip_id": clip_id,
+        "result_url": f"/files/result/{out_name}",
+        "status_url": f"/api/video/clip-jobs/{clip_id}"
+    }
+
+
+@router.get("/video/clip-jobs/{clip_id}")
+async def get_clip_status(clip_id: str):
+    if clip_id not in clip_jobs:
+        return {"status": "not_found"}
+    job = clip_jobs[clip_id]
+    return {k: v for k, v in job.items() if k != "result_path"}
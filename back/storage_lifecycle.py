@@ -0,0 +1,650 @@
+"""
+存储生命周期：保留策略、配额淘汰、孤儿文件清理、后台批量删除
+
+后台线程每个周期只做一小段工作，目录再大单次开销也是固定的：
+  - 批量删除任务排队执行，优先于其它工作
+  - 保留策略：按类型删除超过保留天数的记录（每 RETENTION_INTERVAL 秒一次）
+  - 孤儿巡检：os.scandir 惰性遍历托管目录，每个周期只取 STORAGE_SWEEP_BATCH 项，
+    批量到数据库核对是否仍被记录引用；一轮结束时得到各目录的精确占用，据此做配额淘汰
+  - 磁盘剩余空间低于下限时，按检测时间从旧到新淘汰记录；缺口超过托管目录的占用（空间被别的东西占了），
+    或淘汰一批记录没释放出空间（文件被共用或已不存在）时，暂停淘汰到下一轮巡检结束
+"""
+import os
+import re
+import time
+import uuid
+import queue
+import shutil
+import logging
+import threading
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import select, delete, desc, insert
+from config import (UPLOAD_DIR, RESULT_DIR, CAMERA_DIR, TRANSCODED_DIR, GALLERY_DIR, PARTIAL_UPLOAD_DIR, THUMB_DIR,
+                    STORAGE_LIFECYCLE_ENABLED, RETENTION_DAYS, RETENTION_INTERVAL, STORAGE_QUOTA_GB,
+                    STORAGE_MIN_FREE_GB, ORPHAN_GRACE_SECONDS, UPLOAD_SESSION_TTL, STORAGE_SWEEP_BATCH,
+                    STORAGE_SWEEP_INTERVAL, STORAGE_TICK)
+import blob_store
+from db import engine
+from db_writer import record_writer
+from detection_index import unindex_records
+from gallery import get_gallery_dir
+from models import DetectRecord, KeptFile
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+DELETE_BATCH = 500
+EVICT_BATCH = 100
+RETENTION_MAX_PER_RUN = 5000  # 单次保留策略最多删除的记录数，积压的留到下一次
+MAX_FINISHED_JOBS = 100
+
+# 存放记录文件的目录，巡检时按路径核对引用
+FILE_DIRS = {"upload": UPLOAD_DIR, "result": RESULT_DIR, "camera": CAMERA_DIR, "transcoded": TRANSCODED_DIR,
+             "thumb": THUMB_DIR}
+_MANAGED_ROOTS = [os.path.realpath(d) for d in (*FILE_DIRS.values(), GALLERY_DIR, PARTIAL_UPLOAD_DIR)]
+
+# 结果目录中依附于视频结果的派生文件（命名见 routers/video.py），只要原视频记录还在就保留
+_DERIVED_PATTERNS = [re.compile(r"^(.+)_analytics\.json$"), re.compile(r"^(.+)_frames\.ndjson\.gz$"),
+                     re.compile(r"^res_(.+)_controlled\.mp4$")]
+
+
+# ================== 记录与文件 ==================
+
+def _is_managed(path: str) -> bool:
+    real = os.path.realpath(path)
+    return any(real == root or real.startswith(root + os.sep) for root in _MANAGED_ROOTS)
+
+
+def _path_size(path: str) -> int:
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    return os.path.getsize(path)
+
+
+def _remove_path(path: str) -> Optional[int]:
+    """删除文件或目录，返回释放的字节数；文件已不存在时返回 None"""
+    try:
+        size = _path_size(path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return size
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"⚠️ 无法删除文件 {path}: {e}")
+        return None
+
+
+def owned_files(record_type: Optional[str], source_path: Optional[str], result_path: Optional[str],
+                thumbnail_path: Optional[str] = None) -> List[str]:
+    """
+    记录自身拥有的文件
+    视频片段的 source_path 是原视频的上传文件，不属于片段；视频记录还拥有分析结果、逐帧检测、重绘视频和目标截图
+    """
+    paths = []
+    if result_path:
+        paths.append(result_path)
+    if thumbnail_path:
+        paths.append(thumbnail_path)
+    if source_path and source_path != result_path and record_type != "video_clip":
+        paths.append(source_path)
+    if record_type == "video" and result_path:
+        video_id = os.path.splitext(os.path.basename(result_path))[0]
+        paths.append(os.path.join(RESULT_DIR, f"{video_id}_analytics.json"))
+        paths.append(os.path.join(RESULT_DIR, f"{video_id}_frames.ndjson.gz"))
+        paths.append(os.path.join(RESULT_DIR, f"res_{video_id}_controlled.mp4"))
+        paths.append(get_gallery_dir(video_id))
+    return paths
+
+
+def _referenced(conn, paths: Sequence[str]) -> set:
+    """paths 中仍被记录的 source_path / result_path / thumbnail_path 引用，或删除记录时要求保留的路径"""
+    found = set()
+    paths = list(paths)
+    for start in range(0, len(paths), DELETE_BATCH):
+        chunk = paths[start:start + DELETE_BATCH]
+        for column in (DetectRecord.source_path, DetectRecord.result_path, DetectRecord.thumbnail_path,
+                       KeptFile.path):
+            found.update(conn.execute(select(column).where(column.in_(chunk))).scalars())
+    return found
+
+
+def _delete_returning(conn, record_ids: Sequence[int]) -> list:
+    """
+    删除记录并取回被删的行
+    MySQL 不支持 DELETE ... RETURNING：同一事务里先 SELECT ... FOR UPDATE 锁住这些行再删除，
+    并发删除同一批 id 的另一方等锁释放后读不到这些行
+    """
+    columns = (DetectRecord.id, DetectRecord.type, DetectRecord.source_path, DetectRecord.result_path,
+               DetectRecord.thumbnail_path)
+    if conn.dialect.delete_returning:
+        return conn.execute(delete(DetectRecord).where(DetectRecord.id.in_(record_ids)).returning(*columns)).all()
+    rows = conn.execute(select(*columns).where(DetectRecord.id.in_(record_ids)).with_for_update()).all()
+    if rows:
+        conn.execute(delete(DetectRecord).where(DetectRecord.id.in_([row.id for row in rows])))
+    return rows
+
+
+def _keep_files(conn, paths: Sequence[str]):
+    """记下要保留的文件；已记录过的路径跳过"""
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return
+    dialect = conn.dialect.name
+    rows = [{"path": p, "kept_at": datetime.utcnow()} for p in paths]
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+        conn.execute(upsert(KeptFile).on_conflict_do_nothing(index_elements=["path"]), rows)
+    elif dialect in ("mysql", "mariadb"):
+        conn.execute(insert(KeptFile).prefix_with("IGNORE"), rows)
+    else:
+        existing = set(conn.execute(select(KeptFile.path).where(KeptFile.path.in_(paths))).scalars())
+        rows = [row for row in rows if row["path"] not in existing]
+        if rows:
+            conn.execute(insert(KeptFile), rows)
+
+
+def delete_records(record_ids: Sequence[int], delete_files: bool = True) -> Dict[str, Any]:
+    """
+    删除记录及其检测数据；delete_files 时同时删除记录拥有、且不再被其它记录引用的文件，
+    否则把记录的文件（缩略图除外）记入 kept_file，之后不会被当作孤儿清理
+    返回 {"records": 删除的记录数, "files": 删除的文件数, "bytes": 释放的字节数, "paths": 删除的文件}
+    """
+    result = {"records": 0, "files": 0, "bytes": 0, "paths": []}
+    ids = list(record_ids)
+    for start in range(0, len(ids), DELETE_BATCH):
+        chunk = ids[start:start + DELETE_BATCH]
+        candidates: List[str] = []
+        with engine.begin() as conn:
+            # 先删记录并取回被删的行：并发删除同一批 id 时，只有真正删掉记录的一方扣减聚合计数、删除文件
+            rows = _delete_returning(conn, chunk)
+            if not rows:
+                continue
+            found = [row.id for row in rows]
+            unindex_records(conn, found)
+            if delete_files:
+                for row in rows:
+                    candidates.extend(p for p in owned_files(row.type, row.source_path, row.result_path,
+                                                                  row.thumbnail_path)
+                                      if _is_managed(p))
+                candidates = list(dict.fromkeys(candidates))
+            else:
+                # 缩略图是派生的缓存，不属于调用方要求保留的文件，照常作为孤儿清理
+                _keep_files(conn, [p for row in rows
+                                   for p in owned_files(row.type, row.source_path, row.result_path)
+                                   if _is_managed(p)])
+        result["records"] += len(found)
+        if not candidates:
+            continue
+        # 提交之后再删文件：事务回滚时文件还在。
+        # 内容寻址的文件可能被多条记录共用（相同的上传、视频片段与原视频）：先占住没有 pin 的路径，
+        # 再复查引用计数并删除；占住期间并发的复用/写入不会拿到这些路径，查库和删除不持有 blob_store 的锁
+        with blob_store.deleting(candidates) as claimed:
+            if not claimed:
+                continue
+            with engine.connect() as conn:
+                keep = _referenced(conn, claimed)
+            for path in claimed:
+                if path in keep:
+                    continue
+                size = _remove_path(path)
+                if size is not None:
+                    result["files"] += 1
+                    result["bytes"] += size
+                    result["paths"].append(path)
+    if result["records"]:
+        record_writer.mark_changed()
+    return result
+
+
+# ================== 后台服务 ==================
+
+class StorageLifecycle:
+    """
+    submit_delete 提交批量删除任务，request_sweep 立即开始新一轮巡检
+    后台线程由 start() 启动；STORAGE_LIFECYCLE_ENABLED 关闭时只执行删除任务
+    """
+
+    def __init__(self, enabled: bool = STORAGE_LIFECYCLE_ENABLED, tick: float = STORAGE_TICK,
+                 sweep_batch: int = STORAGE_SWEEP_BATCH):
+        self.enabled = enabled
+        self.tick = tick
+        self.sweep_batch = sweep_batch
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self._last_retention = 0.0
+        self._next_pass_at = 0.0
+        self._sweep: Optional[Iterator[Tuple[str, os.DirEntry]]] = None
+        self._restart_requested = False
+        self._deletion_safe = True
+        self.current_pass: Optional[Dict[str, Any]] = None
+        self.last_pass: Optional[Dict[str, Any]] = None
+        self.retention_deleted = 0
+        self.evicted = 0
+        # 上一轮巡检结束后淘汰释放的字节数，用来估算托管目录当前的占用
+        self._evicted_bytes = 0
+        # 低空间淘汰暂停的原因，下一轮巡检结束时清除
+        self._free_space_paused: Optional[str] = None
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="storage-lifecycle", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stop.set()
+            self._queue.put(None)
+        thread.join(timeout=timeout)
+        self._thread = None
+
+    # ---------- 对外接口 ----------
+
+    def submit_delete(self, ids: Optional[List[int]] = None, type: Optional[str] = None,
+                      start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      delete_files: bool = True) -> Dict[str, Any]:
+        """按 id 列表或 类型/时间范围 批量删除，返回任务状态（后台执行）"""
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "filters": {
+                "ids": len(ids) if ids else None,
+                "type": type,
+                "start": start.isoformat() if start else None,
+                "end": end.isoformat() if end else None
+            },
+            "delete_files": delete_files,
+            "records": 0,
+            "files": 0,
+            "bytes": 0,
+            "created_at": time.time(),
+            "_params": (list(ids) if ids else None, type, start, end, delete_files)
+        }
+        self.jobs[job_id] = job
+        self._prune_jobs()
+        self.start()
+        self._queue.put(job_id)
+        return self.job_info(job_id)
+
+    def job_info(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return {k: v for k, v in job.items() if not k.startswith("_")}
+
+    def request_sweep(self):
+        """下一个周期立即开始新一轮巡检（正在进行的一轮会重新开始）"""
+        self._restart_requested = True
+
+    def status(self) -> Dict[str, Any]:
+        try:
+            disk = shutil.disk_usage(RESULT_DIR)
+            disk_info = {"total": disk.total, "free": disk.free}
+        except OSError:
+            disk_info = None
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "retention_days": RETENTION_DAYS,
+            "quota_bytes": int(STORAGE_QUOTA_GB * GB) or None,
+            "min_free_bytes": int(STORAGE_MIN_FREE_GB * GB) or None,
+            "orphan_grace_seconds": ORPHAN_GRACE_SECONDS,
+            "disk": disk_info,
+            "current_pass": self.current_pass,
+            "last_pass": self.last_pass,
+            "retention_deleted": self.retention_deleted,
+            "evicted": self.evicted,
+            "free_space_paused": self._free_space_paused,
+            "pending_jobs": self._queue.qsize()
+        }
+
+    # ---------- 后台线程 ----------
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job_id = self._queue.get(timeout=self.tick)
+            except queue.Empty:
+                job_id = None
+            if self._stop.is_set():
+                return
+            if job_id is not None:
+                self._run_job(job_id)
+                continue
+            if not self.enabled:
+                continue
+            try:
+                self._tick()
+            except Exception as e:
+                logger.error(f"❌ 存储维护出错: {e}")
+
+    def _tick(self):
+        now = time.time()
+        if now - self._last_retention >= RETENTION_INTERVAL:
+            self._last_retention = now
+            self._apply_retention()
+        self._check_free_space()
+        if self._restart_requested:
+            self._restart_requested = False
+            self._sweep = None
+            self._next_pass_at = 0.0
+        if self._sweep is not None or now >= self._next_pass_at:
+            self._sweep_slice()
+
+    def _prune_jobs(self):
+        """只保留最近 MAX_FINISHED_JOBS 个已结束的任务"""
+        finished = sorted((j for j in self.jobs.values() if j["status"] in ("completed", "failed")),
+                          key=lambda j: j["created_at"])
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self.jobs.pop(job["job_id"], None)
+
+    def _run_job(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] != "queued":
+            return
+        ids, record_type, start, end, delete_files = job["_params"]
+        job["status"] = "running"
+        try:
+            if ids:
+                batches = (ids[i:i + DELETE_BATCH] for i in range(0, len(ids), DELETE_BATCH))
+            else:
+                batches = self._select_batches(record_type, start, end)
+            for batch in batches:
+                if self._stop.is_set():
+                    job.update({"status": "failed", "error": "服务停止，任务中断"})
+                    return
+                done = delete_records(batch, delete_files)
+                for key in ("records", "files", "bytes"):
+                    job[key] += done[key]
+            job["status"] = "completed"
+            logger.info(f"🗑️ 批量删除完成: {job['records']} 条记录, {job['files']} 个文件, "
+                        f"{job['bytes'] / 1024 / 1024:.1f} MB")
+        except Exception as e:
+            logger.error(f"❌ 批量删除失败: {e}")
+            job.update({"status": "failed", "error": str(e)})
+        finally:
+            job["finished_at"] = time.time()
+
+    @staticmethod
+    def _select_batches(record_type: Optional[str], start: Optional[datetime], end: Optional[datetime]):
+        """按条件分批取出待删除的 id；每批删除后重新查询，不依赖偏移"""
+        while True:
+            query = select(DetectRecord.id)
+            if record_type:
+                query = query.where(DetectRecord.type == record_type)
+            if start:
+                query = query.where(DetectRecord.detect_time >= start)
+            if end:
+                query = query.where(DetectRecord.detect_time < end)
+            with engine.connect() as conn:
+                ids = conn.execute(query.order_by(DetectRecord.id).limit(DELETE_BATCH)).scalars().all()
+            if not ids:
+                return
+            yield ids
+
+    # ---------- 保留策略与淘汰 ----------
+
+    def _apply_retention(self):
+        budget = RETENTION_MAX_PER_RUN
+        for record_type, days in RETENTION_DAYS.items():
+            if not days or budget <= 0:
+                continue
+            cutoff = datetime.utcnow() - timedelta(days=days)
+            deleted = 0
+            while budget > 0 and not self._stop.is_set():
+                with engine.connect() as conn:
+                    ids = conn.execute(
+                        select(DetectRecord.id)
+                        .where(DetectRecord.type == record_type, DetectRecord.detect_time < cutoff)
+                        .order_by(DetectRecord.detect_time)
+                        .limit(min(DELETE_BATCH, budget))
+                    ).scalars().all()
+                if not ids:
+                    break
+                deleted += delete_records(ids)["records"]
+                budget -= len(ids)
+            if deleted:
+                self.retention_deleted += deleted
+                logger.info(f"🧹 保留策略: 删除 {deleted} 条超过 {days} 天的 {record_type} 记录")
+
+    def _evict_oldest(self, need_bytes: int, reason: str = "") -> Tuple[int, bool]:
+        """
+        按检测时间从旧到新删除记录及文件，直到释放 need_bytes
+        返回 (释放的字节数, 是否停滞)：一批记录没释放出空间（文件被其它记录共用或已不存在）就停止，避免把记录删光
+        """
+        freed = 0
+        while not self._stop.is_set():
+            with engine.connect() as conn:
+                ids = conn.execute(
+                    select(DetectRecord.id).order_by(DetectRecord.detect_time, DetectRecord.id).limit(EVICT_BATCH)
+                ).scalars().all()
+            if not ids:
+                break
+            done = delete_records(ids)
+            self.evicted += done["records"]
+            self._evicted_bytes += done["bytes"]
+            freed += done["bytes"]
+            logger.info(f"🧹 {reason}: 淘汰最旧的 {done['records']} 条记录，释放 {done['bytes'] / 1024 / 1024:.1f} MB")
+            if done["bytes"] == 0:
+                return freed, True
+            if freed >= need_bytes:
+                break
+        return freed, False
+
+    def _pause_free_space(self, why: str):
+        if self._free_space_paused is None:
+            logger.warning(f"⚠️ 磁盘剩余空间不足，但{why}，暂停淘汰到下一轮巡检结束")
+        self._free_space_paused = why
+
+    def _check_free_space(self):
+        if not STORAGE_MIN_FREE_GB or self._free_space_paused:
+            return
+        min_free = int(STORAGE_MIN_FREE_GB * GB)
+        try:
+            free = shutil.disk_usage(RESULT_DIR).free
+        except OSError:
+            return
+        if free >= min_free:
+            return
+        if self.last_pass is None:
+            # 还不知道托管目录占用多少，等第一轮巡检结束
+            return
+        shortfall = min_free - free
+        managed = self.last_pass["usage"] - self._evicted_bytes
+        if managed < shortfall:
+            self._pause_free_space(f"缺口 {shortfall / GB:.2f} GB 超过托管文件的占用 {max(managed, 0) / GB:.2f} GB")
+            return
+        _, stalled = self._evict_oldest(shortfall, reason="磁盘剩余空间不足")
+        if stalled:
+            self._pause_free_space("淘汰最旧的记录没有释放出空间")
+
+    def _enforce_quota(self, usage: int):
+        if not STORAGE_QUOTA_GB:
+            return
+        quota = int(STORAGE_QUOTA_GB * GB)
+        if usage > quota:
+            self._evict_oldest(usage - quota, reason="超出存储配额")
+
+    # ---------- 孤儿巡检 ----------
+
+    @staticmethod
+    def _entries() -> Iterator[Tuple[str, os.DirEntry]]:
+        """
+        一轮巡检要遍历的目录项；scandir 惰性读取，不会一次把整个目录载入内存
+        文件目录下的子目录（内容寻址的扇出目录、.incoming）逐层展开，画廊目录按整个目录计
+        """
+        for kind, directory in (*FILE_DIRS.items(), ("gallery", GALLERY_DIR), ("partial", PARTIAL_UPLOAD_DIR)):
+            pending = [directory]
+            while pending:
+                current = pending.pop()
+                if not os.path.isdir(current):
+                    continue
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if kind in FILE_DIRS and entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                            continue
+                        yield kind, entry
+
+    @staticmethod
+    def _paths_consistent() -> bool:
+        """
+        最近的记录文件一个都不在记录的路径上时，多半是部署目录变了（而不是文件都成了孤儿），
+        这一轮只统计不删除
+        """
+        with engine.connect() as conn:
+            paths = conn.execute(
+                select(DetectRecord.result_path).where(DetectRecord.result_path.isnot(None))
+                .order_by(desc(DetectRecord.id)).limit(50)
+            ).scalars().all()
+        if not paths or any(os.path.exists(p) for p in paths):
+            return True
+        logger.warning("⚠️ 最近记录的文件都不在记录的路径上，本轮巡检不删除孤儿文件")
+        return False
+
+    def _sweep_slice(self):
+        if self._sweep is None:
+            self._sweep = self._entries()
+            self._deletion_safe = self._paths_consistent()
+            self.current_pass = {
+                "started_at": time.time(),
+                "scanned": 0,
+                "bytes": {kind: 0 for kind in (*FILE_DIRS, "gallery", "partial")},
+                "orphans": 0,
+                "freed": 0
+            }
+        batch = list(islice(self._sweep, self.sweep_batch))
+        if batch:
+            self._reconcile(batch)
+        if len(batch) < self.sweep_batch:
+            self._finish_pass()
+
+    def _finish_pass(self):
+        stats = self.current_pass
+        stats["finished_at"] = time.time()
+        stats["duration"] = round(stats["finished_at"] - stats["started_at"], 3)
+        stats["usage"] = sum(stats["bytes"].values()) - stats["freed"]
+        self.last_pass = stats
+        self.current_pass = None
+        self._sweep = None
+        self._next_pass_at = time.time() + STORAGE_SWEEP_INTERVAL
+        # 占用已重新统计，低空间淘汰可以重新判断
+        self._evicted_bytes = 0
+        self._free_space_paused = None
+        logger.info(f"🧹 巡检完成: {stats['scanned']} 项, 占用 {stats['usage'] / 1024 / 1024:.1f} MB, "
+                    f"清理孤儿 {stats['orphans']} 个 ({stats['freed'] / 1024 / 1024:.1f} MB), 用时 {stats['duration']}s")
+        self._enforce_quota(stats["usage"])
+
+    @staticmethod
+    def _owners(kind: str, entry: os.DirEntry) -> List[str]:
+        """这些路径中任意一个被记录引用，该目录项就不是孤儿"""
+        if kind == "gallery":
+            return [os.path.join(RESULT_DIR, f"{entry.name}.mp4")]
+        owners = [entry.path]
+        if kind == "result":
+            for pattern in _DERIVED_PATTERNS:
+                match = pattern.match(entry.name)
+                if match:
+                    owners.append(os.path.join(RESULT_DIR, f"{match.group(1)}.mp4"))
+        return owners
+
+    def _remove_orphan(self, path: str):
+        # 占住后复查：核对引用之后文件可能刚被新的上传复用（复用会 pin 住并刷新修改时间）
+        with blob_store.deleting([path]) as claimed:
+            if not claimed:
+                return
+            try:
+                recent = time.time() - os.stat(path).st_mtime < ORPHAN_GRACE_SECONDS
+            except OSError:
+                return
+            if recent:
+                return
+            size = _remove_path(path)
+        if size is not None:
+            self.current_pass["orphans"] += 1
+            self.current_pass["freed"] += size
+
+    def _expire_upload_session(self, path: str, now: float):
+        """
+        分块上传会话不写数据库，<id>.json 只在创建时写入、<id>.part 每个分块都会更新，
+        两者作为一个整体按最后一次写入的时间过期，一起删除
+        """
+        stem = os.path.splitext(path)[0]
+        session = [f"{stem}.json", f"{stem}.part"]
+        mtimes = []
+        for member in session:
+            try:
+                mtimes.append(os.stat(member).st_mtime)
+            except OSError:
+                pass
+        if not mtimes or now - max(mtimes) <= UPLOAD_SESSION_TTL:
+            return
+        for member in session:
+            size = _remove_path(member)
+            if size is not None:
+                self.current_pass["orphans"] += 1
+                self.current_pass["freed"] += size
+
+    def _reconcile(self, batch: List[Tuple[str, os.DirEntry]]):
+        stats = self.current_pass
+        now = time.time()
+        candidates: Dict[str, List[str]] = {}
+        for kind, entry in batch:
+            stats["scanned"] += 1
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if is_dir and kind != "gallery":
+                    continue
+                mtime = entry.stat(follow_symlinks=False).st_mtime
+                size = _path_size(entry.path) if is_dir else entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+            stats["bytes"][kind] += size
+            age = now - mtime
+
+            if kind == "partial":
+                if self._deletion_safe:
+                    self._expire_upload_session(entry.path, now)
+                continue
+            if age < ORPHAN_GRACE_SECONDS:
+                continue
+            if entry.name.endswith("_temp.mp4"):
+                # 转码前的临时文件，超过宽限期说明任务已失败
+                if self._deletion_safe:
+                    self._remove_orphan(entry.path)
+                continue
+            candidates[entry.path] = self._owners(kind, entry)
+
+        if not candidates or not self._deletion_safe:
+            return
+        with engine.connect() as conn:
+            referenced = _referenced(conn, [p for owners in candidates.values() for p in owners])
+        for path, owners in candidates.items():
+            if not any(owner in referenced for owner in owners):
+                self._remove_orphan(path)
+
+
+storage_lifecycle = StorageLifecycle()
@@ -0,0 +1,48 @@
+"""
+测试环境：目录和 SQLite 数据库放到临时目录，检测模型换成 bench.detector.TinyDetector
+
+应用模块在导入时读取 config 中的目录，conftest 最先被导入，在这里重定向，测试模块之后再导入应用模块
+在 back 目录下运行：python -m pytest -q
+"""
+import os
+import sys
+import shutil
+import itertools
+import tempfile
+import pytest
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACK_DIR not in sys.path:
+    sys.path.insert(0, BACK_DIR)
+
+from bench import detector, workspace
+
+ROOT = tempfile.mkdtemp(prefix="detect-test-")
+workspace.redirect(ROOT)
+detector.install()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(ROOT, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """启动时建表；后台存储维护在 redirect 中已关闭，巡检由测试直接驱动"""
+    from fastapi.testclient import TestClient
+    from main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+_seeds = itertools.count(1)
+
+
+@pytest.fixture
+def image_bytes():
+    """每次调用生成一张内容不同的合成图片（JPEG 字节），内容寻址的文件不会在测试之间共用"""
+    from bench import synthetic
+
+    def make() -> bytes:
+        return synthetic.encode_image(synthetic.make_image(320, 240, seed=next(_seeds)))
+    return make
@@ -0,0 +1,66 @@
+"""
+分析配置校验（字段类型不对时抛出 ValueError，接口返回 400 而不是 500）和实时分析的内存上限
+"""
+import pytest
+from analytics import AnalyticsEngine, parse_analytics_config
+
+
+def test_valid_config_normalized():
+    parsed = parse_analytics_config(
+        '{"lines": [{"points": [[0, 0], [10, 5.5]], "classes": ["car"]}],'
+        ' "zones": [{"name": "door", "polygon": [[0, 0], [1, 0], [1, 1]]}], "window_seconds": 30}'
+    )
+    assert parsed["lines"] == [{"name": "line_1", "points": [[0.0, 0.0], [10.0, 5.5]], "classes": ["car"]}]
+    assert parsed["zones"][0]["name"] == "door" and parsed["zones"][0]["classes"] == []
+    assert parsed["window_seconds"] == 30.0 and parsed["track_timeout"] == 2.0
+    assert parse_analytics_config("") is None
+
+
+@pytest.mark.parametrize("config", [
+    {"lines": [1]},
+    {"lines": {"points": [[0, 0], [1, 1]]}},
+    {"lines": [{"points": [1, 2]}]},
+    {"lines": [{"points": "ab"}]},
+    {"lines": [{"points": [[0, 0], [1, "x"]]}]},
+    {"lines": [{"points": [[0, 0], [1, 1], [2, 2]]}]},
+    {"lines": [{"points": [[0, 0], [1, 1]], "classes": "car"}]},
+    {"zones": ["area"]},
+    {"zones": [{"polygon": [[0, 0], [1, 0], None]}]},
+    {"zones": [{"polygon": 3}]},
+    {"window_seconds": "abc"},
+    {"window_seconds": [60]},
+    {"track_timeout": 0},
+    {"anchor": ["bottom"]},
+    [1, 2],
+])
+def test_invalid_config_raises_value_error(config):
+    with pytest.raises(ValueError):
+        parse_analytics_config(config)
+
+
+def test_detect_video_rejects_malformed_analytics(client):
+    response = client.post("/api/detect/video", params={"analytics": '{"lines": [1]}'},
+                           files={"file": ("clip.mp4", b"\0" * 16, "video/mp4")})
+    assert response.status_code == 400
+
+
+def test_live_engine_state_stays_bounded():
+    config = parse_analytics_config({"lines": [{"points": [[50, 0], [50, 100]]}],
+                                     "zones": [{"polygon": [[0, 0], [40, 0], [40, 100], [0, 100]]}],
+                                     "window_seconds": 1, "track_timeout": 0.5})
+    engine = AnalyticsEngine(config, max_events=50, max_windows=10)
+    # 10 fps 跑 2 小时：每 2 秒换一批新目标，从区域里穿过虚拟线
+    for frame in range(72000):
+        timestamp = frame / 10
+        base = frame // 20 * 3
+        x = frame % 20 * 5
+        engine.update(timestamp, [{"id": base + i, "class": "person", "bbox": [x, 10 * i, x + 5, 10 * i + 20]}
+                                  for i in range(3)])
+        if frame % 1000 == 0:
+            assert len(engine.tracks) <= 6
+    snapshot = engine.snapshot()
+    assert snapshot["class_totals"] == {"person": 72000 // 20 * 3}
+    line = snapshot["lines"][0]
+    assert line["in"] + line["out"] == 72000 // 20 * 3 and snapshot["zones"][0]["visits"] == 72000 // 20 * 3
+    assert len(snapshot["windows"]) == 10 and len(snapshot["events"]) == 50
+    assert all(len(ids) <= 6 for ids in engine._window_ids.values())
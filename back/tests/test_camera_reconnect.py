@@ -0,0 +1,63 @@
+"""
+摄像头源失效时的重连退避：打开后读不到帧也要等待，不会空转
+"""
+import time
+import numpy as np
+import camera_manager
+from camera_manager import CameraSource
+
+
+class _Capture:
+    """能打开、按 frames 给出的结果逐次读取的替身 VideoCapture"""
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        if self.frames:
+            return True, self.frames.pop(0)
+        return False, None
+
+    def set(self, *args):
+        return True
+
+    def get(self, *args):
+        return 0
+
+    def release(self):
+        pass
+
+
+def _run(monkeypatch, captures, seconds: float) -> list:
+    monkeypatch.setattr(camera_manager, "RECONNECT_MIN_DELAY", 0.05)
+    monkeypatch.setattr(camera_manager, "RECONNECT_MAX_DELAY", 0.2)
+    source = CameraSource("reconnect", "rtsp://cam.local/live")
+    opened = []
+
+    def open_capture():
+        opened.append(time.monotonic())
+        return captures()
+
+    monkeypatch.setattr(source, "_open", open_capture)
+    source.start()
+    time.sleep(seconds)
+    source.stop()
+    return opened
+
+
+def test_dead_stream_backs_off(monkeypatch):
+    opened = _run(monkeypatch, lambda: _Capture([]), 1.0)
+    # 0.05 + 0.1 + 0.2 + 0.2 + ...：1 秒内只重连几次，间隔不超过上限
+    assert 3 <= len(opened) <= 8
+    gaps = [b - a for a, b in zip(opened, opened[1:])]
+    assert all(gap >= 0.04 for gap in gaps) and gaps[-1] < 0.4
+
+
+def test_backoff_resets_after_a_frame(monkeypatch):
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    opened = _run(monkeypatch, lambda: _Capture([frame]), 1.0)
+    # 每次都读到一帧，等待时间一直从最小值开始
+    assert len(opened) >= 10
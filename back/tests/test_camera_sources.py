@@ -0,0 +1,53 @@
+"""
+/camera/register 的摄像头源白名单
+"""
+import os
+import pytest
+import camera_manager
+from camera_manager import check_source_allowed
+
+
+@pytest.fixture
+def allowlist(tmp_path, monkeypatch):
+    monkeypatch.setattr(camera_manager, "CAMERA_ALLOWED_DEVICES", ["0"])
+    monkeypatch.setattr(camera_manager, "CAMERA_ALLOWED_SCHEMES", ["rtsp"])
+    monkeypatch.setattr(camera_manager, "CAMERA_ALLOWED_HOSTS", ["cam.local", "192.168.1.*"])
+    monkeypatch.setattr(camera_manager, "CAMERA_FILE_DIR", str(tmp_path / "sources"))
+    os.makedirs(tmp_path / "sources")
+    return tmp_path
+
+
+@pytest.mark.parametrize("source", ["0", "/dev/video0", "rtsp://cam.local/live", "rtsp://user:pw@192.168.1.20:554/s"])
+def test_allowed_sources(allowlist, source):
+    check_source_allowed(source)
+
+
+@pytest.mark.parametrize("source", ["1", "/dev/video3", "http://cam.local/live", "rtsp://10.0.0.1/live",
+                                    "rtsp://cam.local.evil.com/live", "rtsp:///live"])
+def test_rejected_sources(allowlist, source):
+    with pytest.raises(PermissionError):
+        check_source_allowed(source)
+
+
+def test_local_files_only_from_source_dir(allowlist):
+    inside = allowlist / "sources" / "loop.mp4"
+    outside = allowlist / "loop.mp4"
+    for path in (inside, outside):
+        path.write_bytes(b"\0")
+    check_source_allowed(str(inside))
+    with pytest.raises(PermissionError):
+        check_source_allowed(str(outside))
+    # 符号链接按实际位置判断
+    link = allowlist / "sources" / "link.mp4"
+    link.symlink_to(outside)
+    with pytest.raises(PermissionError):
+        check_source_allowed(str(link))
+    with pytest.raises(PermissionError):
+        check_source_allowed(str(allowlist / "sources" / ".." / "loop.mp4"))
+
+
+def test_register_rejects_source_outside_allowlist(client, allowlist):
+    response = client.post("/api/camera/register", params={"cam_id": "blocked", "source": "/etc/hostname"})
+    assert response.status_code in (400, 403)
+    response = client.post("/api/camera/register", params={"cam_id": "blocked", "source": "rtsp://10.0.0.1/x"})
+    assert response.status_code == 403
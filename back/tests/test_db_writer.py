@@ -0,0 +1,45 @@
+"""
+不支持 RETURNING 的数据库（MySQL）走的逐条插入和先查后删：在 SQLite 上关掉方言的 RETURNING 能力来验证
+"""
+import json
+from concurrent.futures import Future
+import pytest
+from sqlalchemy import select
+from db import engine
+from db_writer import RecordWriter, _WriteOp
+from models import DetectRecord, Detection
+from storage_lifecycle import delete_records
+
+
+@pytest.fixture
+def without_returning(client, monkeypatch):
+    monkeypatch.setattr(engine.dialect, "insert_executemany_returning_sort_by_parameter_order", False)
+    monkeypatch.setattr(engine.dialect, "delete_returning", False)
+
+
+def _objects(count: int) -> str:
+    return json.dumps([{"class": "vehicle", "confidence": 0.9, "bbox": [0, 0, 10, 10]}] * count)
+
+
+def test_batch_insert_and_delete_without_returning(without_returning):
+    # 直接提交一整批，不经过后台线程，保证 5 条插入在同一个事务里
+    batch = [_WriteOp("insert", None, {"type": "image", "filename": f"mysql_{i}.jpg", "objects": _objects(i + 1)},
+                      Future()) for i in range(5)]
+    RecordWriter(bind=engine)._write(batch)
+    ids = [op.future.result(timeout=0) for op in batch]
+
+    assert len(set(ids)) == 5
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(DetectRecord.id, DetectRecord.filename, DetectRecord.detect_time).where(DetectRecord.id.in_(ids))
+        ).all()
+        indexed = conn.execute(select(Detection.record_id).where(Detection.record_id.in_(ids))).scalars().all()
+    # 每个 Future 拿到的是自己那一行的 id，检测表按各自的 id 写入
+    assert {row.id: row.filename for row in rows} == {record_id: f"mysql_{i}.jpg" for i, record_id in enumerate(ids)}
+    assert all(row.detect_time is not None for row in rows)
+    assert sorted(indexed) == sorted(record_id for i, record_id in enumerate(ids) for _ in range(i + 1))
+
+    assert delete_records(ids)["records"] == 5
+    assert delete_records(ids)["records"] == 0
+    with engine.connect() as conn:
+        assert not conn.execute(select(Detection.id).where(Detection.record_id.in_(ids))).all()
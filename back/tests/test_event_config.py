@@ -0,0 +1,33 @@
+"""
+事件录像配置校验：字段类型不对时抛出 ValueError，/camera/{cam_id}/events 返回 400 而不是 500
+"""
+import pytest
+from event_recorder import parse_event_config
+
+
+def test_valid_config_normalized():
+    parsed = parse_event_config('{"rules": [{"classes": ["person"], "min_conf": 0.5,'
+                                ' "zone": [[0, 0], [10, 0], [10, 10]]}], "pre_roll": 0}')
+    assert parsed["rules"] == [{"name": "rule_1", "classes": ["person"], "min_conf": 0.5,
+                                "zone": [[0.0, 0.0], [10.0, 0.0], [10.0, 10.0]]}]
+    assert parsed["pre_roll"] == 0.0 and parsed["post_roll"] == 5.0
+    assert parse_event_config({"rules": [{}]})["rules"][0]["zone"] is None
+
+
+@pytest.mark.parametrize("config", [
+    {"rules": [1]},
+    {"rules": "abc"},
+    {"rules": []},
+    {"rules": [{"zone": [1, 2, 3]}]},
+    {"rules": [{"zone": [[0, 0], [1, 1]]}]},
+    {"rules": [{"zone": "abc"}]},
+    {"rules": [{"classes": "person"}]},
+    {"rules": [{"classes": [1]}]},
+    {"rules": [{"min_conf": "high"}]},
+    {"rules": [{"min_conf": 2}]},
+    {"rules": [{}], "pre_roll": [5]},
+    {"rules": [{}], "buffer_mb": 0},
+])
+def test_invalid_config_raises_value_error(config):
+    with pytest.raises(ValueError):
+        parse_event_config(config)
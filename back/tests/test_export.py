@@ -0,0 +1,34 @@
+"""
+COCO 导出：图片和抓拍记录的 images 条目带原图宽高
+"""
+import json
+from sqlalchemy import select, update
+from db import engine
+from models import DetectRecord
+from storage_lifecycle import delete_records
+
+
+def _coco(client):
+    response = client.get("/api/export/records", params={"format": "coco"})
+    assert response.status_code == 200
+    return {image["record_id"]: image for image in json.loads(response.content)["images"]}
+
+
+def test_coco_images_have_size(client, image_bytes):
+    image = client.post("/api/detect/image", files={"file": ("sample.jpg", image_bytes(), "image/jpeg")})
+    frame = client.post("/api/camera/frame", files={"file": ("frame.jpg", image_bytes(), "image/jpeg")})
+    assert image.status_code == 200 and frame.status_code == 200
+    ids = [image.json()["id"], frame.json()["id"]]
+    try:
+        # 加列之前的旧记录没有宽高，从原图读取
+        with engine.begin() as conn:
+            conn.execute(update(DetectRecord).where(DetectRecord.id == ids[1]).values(width=None, height=None))
+        images = _coco(client)
+        for record_id in ids:
+            assert (images[record_id]["width"], images[record_id]["height"]) == (320, 240)
+        with engine.connect() as conn:
+            stored = conn.execute(select(DetectRecord.width, DetectRecord.height)
+                                  .where(DetectRecord.id == ids[0])).one()
+        assert tuple(stored) == (320, 240)
+    finally:
+        delete_records(ids)
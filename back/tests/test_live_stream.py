@@ -0,0 +1,48 @@
+"""
+FrameBroadcaster.stop() 唤醒正在等待下一帧的订阅者，订阅随之结束；之后的新订阅照常工作
+"""
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+import numpy as np
+from live_stream import FrameBroadcaster
+
+
+class _StalledCamera:
+    """只出一帧，之后再也没有新帧（源卡住）"""
+
+    def __init__(self):
+        self.cam_id = "stalled"
+        self.frames = self
+        self.snapshot = SimpleNamespace(detections=[])
+
+    def wait_newer(self, last_seq: int, timeout: float = None):
+        if last_seq == 0:
+            return np.zeros((8, 8, 3), dtype=np.uint8), 1, time.time()
+        time.sleep(timeout or 0)
+        return None
+
+
+async def _first_then_end(broadcaster: FrameBroadcaster, stop_after: float) -> int:
+    received = 0
+    stopper = threading.Timer(stop_after, broadcaster.stop)
+    async for _ in broadcaster.subscribe():
+        received += 1
+        if received == 1:
+            stopper.start()
+    return received
+
+
+def test_stop_ends_waiting_subscribers():
+    broadcaster = FrameBroadcaster(_StalledCamera())
+
+    async def main():
+        return await asyncio.wait_for(_first_then_end(broadcaster, 0.2), timeout=5)
+
+    assert asyncio.run(main()) == 1
+    assert broadcaster.subscribers == 0
+
+    # 停止后重新订阅（摄像头重新启动）不受影响：先拿到上次的最新帧，再拿到重新渲染的帧
+    assert asyncio.run(main()) >= 1
+    assert broadcaster.subscribers == 0
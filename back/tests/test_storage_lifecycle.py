@@ -0,0 +1,244 @@
+"""
+删除记录时的引用计数、共用文件的保留规则、pin、孤儿巡检的宽限期、保留文件、分块上传会话过期和低空间淘汰
+"""
+import os
+import time
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import select
+import blob_store
+import storage_lifecycle as lifecycle_module
+from config import UPLOAD_DIR, PARTIAL_UPLOAD_DIR
+from db import engine
+from models import DetectRecord
+from storage_lifecycle import StorageLifecycle, delete_records
+
+OLD = time.time() - 7 * 24 * 3600
+
+
+@pytest.fixture(autouse=True)
+def _clean_records(client):
+    """每个测试结束后删掉所有记录，淘汰顺序等不受其它测试影响"""
+    yield
+    with engine.connect() as conn:
+        ids = conn.execute(select(DetectRecord.id)).scalars().all()
+    delete_records(ids)
+
+
+def _upload(client, data: bytes, conf: float = 0.25) -> int:
+    response = client.post("/api/detect/image", params={"conf": conf},
+                           files={"file": ("sample.jpg", data, "image/jpeg")})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def _paths(record_id: int):
+    with engine.connect() as conn:
+        return conn.execute(
+            select(DetectRecord.source_path, DetectRecord.result_path, DetectRecord.thumbnail_path)
+            .where(DetectRecord.id == record_id)
+        ).one()
+
+
+def _sweep(monkeypatch, grace: float = 0) -> dict:
+    """同步跑完一轮巡检"""
+    monkeypatch.setattr(lifecycle_module, "ORPHAN_GRACE_SECONDS", grace)
+    lifecycle = StorageLifecycle(enabled=False, sweep_batch=10 ** 6)
+    lifecycle._sweep_slice()
+    assert lifecycle.current_pass is None
+    return lifecycle.last_pass
+
+
+def _orphan(directory: str, name: str, mtime: float = None) -> str:
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * 1024)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+# ---------- 引用计数 ----------
+
+def test_shared_source_removed_with_last_record(client, image_bytes):
+    data = image_bytes()
+    first, second = _upload(client, data, conf=0.25), _upload(client, data, conf=0.5)
+    source, first_result, _ = _paths(first)
+    same_source, second_result, _ = _paths(second)
+    assert source == same_source and first_result != second_result
+
+    done = delete_records([first])
+    assert done["records"] == 1
+    assert not os.path.exists(first_result)
+    assert os.path.exists(source) and os.path.exists(second_result)
+
+    delete_records([second])
+    assert not os.path.exists(source) and not os.path.exists(second_result)
+
+
+def test_identical_uploads_share_source_and_result(client, image_bytes):
+    data = image_bytes()
+    first, second = _upload(client, data), _upload(client, data)
+    source, result, _ = _paths(first)
+    assert _paths(second)[:2] == (source, result)
+
+    delete_records([first])
+    assert os.path.exists(source) and os.path.exists(result)
+
+    delete_records([second])
+    assert not os.path.exists(source) and not os.path.exists(result)
+
+
+def test_delete_is_counted_once(client, image_bytes):
+    record_id = _upload(client, image_bytes())
+    assert delete_records([record_id])["records"] == 1
+    assert delete_records([record_id]) == {"records": 0, "files": 0, "bytes": 0, "paths": []}
+
+
+# ---------- pin ----------
+
+def test_pinned_blob_survives_delete_and_sweep(client, image_bytes, monkeypatch):
+    record_id = _upload(client, image_bytes())
+    source, result, _ = _paths(record_id)
+    # 模拟并发的上传正在复用这个文件、记录还没落库
+    assert blob_store.reuse(source)
+    try:
+        delete_records([record_id])
+        assert os.path.exists(source) and not os.path.exists(result)
+        _sweep(monkeypatch)
+        assert os.path.exists(source)
+    finally:
+        blob_store.release(source)
+
+    _sweep(monkeypatch)
+    assert not os.path.exists(source)
+
+
+def test_blob_lock_not_held_while_deleting(client, image_bytes, monkeypatch):
+    record_id = _upload(client, image_bytes())
+    removed = []
+    remove_path = lifecycle_module._remove_path
+
+    def checked(path):
+        # 删除文件时上传仍能登记 pin；复用正在删除的路径会失败而不是拿到马上消失的文件
+        assert not blob_store.lock.locked()
+        assert not blob_store.reuse(path)
+        removed.append(path)
+        return remove_path(path)
+
+    monkeypatch.setattr(lifecycle_module, "_remove_path", checked)
+    delete_records([record_id])
+    assert removed and all(not os.path.exists(p) for p in removed)
+
+
+def test_existing_blob_never_overwritten(tmp_path):
+    first = blob_store.put_bytes(str(tmp_path), "a" * 64, b"original", ".jpg")
+    second = blob_store.put_bytes(str(tmp_path), "a" * 64, b"different length", ".jpg")
+    blob_store.release(first.path, second.path)
+    assert not first.existed and second.existed and first.path == second.path
+    with open(first.path, "rb") as f:
+        assert f.read() == b"original"
+    assert os.listdir(tmp_path / blob_store.INCOMING_DIR) == []
+
+
+# ---------- 孤儿巡检 ----------
+
+def test_orphan_removed_only_after_grace_period(client, monkeypatch):
+    fresh = _orphan(UPLOAD_DIR, "fresh_orphan.jpg")
+    stale = _orphan(UPLOAD_DIR, "stale_orphan.jpg", mtime=OLD)
+
+    stats = _sweep(monkeypatch, grace=3600)
+    assert os.path.exists(fresh) and not os.path.exists(stale)
+    assert stats["orphans"] >= 1
+    os.remove(fresh)
+
+
+def test_referenced_files_are_not_orphans(client, image_bytes, monkeypatch):
+    record_id = _upload(client, image_bytes())
+    paths = _paths(record_id)
+    for path in paths:
+        os.utime(path, (OLD, OLD))
+    _sweep(monkeypatch)
+    assert all(os.path.exists(p) for p in paths)
+
+
+def test_files_kept_on_delete_are_not_orphans(client, image_bytes, monkeypatch):
+    record_id = _upload(client, image_bytes())
+    source, result, thumbnail = _paths(record_id)
+
+    response = client.delete(f"/api/records/{record_id}", params={"delete_files": False})
+    assert response.status_code == 200 and response.json()["deleted_files"] == []
+    _sweep(monkeypatch)
+    assert os.path.exists(source) and os.path.exists(result)
+    # 缩略图只是缓存，不在保留之列
+    assert not os.path.exists(thumbnail)
+
+    # 之后复用同一文件的记录被删除时，保留的文件也不会被删
+    with open(source, "rb") as f:
+        data = f.read()
+    again = _upload(client, data)
+    assert _paths(again)[0] == source
+    delete_records([again])
+    assert os.path.exists(source)
+
+
+# ---------- 分块上传会话 ----------
+
+def _session(upload_id: str, meta_mtime: float, part_mtime: float):
+    meta = _orphan(PARTIAL_UPLOAD_DIR, f"{upload_id}.json", mtime=meta_mtime)
+    part = _orphan(PARTIAL_UPLOAD_DIR, f"{upload_id}.part", mtime=part_mtime)
+    return meta, part
+
+
+def test_active_upload_session_is_kept_whole(client, monkeypatch):
+    # 元数据只在创建时写入，分块还在持续写入时整个会话都不过期
+    meta, part = _session("a" * 32, meta_mtime=OLD, part_mtime=time.time())
+    _sweep(monkeypatch)
+    assert os.path.exists(meta) and os.path.exists(part)
+    os.remove(meta)
+    os.remove(part)
+
+
+def test_stale_upload_session_expires_as_unit(client, monkeypatch):
+    meta, part = _session("b" * 32, meta_mtime=OLD, part_mtime=OLD)
+    _sweep(monkeypatch)
+    assert not os.path.exists(meta) and not os.path.exists(part)
+
+
+# ---------- 低空间淘汰 ----------
+
+def test_free_space_eviction_pauses_when_nothing_is_freed(client, image_bytes, monkeypatch):
+    data = image_bytes()
+    records = [_upload(client, data) for _ in range(3)]
+    # 文件都已不在了：淘汰记录释放不出空间
+    for record_id in records:
+        for path in _paths(record_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    lifecycle = StorageLifecycle(enabled=False)
+    lifecycle.last_pass = {"usage": 100 * lifecycle_module.GB}
+    monkeypatch.setattr(lifecycle_module, "STORAGE_MIN_FREE_GB", 10)
+    monkeypatch.setattr(lifecycle_module.shutil, "disk_usage",
+                        lambda path: SimpleNamespace(total=100 * lifecycle_module.GB, free=0))
+    monkeypatch.setattr(lifecycle_module, "EVICT_BATCH", 1)
+
+    lifecycle._check_free_space()
+    assert lifecycle.status()["free_space_paused"]
+    assert lifecycle.evicted == 1
+    # 暂停期间不再淘汰，记录不会被删光
+    lifecycle._check_free_space()
+    assert lifecycle.evicted == 1
+    with engine.connect() as conn:
+        assert conn.execute(select(DetectRecord.id)).scalars().all() == records[1:]
+
+
+def test_free_space_eviction_pauses_when_shortfall_is_unmanaged(client, monkeypatch):
+    lifecycle = StorageLifecycle(enabled=False)
+    lifecycle.last_pass = {"usage": lifecycle_module.GB}
+    monkeypatch.setattr(lifecycle_module, "STORAGE_MIN_FREE_GB", 10)
+    monkeypatch.setattr(lifecycle_module.shutil, "disk_usage",
+                        lambda path: SimpleNamespace(total=100 * lifecycle_module.GB, free=0))
+    lifecycle._check_free_space()
+    assert lifecycle.status()["free_space_paused"]
+    assert lifecycle.evicted == 0
@@ -0,0 +1,58 @@
+"""
+慢请求判定：普通响应按整个请求计时，流式响应只计到第一块发出
+"""
+import time
+import logging
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from tracing import TracingMiddleware
+
+SLOW_MS = 100
+
+
+def _middleware(app: FastAPI) -> TracingMiddleware:
+    middleware = app.middleware_stack
+    while not isinstance(middleware, TracingMiddleware):
+        middleware = middleware.app
+    return middleware
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.state.sampling = []
+
+    @app.get("/slow")
+    def slow():
+        time.sleep(SLOW_MS * 2 / 1000)
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        def chunks():
+            yield b"first"
+            app.state.sampling.append(_middleware(app).sampler._active)
+            # 第一块之后客户端慢慢读，传输时长不算慢请求
+            time.sleep(SLOW_MS * 2 / 1000)
+            yield b"last"
+        return StreamingResponse(chunks(), media_type="application/octet-stream")
+
+    app.add_middleware(TracingMiddleware, slow_ms=SLOW_MS, profile=True)
+    return app
+
+
+def test_slow_request_logged(caplog):
+    with caplog.at_level(logging.WARNING, logger="tracing"):
+        response = TestClient(_app()).get("/slow")
+    assert response.status_code == 200 and "total;dur=" in response.headers["server-timing"]
+    assert any("/slow" in record.getMessage() for record in caplog.records)
+
+
+def test_streaming_response_timed_to_first_chunk(caplog):
+    app = _app()
+    with caplog.at_level(logging.WARNING, logger="tracing"):
+        response = TestClient(app).get("/stream")
+    assert response.content == b"firstlast"
+    assert not any("/stream" in record.getMessage() for record in caplog.records)
+    # 第一块发出后就停止采样，观看画面流不会让采样线程一直运行
+    assert app.state.sampling == [0]
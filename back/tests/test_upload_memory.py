@@ -0,0 +1,22 @@
+"""
+大文件经 /detect/video 和分块续传上传时，进程内存不随文件大小增长
+
+默认上传 256 MB；UPLOAD_MEMORY_TEST_MB=4096 python -m pytest tests/test_upload_memory.py 可以按数 GB 验证
+"""
+import os
+import pytest
+from bench import uploads
+
+SIZE_MB = int(os.getenv("UPLOAD_MEMORY_TEST_MB", "256"))
+# 请求体分块、写盘缓冲和 multipart 解析的开销在几 MB 量级，与文件大小无关
+RSS_LIMIT_MB = 64
+
+
+@pytest.mark.skipif(uploads.current_rss() is None, reason="需要 /proc 读取进程 RSS")
+@pytest.mark.parametrize("flow", sorted(uploads.FLOWS))
+def test_large_upload_peak_rss_is_bounded(flow):
+    size = SIZE_MB * uploads.MB
+    run = uploads.measure(flow, size)
+    assert run["stored_size"] == size
+    assert run["peak_rss_growth"] < RSS_LIMIT_MB * uploads.MB, \
+        f"{flow} 上传 {SIZE_MB} MB 时 RSS 增长了 {run['peak_rss_growth'] / uploads.MB:.0f} MB"
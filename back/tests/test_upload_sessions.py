@@ -0,0 +1,20 @@
+"""
+分块续传会话的锁：并发请求共用同一把锁，放弃的会话不会在进程里留下条目
+"""
+from routers import upload
+
+
+def test_abandoned_session_leaves_no_lock(client):
+    init = client.post("/api/upload/init", params={"filename": "clip.mp4", "total_size": 10})
+    upload_id = init.json()["upload_id"]
+    response = client.put(f"/api/upload/{upload_id}/chunk", params={"offset": 0}, content=b"12345")
+    assert response.status_code == 200 and response.json()["offset"] == 5
+    # 客户端不再继续上传：会话文件由存储巡检按过期清理，锁不需要单独清理
+    assert upload_id not in upload._upload_locks
+
+
+def test_lock_shared_while_held():
+    lock = upload._get_lock("a" * 32)
+    assert upload._get_lock("a" * 32) is lock
+    del lock
+    assert "a" * 32 not in upload._upload_locks
@@ -0,0 +1,218 @@
+"""
+记录列表的缩略图（视频为封面帧）
+
+写入结果时顺手生成：最长边缩到 THUMB_MAX_SIDE，优先编码为 WebP（OpenCV 不支持时用 JPEG），
+按内容摘要存入 THUMB_DIR（见 blob_store），写入后 pin 住，调用方在记录落库后 release。
+列表页每行只加载几 KB 的缩略图，不再为了一个小图加载原尺寸的结果图或视频。
+
+旧记录由 ThumbnailBackfill 在后台从新到旧补齐；无法生成（文件已不存在、无法解码）的记录
+thumbnail_path 记为空字符串，不再重试。
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+import cv2
+import numpy as np
+from sqlalchemy import select, func
+from config import (THUMB_DIR, THUMB_MAX_SIDE, THUMB_QUALITY, THUMB_POSTER_POSITION,
+                    THUMB_BACKFILL_ENABLED, THUMB_BACKFILL_BATCH)
+import blob_store
+from db import engine
+from db_writer import record_writer
+from models import DetectRecord
+
+logger = logging.getLogger(__name__)
+
+THUMB_URL_PREFIX = "/files/thumb"
+IMAGE_TYPES = ("image", "camera")
+
+_webp_supported: Optional[bool] = None
+
+
+# ================== 生成 ==================
+
+def _encode(img: np.ndarray):
+    """缩小并编码，返回 (数据, 扩展名)"""
+    global _webp_supported
+    h, w = img.shape[:2]
+    scale = THUMB_MAX_SIDE / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    if _webp_supported is not False:
+        ok, buffer = cv2.imencode(".webp", img, [cv2.IMWRITE_WEBP_QUALITY, THUMB_QUALITY])
+        _webp_supported = bool(ok)
+        if ok:
+            return buffer.tobytes(), ".webp"
+    ok, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY])
+    if not ok:
+        return None, None
+    return buffer.tobytes(), ".jpg"
+
+
+def from_image(img: Optional[np.ndarray]) -> Optional[str]:
+    """由已解码的图片（BGR）生成缩略图，返回已 pin 住的路径；失败返回 None（缩略图不影响主流程）"""
+    if img is None or img.size == 0:
+        return None
+    try:
+        data, ext = _encode(img)
+        if data is None:
+            return None
+        return blob_store.put_bytes(THUMB_DIR, hashlib.sha256(data).hexdigest(), data, ext).path
+    except Exception as e:
+        logger.warning(f"⚠️ 缩略图生成失败: {e}")
+        return None
+
+
+def poster_index(total_frames: int) -> int:
+    """视频封面所在的帧号：跳过片头，通常是黑屏或还没有目标"""
+    return int(total_frames * THUMB_POSTER_POSITION) if total_frames > 0 else 0
+
+
+def read_poster(video_path: str) -> Optional[np.ndarray]:
+    """读取视频的封面帧；seek 失败时退回第一帧"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return None
+        index = poster_index(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        if index:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ok, frame = cap.read()
+        if not ok and index:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = cap.read()
+        return frame if ok else None
+    finally:
+        cap.release()
+
+
+def create_for_file(record_type: Optional[str], path: Optional[str]) -> Optional[str]:
+    """由记录的结果/原始文件生成缩略图（回填和事件录像使用），返回已 pin 住的路径"""
+    if not path or not os.path.isfile(path):
+        return None
+    if record_type in IMAGE_TYPES:
+        img = cv2.imread(path)
+    else:
+        img = read_poster(path)
+    return from_image(img)
+
+
+def thumbnail_url(path: Optional[str]) -> Optional[str]:
+    """缩略图的访问 URL；只做字符串处理，列表页不访问文件系统"""
+    if not path:
+        return None
+    relative = os.path.relpath(path, THUMB_DIR)
+    if relative.startswith(".."):
+        return None
+    return f"{THUMB_URL_PREFIX}/{relative.replace(os.sep, '/')}"
+
+
+# ================== 历史记录回填 ==================
+
+class ThumbnailBackfill:
+    """
+    后台线程按 id 从大到小为 thumbnail_path 为空的记录生成缩略图，最新的记录最先可见
+    每条记录生成后经 record_writer 写回；进度通过 status() 查看
+    """
+
+    def __init__(self, enabled: bool = THUMB_BACKFILL_ENABLED, batch: int = THUMB_BACKFILL_BATCH):
+        self.enabled = enabled
+        self.batch = batch
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.processed = 0
+        self.generated = 0
+        self.failed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    # ---------- 生命周期 ----------
+
+    def start(self, force: bool = False) -> bool:
+        """启动回填；已在运行时返回 False。force 时忽略 THUMB_BACKFILL_ENABLED（手动触发）"""
+        if not (self.enabled or force):
+            return False
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._stop.clear()
+            self.processed = self.generated = self.failed = 0
+            self.started_at, self.finished_at = time.time(), None
+            self._thread = threading.Thread(target=self._run, name="thumbnail-backfill", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stop.set()
+        thread.join(timeout=timeout)
+        self._thread = None
+
+    def status(self) -> Dict[str, Any]:
+        with engine.connect() as conn:
+            remaining = conn.execute(
+                select(func.count()).select_from(DetectRecord).where(DetectRecord.thumbnail_path.is_(None))
+            ).scalar()
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "remaining": remaining,
+            "processed": self.processed,
+            "generated": self.generated,
+            "failed": self.failed,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+    # ---------- 后台线程 ----------
+
+    def _run(self):
+        before = None
+        try:
+            while not self._stop.is_set():
+                query = select(DetectRecord.id, DetectRecord.type, DetectRecord.source_path,
+                               DetectRecord.result_path).where(DetectRecord.thumbnail_path.is_(None))
+                if before is not None:
+                    query = query.where(DetectRecord.id < before)
+                with engine.connect() as conn:
+                    rows = conn.execute(query.order_by(DetectRecord.id.desc()).limit(self.batch)).all()
+                if not rows:
+                    break
+                for row in rows:
+                    if self._stop.is_set():
+                        return
+                    self._process(row)
+                before = rows[-1].id
+            if not self._stop.is_set():
+                logger.info(f"🖼️ 缩略图回填完成: {self.processed} 条记录, 生成 {self.generated}, 失败 {self.failed}")
+        except Exception as e:
+            logger.error(f"❌ 缩略图回填出错: {e}")
+        finally:
+            self.finished_at = time.time()
+
+    def _process(self, row):
+        path = None
+        try:
+            # 优先用结果文件（带检测框），没有时用原始文件
+            for candidate in (row.result_path, row.source_path):
+                path = create_for_file(row.type, candidate)
+                if path:
+                    break
+            record_writer.submit_update(row.id, thumbnail_path=path or "").result()
+            self.generated += bool(path)
+            self.failed += not path
+        except LookupError:
+            # 记录在回填期间被删除，缩略图成了孤儿，由存储巡检清理
+            pass
+        finally:
+            blob_store.release(path)
+        self.processed += 1
+
+
+thumbnail_backfill = ThumbnailBackfill()
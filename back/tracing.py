@@ -0,0 +1,267 @@
+"""
+单个请求内的阶段耗时（span）、Server-Timing 响应头和慢请求日志
+
+TracingMiddleware 为每个 HTTP 请求创建一个 Trace 放进 contextvar，
+metrics.stage() 计时结束时顺带记到当前 Trace 上，路由不需要额外埋点；
+同一阶段出现多次（如多个文件、逐帧）时累加。同步路由在线程池中执行时 contextvar 会被复制，Trace 是同一个对象。
+
+  - 响应头 Server-Timing: upload_read;dur=12.3, inference;dur=85.0, ..., total;dur=130.2（毫秒，浏览器开发者工具可直接显示）
+  - 路由带 timings=true 时，响应 JSON 里也返回 timings（见 timings()）
+  - 总耗时超过 SLOW_REQUEST_MS 的请求以 JSON 行写入 SLOW_REQUEST_LOG；
+    开启 SLOW_REQUEST_PROFILE 时附带请求期间采样到的调用栈（折叠格式，可直接生成火焰图）
+  - 分多块发送的响应（MJPEG 画面流、导出、大文件下载）只计到第一块发出为止，
+    之后的传输时长取决于客户端，不算慢请求，也不再采样
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Deque, Dict, Optional, Tuple
+from config import SLOW_REQUEST_MS, SLOW_REQUEST_LOG, SLOW_REQUEST_PROFILE, PROFILE_INTERVAL_MS, PROFILE_TOP_STACKS
+
+logger = logging.getLogger(__name__)
+
+# 慢请求单独写一个文件，一行一个 JSON
+slow_logger = logging.getLogger("slow_requests")
+slow_logger.propagate = False
+
+PROFILE_MAX_SAMPLES = 50000
+PROFILE_MAX_DEPTH = 64
+
+
+class Trace:
+    __slots__ = ("start", "spans")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def timings(self) -> Dict[str, float]:
+        """各阶段耗时和截至目前的总耗时（毫秒）"""
+        result = {name: round(seconds * 1000, 2) for name, seconds in self.spans.items()}
+        result["total"] = round(self.elapsed() * 1000, 2)
+        return result
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.timings().items())
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def add(name: str, seconds: float):
+    """把一段耗时记到当前请求上；不在请求中（后台线程）时忽略"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+class span:
+    """只记到当前请求、不进直方图的计时（如等待后台写入线程提交）"""
+    __slots__ = ("name", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add(self.name, time.perf_counter() - self._start)
+        return False
+
+
+def timings() -> Optional[Dict[str, float]]:
+    """当前请求各阶段的耗时（毫秒），供路由放进响应的 timings 字段"""
+    trace = _current.get()
+    return trace.timings() if trace is not None else None
+
+
+class background_trace:
+    """
+    后台任务（视频检测、片段导出）单独计时：with background_trace() as trace: ...
+    期间的 metrics.stage 记到这个 Trace 上，不会混进已经结束的请求
+    """
+
+    def __enter__(self) -> Trace:
+        self.trace = Trace()
+        self._token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        return False
+
+
+# ================== 采样分析 ==================
+
+# 栈顶在这些模块里的线程处于空闲等待（线程池取任务/队列/事件循环 select），不计入采样
+_IDLE_MODULES = ("threading.py", "selectors.py", "queue.py", "thread.py")
+
+
+def _stack(frame) -> Optional[str]:
+    """折叠格式的调用栈：根在前，分号分隔；空闲线程返回 None"""
+    if os.path.basename(frame.f_code.co_filename) in _IDLE_MODULES:
+        return None
+    parts = []
+    while frame is not None and len(parts) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class StackSampler:
+    """
+    有请求在处理时，后台线程每 interval 秒用 sys._current_frames 采一次所有线程的调用栈，
+    没有请求时阻塞等待、不占 CPU。慢请求结束时取出其起止时间内的样本按调用栈计数。
+    采的是整个进程：并发请求的栈会混在一起，单个慢请求时最准确
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000, max_samples: int = PROFILE_MAX_SAMPLES):
+        self.interval = interval
+        self.samples: Deque[Tuple[float, str]] = deque(maxlen=max_samples)
+        self._active = 0
+        self._busy = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def enter(self):
+        with self._lock:
+            self._active += 1
+            self._busy.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def leave(self):
+        with self._lock:
+            self._active -= 1
+            if self._active <= 0:
+                self._active = 0
+                self._busy.clear()
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            self._busy.wait()
+            now = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = _stack(frame)
+                if stack is not None:
+                    self.samples.append((now, stack))
+            del frame
+            time.sleep(self.interval)
+
+    def collect(self, start: float, end: float, top: int = PROFILE_TOP_STACKS) -> Dict[str, object]:
+        counts: Dict[str, int] = {}
+        for t, stack in list(self.samples):
+            if start <= t <= end:
+                counts[stack] = counts.get(stack, 0) + 1
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": sum(counts.values()),
+            "stacks": [{"stack": stack, "count": count} for stack, count in ranked[:top]]
+        }
+
+
+# ================== 中间件 ==================
+
+def _configure_slow_log():
+    if slow_logger.handlers:
+        return
+    os.makedirs(os.path.dirname(SLOW_REQUEST_LOG), exist_ok=True)
+    handler = RotatingFileHandler(SLOW_REQUEST_LOG, maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    slow_logger.addHandler(handler)
+    slow_logger.setLevel(logging.INFO)
+
+
+class TracingMiddleware:
+    """为每个请求计时各阶段，写 Server-Timing 响应头，慢请求记入日志"""
+
+    def __init__(self, app, slow_ms: float = SLOW_REQUEST_MS, profile: bool = SLOW_REQUEST_PROFILE):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.sampler = StackSampler() if profile and slow_ms > 0 else None
+        if slow_ms > 0:
+            _configure_slow_log()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = Trace()
+        token = _current.set(trace)
+        status = 500
+        finished = None
+        streamed = False
+        sampling = self.sampler is not None
+
+        async def send_with_timing(message):
+            nonlocal status, finished, streamed, sampling
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                # 前端与后端不同源时，浏览器需要这个头才会把 Server-Timing 暴露给开发者工具和 Performance API
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and finished is None:
+                # 单块响应发完即结束；流式响应第一块发出后就不再计时和采样
+                finished = time.perf_counter()
+                streamed = message.get("more_body", False)
+                if streamed and sampling:
+                    sampling = False
+                    self.sampler.leave()
+
+        if sampling:
+            self.sampler.enter()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # 响应发完之后运行的 BackgroundTasks（如视频检测）不算在请求耗时里
+            end = finished or time.perf_counter()
+            if sampling:
+                self.sampler.leave()
+            _current.reset(token)
+            if self.slow_ms > 0 and (end - trace.start) * 1000 >= self.slow_ms:
+                self._log_slow(scope, status, trace, end, streamed)
+
+    def _log_slow(self, scope, status: int, trace: Trace, end: float, streamed: bool = False):
+        total_ms = round((end - trace.start) * 1000, 2)
+        entry: Dict[str, object] = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "status": status,
+            # 流式响应为到第一块发出的耗时
+            "total_ms": total_ms,
+            "streamed": streamed,
+            "spans_ms": {name: round(seconds * 1000, 2) for name, seconds in trace.spans.items()}
+        }
+        if self.sampler is not None:
+            entry["profile"] = self.sampler.collect(trace.start, end)
+        logger.warning(f"🐢 慢请求 {scope.get('method')} {scope.get('path')}: {total_ms} ms "
+                       f"{entry['spans_ms']}")
+        try:
+            slow_logger.info(json.dumps(entry, ensure_ascii=False))
+        except Exception as e:
+            logger.warning(f"⚠️ 慢请求日志写入失败: {e}")
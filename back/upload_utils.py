@@ -0,0 +1,38 @@
+import os
+import hashlib
+import aiofiles
+from fastapi import UploadFile
+from config import UPLOAD_CHUNK_SIZE
+
+
+async def save_upload_file(file: UploadFile, save_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> int:
+    """
+    按固定大小分块把上传文件写入磁盘，内存占用与文件大小无关
+    返回写入的字节数；写入失败时删除不完整的文件
+    """
+    written = 0
+    try:
+        async with aiofiles.open(save_path, "wb") as out_file:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                await out_file.write(chunk)
+                written += len(chunk)
+    except Exception:
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        raise
+    return written
+
+
+def file_sha256(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """分块计算文件的 SHA-256，避免一次性读入整个文件"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -31,17 +31,55 @@ export async function uploadVideo(file, conf = 0.5) {
 
 /**
  * 分页获取记录列表
+ * options.cursor 为上一页返回的 nextCursor，传入时按游标翻页（忽略 page）
+ * options.start / options.end 为检测时间范围（ISO 字符串）
  */
-export async function getRecordsPaged(page = 1, limit = 20, type = null) {
+export async function getRecordsPaged(page = 1, limit = 20, type = null, options = {}) {
   const params = { page, limit };
   if (type) params.type = type;
+  if (options.cursor) params.cursor = options.cursor;
+  if (options.start) params.start = options.start;
+  if (options.end) params.end = options.end;
   const res = await axios.get(`${BASE}/records/list`, { params });
   return {
     total: res.data.total,
     data: res.data.data,
+    hasMore: res.data.has_more,
+    nextCursor: res.data.next_cursor,
   };
 }
 
+/**
+ * 按目标条件检索记录
+ * params: { class, min_conf, max_conf, min_area, max_area, type, start, end, limit, cursor }
+ * scanTruncated 为 true 时本页可能不足 limit 条，继续用 nextCursor 请求
+ */
+export async function searchDetections(params = {}) {
+  const res = await axios.get(`${BASE}/detections/search`, { params });
+  return {
+    data: res.data.data,
+    hasMore: res.data.has_more,
+    scanTruncated: res.data.scan_truncated,
+    nextCursor: res.data.next_cursor,
+  };
+}
+
+/**
+ * 各类别目标数随时间的分布，interval 为 hour 或 day
+ */
+export async function getDetectionHistogram(params = {}) {
+  const res = await axios.get(`${BASE}/detections/histogram`, { params });
+  return res.data;
+}
+
+/**
+ * 各类别的置信度分布（0.1 一档）
+ */
+export async function getConfidenceDistribution(params = {}) {
+  const res = await axios.get(`${BASE}/detections/confidence`, { params });
+  return res.data;
+}
+
 /**
  * 获取单条记录详情
  */
@@ -59,6 +97,51 @@ export async function deleteRecord(id, deleteFiles = false) {
   return res.data;
 }
 
+/**
+ * 后台批量删除记录：按 id 列表，或按类型/时间范围（options: { type, start, end, deleteFiles }）
+ * 返回任务信息，用 getBulkDeleteJob 查询进度
+ */
+export async function bulkDeleteRecords(ids = null, options = {}) {
+  const params = { delete_files: (options.deleteFiles ?? true).toString() };
+  if (options.type) params.type = options.type;
+  if (options.start) params.start = options.start;
+  if (options.end) params.end = options.end;
+  const res = await axios.post(`${BASE}/records/bulk-delete`, { ids }, { params });
+  return res.data;
+}
+
+/**
+ * 查询批量删除任务进度
+ */
+export async function getBulkDeleteJob(jobId) {
+  const res = await axios.get(`${BASE}/records/bulk-delete/${jobId}`);
+  return res.data;
+}
+
+/**
+ * 获取存储状态：保留策略、配额、磁盘空间、巡检进度
+ */
+export async function getStorageStatus() {
+  const res = await axios.get(`${BASE}/storage/status`);
+  return res.data;
+}
+
+/**
+ * 获取缩略图回填进度
+ */
+export async function getThumbnailStatus() {
+  const res = await axios.get(`${BASE}/storage/thumbnails`);
+  return res.data;
+}
+
+/**
+ * 为还没有缩略图的记录生成缩略图（后台执行）
+ */
+export async function startThumbnailBackfill() {
+  const res = await axios.post(`${BASE}/storage/thumbnails/backfill`);
+  return res.data;
+}
+
 // ========== 视频专用控制 API ==========
 
 /**
@@ -94,6 +177,50 @@ export async function getVideoObjects(videoId) {
   return res.data;
 }
 
+/**
+ * 获取视频的越线/区域/类别计数分析结果
+ */
+export async function getVideoAnalytics(videoId, includeEvents = true) {
+  const res = await axios.get(`${BASE}/video/${videoId}/analytics`, {
+    params: { include_events: includeEvents },
+  });
+  return res.data;
+}
+
+/**
+ * 获取视频中每个目标的最佳截图列表
+ */
+export async function getVideoTracks(videoId) {
+  const res = await axios.get(`${BASE}/video/${videoId}/tracks`);
+  return res.data;
+}
+
+/**
+ * 获取视频缩略图雪碧图信息（用于进度条预览）
+ */
+export async function getVideoSprites(videoId) {
+  const res = await axios.get(`${BASE}/video/${videoId}/sprites`);
+  return res.data;
+}
+
+/**
+ * 导出单个目标出现的片段（后台任务），可选跟随目标裁剪
+ */
+export async function exportTrackClip(videoId, displayId, { crop = false, padding = 0.5 } = {}) {
+  const res = await axios.post(`${BASE}/video/${videoId}/tracks/${displayId}/clip`, null, {
+    params: { crop, padding },
+  });
+  return res.data;
+}
+
+/**
+ * 查询片段导出任务状态
+ */
+export async function getClipStatus(clipId) {
+  const res = await axios.get(`${BASE}/video/clip-jobs/${clipId}`);
+  return res.data;
+}
+
 /**
  * 重置视频框显示
  */
@@ -102,18 +229,32 @@ export async function resetVideoBoxes(videoId) {
   return res.data;
 }
 
+/**
+ * 按路径段编码文件的相对路径（内容寻址的文件位于子目录中，如 ab/cd/<摘要>.jpg）
+ */
+function encodePath(path) {
+  return path.split('/').map(encodeURIComponent).join('/');
+}
+
 /**
  * 构造结果视频的直接访问 URL
  */
 export function getVideoResultUrl(filename) {
-  return `${FILE_BASE}/files/result/${encodeURIComponent(filename)}`;
+  return `${FILE_BASE}/files/result/${encodePath(filename)}`;
 }
 
 /**
  * 构造原始视频的直接访问 URL
  */
 export function getVideoSourceUrl(filename) {
-  return `${FILE_BASE}/files/upload/${encodeURIComponent(filename)}`;
+  return `${FILE_BASE}/files/upload/${encodePath(filename)}`;
+}
+
+/**
+ * 记录的缩略图 URL（接口返回的 thumbnail_url 为 /files/thumb/...），没有缩略图时返回空字符串
+ */
+export function getThumbnailUrl(thumbnailUrl) {
+  return thumbnailUrl ? `${FILE_BASE}${thumbnailUrl}` : '';
 }
 
 // ========== 摄像头相关 API ==========
@@ -155,19 +296,41 @@ export async function getCameraList() {
   const res = await axios.get(`${BASE}/camera/list`);
   return res.data;
 }
+
+/**
+ * 实时推理控制器状态（有效频率、滞后、输入尺寸、步长）
+ */
+export async function getLiveController() {
+  const res = await axios.get(`${BASE}/camera/controller`);
+  return res.data;
+}
+
+export async function configureLiveController(params = {}) {
+  const res = await axios.post(`${BASE}/camera/controller`, null, { params });
+  return res.data;
+}
+
+/**
+ * 实时 WebSocket 地址：二进制消息 = 16 字节帧头(<Qd: 帧序号, 采集时间) + 原始 JPEG，
+ * 文本消息 = 检测结果 JSON；mode 可选 both / frames / detections
+ */
+export function getCameraWsUrl(camId = "default", mode = "both", maxFps = 0) {
+  const wsBase = BASE.replace(/^http/, "ws");
+  return `${wsBase}/camera/${encodeURIComponent(camId)}/ws?mode=${mode}&max_fps=${maxFps}`;
+}
 //===========图片相关API=============
 /**
  * 构造图片结果的直接访问URL
  */
 export function getImageResultUrl(filename) {
-  return `${FILE_BASE}/files/result/${encodeURIComponent(filename)}`;
+  return `${FILE_BASE}/files/result/${encodePath(filename)}`;
 }
 
 /**
  * 构造原始图片的直接访问URL
  */
 export function getImageSourceUrl(filename) {
-  return `${FILE_BASE}/files/upload/${encodeURIComponent(filename)}`;
+  return `${FILE_BASE}/files/upload/${encodePath(filename)}`;
 }
 
 // ========== 模型管理 API ==========
@@ -1,18 +1,38 @@
 import { ref } from 'vue'
 
-export function usePagination(fetchFn) {
+/**
+ * fetchFn(page, limit, cursor) 返回 { data, total, nextCursor? }
+ * options.cursor 为 true 时记住每页的 nextCursor：翻到已知游标的页走键集分页，
+ * 跳到没有游标的页（如直接点第 50 页）时退回 page 偏移分页，之后继续按游标翻页
+ */
+export function usePagination(fetchFn, options = {}) {
   const page = ref(1)
   const limit = ref(8)
   const total = ref(0)
   const loading = ref(false)
   const data = ref([])
 
+  // 页码 -> 该页的游标
+  const cursors = new Map()
+
   async function load() {
     loading.value = true
     try {
-      const res = await fetchFn(page.value, limit.value)
+      const cursor = options.cursor ? cursors.get(page.value) : undefined
+      const res = await fetchFn(page.value, limit.value, cursor)
       data.value = res.data || []
       total.value = res.total || 0
+      if (options.cursor) {
+        const next = page.value + 1
+        if (cursors.get(next) !== res.nextCursor) {
+          // 本页内容变了（如刚删除记录），更后面的游标已经错位，丢弃
+          for (const p of [...cursors.keys()]) {
+            if (p > next) cursors.delete(p)
+          }
+        }
+        if (res.nextCursor) cursors.set(next, res.nextCursor)
+        else cursors.delete(next)
+      }
     } finally {
       loading.value = false
     }
@@ -23,6 +43,13 @@ export function usePagination(fetchFn) {
     load()
   }
 
+  // 筛选条件或每页条数变化后游标全部失效，从第一页重新开始
+  function reset() {
+    cursors.clear()
+    page.value = 1
+    return load()
+  }
+
   load()
 
   return {
@@ -32,6 +59,7 @@ export function usePagination(fetchFn) {
     data,
     loading,
     load,
+    reset,
     onPageChange
   }
-}
\ No newline at end of file
+}